@@ -0,0 +1,66 @@
+"""
+Locale negotiation benchmark.
+Measures the per-request cost of choosing page locale from 'Accept-Language' header:
+parsing the header on every request, as the original request parser did, and the memoized 'negotiate_locale',
+over a few hundred distinct header values like real traffic has.
+
+Usage: python bench/accept_language.py [-n REQUESTS] [-d DISTINCT_HEADERS]
+"""
+
+import os
+import sys
+import time
+import random
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.classes import negotiate_locale
+
+
+LOCALES: tuple[str, ...] = ("en", "ru")
+LANGUAGES: tuple[str, ...] = ("en-US", "en-GB", "en", "ru-RU", "ru", "de-DE", "de", "fr-FR", "fr", "uk", "pl", "*")
+
+
+def make_headers(count: int) -> list[str]:
+    """
+    :return: distinct 'Accept-Language' header values, browser style
+    """
+
+    headers = set()
+    while len(headers) < count:
+        languages = random.sample(LANGUAGES, random.randint(1, 4))
+        weighted = [f"{lang};q={1 - (i + 1) / 10:.1f}" for i, lang in enumerate(languages[1:])]
+        headers.add(",".join([languages[0]] + weighted))
+    return list(headers)
+
+
+def measure(negotiate, headers: list[str], requests: int) -> float:
+    """
+    :return: seconds per request
+    """
+
+    start = time.perf_counter()
+    for i in range(requests):
+        negotiate(headers[i % len(headers)], LOCALES)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = ArgumentParser(description="Locale negotiation benchmark")
+    parser.add_argument("-n", "--requests", type=int, default=1_000_000)
+    parser.add_argument("-d", "--distinct", type=int, default=300, help="distinct header values")
+    args = parser.parse_args()
+
+    headers = make_headers(args.distinct)
+    random.shuffle(headers)
+    parsed = measure(negotiate_locale.__wrapped__, headers, args.requests)
+    memoized = measure(negotiate_locale, headers, args.requests)
+    info = negotiate_locale.cache_info()
+
+    print(f"parsed per request: {parsed * 1e6:.3f} us")
+    print(f"memoized:           {memoized * 1e6:.3f} us ({info.hits} hits, {info.misses} misses)")
+
+
+if __name__ == '__main__':
+    main()
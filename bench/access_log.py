@@ -0,0 +1,94 @@
+"""
+Access logging overhead benchmark.
+Measures the cost a request handler pays on the event loop for logging a request: the original
+'LOGGER.debug(request)' through rotating file and stream handlers, and 'AccessLog.record' enabled, sampled
+and disabled. Log files are written to a temporary directory.
+
+Usage: python bench/access_log.py [-n REQUESTS] [-s SAMPLE_RATE]
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import logging.handlers
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.classes import Request
+from source.metrics import Metrics
+from source.access_log import AccessLog
+
+
+PEER: tuple[str, int] = ("127.0.0.1", 50000)
+HEAD: bytes = (
+    b"GET /posts/post-1?page=2 HTTP/1.1\r\nhost: localhost\r\nuser-agent: bench\r\n"
+    b"accept: text/html,application/xhtml+xml\r\naccept-encoding: gzip, br\r\naccept-language: en-US,en;q=0.9\r\n\r\n")
+
+
+def measure(log, requests: int) -> float:
+    """
+    :return: seconds per request
+    """
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        log()
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = ArgumentParser(description="Access logging overhead benchmark")
+    parser.add_argument("-n", "--requests", type=int, default=100_000, help="logged requests")
+    parser.add_argument("-s", "--sample-rate", type=float, default=0.1, help="sample rate of the sampled case")
+    args = parser.parse_args()
+
+    request = Request.parse(HEAD)
+    with tempfile.TemporaryDirectory() as directory:
+        # original setup from 'settings.init', stream handler writes to /dev/null instead of the terminal
+        logger = logging.getLogger("bench")
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        formatter = logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", "%Y-%m-%d %H:%M:%S", "{")
+        with open(os.devnull, "w") as devnull:
+            for handler in (
+                    logging.handlers.RotatingFileHandler(
+                        f"{directory}/server.log", encoding="utf-8", maxBytes=2**20 * 2, backupCount=5),
+                    logging.StreamHandler(devnull)):
+                handler.setFormatter(formatter)
+                logger.addHandler(handler)
+            debug = measure(lambda: logger.debug(request), args.requests)
+            for handler in logger.handlers:
+                handler.close()
+
+        AccessLog.path = f"{directory}/access.log"
+        record = AccessLog.record
+
+        def log():
+            if AccessLog.enabled:
+                record(PEER, request.type, request.path, request.version, 200, 2762, 0.0005)
+
+        results = []
+        for name, enabled, sample_rate in (
+                ("enabled", True, 1), (f"sampled {args.sample_rate:g}", True, args.sample_rate),
+                ("disabled", False, 1)):
+            AccessLog.enabled, AccessLog.sample_rate = enabled, sample_rate
+            results.append((name, measure(log, args.requests)))
+
+        start = time.perf_counter()
+        AccessLog.stop()  # waits for the writer to catch up
+        drained = time.perf_counter() - start
+        with open(AccessLog.path, "rb") as file:
+            lines = file.read().count(b"\n")
+
+    print(f"LOGGER.debug(request): {debug * 1e6:7.3f} us per request")
+    for name, seconds in results:
+        print(f"AccessLog {name + ':':<14} {seconds * 1e6:7.3f} us per request")
+    print(f"writer thread: {lines} lines written, {Metrics.counters.get('access_log_dropped', 0)} records dropped "
+          f"on a full queue, {drained * 1000:.1f} ms to drain after the last record")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+HTTP/2 page load benchmark.
+Fetches a page with many assets, the way browsers do: over HTTP/1.1 using 6 keep-alive connections,
+and over HTTP/2 (h2c, prior knowledge) using a single connection with every request in flight at once.
+Prints median and 90th percentile page load time, plus connections used.
+Localhost has no round trips to save, '-l' puts a proxy that delays traffic in front of the server.
+
+Usage: python bench/h2.py [-n PAGE_LOADS] [-r ASSETS] [-l LATENCY_MS] [-a HOST:PORT]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import statistics
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run import free_port, start_server, stop_server
+from load import read_response
+from source.hpack import Encoder, Decoder
+from source.http2 import PREFACE, FRAME_HEAD, make_frame
+from source.http2 import FRAME_DATA, FRAME_HEADERS, FRAME_RST_STREAM, FRAME_SETTINGS, FRAME_PING, FRAME_GOAWAY
+from source.http2 import FRAME_WINDOW_UPDATE, FLAG_ACK, FLAG_END_STREAM, FLAG_END_HEADERS
+
+
+# paths of a page load, assets are requested repeatedly to make up the count
+PAGE: str = "/"
+ASSETS: tuple[str, ...] = ("/css/styles.css", "/favicon.ico")
+HTTP1_CONNECTIONS: int = 6
+
+
+class H2Client:
+    """
+    Minimal HTTP/2 client, for GET requests
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, authority: str):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.authority: str = authority
+        self.encoder: Encoder = Encoder()
+        self.decoder: Decoder = Decoder()
+        self.next_stream_id: int = 1
+        self.responses: dict[int, list] = dict()  # stream id: [status, received bytes, future]
+        self.task: asyncio.Task | None = None
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> "H2Client":
+        reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer, f"{host}:{port}")
+        writer.write(PREFACE + make_frame(FRAME_SETTINGS, 0, 0))
+        client.task = asyncio.create_task(client.read_loop())
+        return client
+
+    async def read_loop(self):
+        while True:
+            length_type, flags, stream_id = FRAME_HEAD.unpack(await self.reader.readexactly(FRAME_HEAD.size))
+            payload = await self.reader.readexactly(length_type >> 8)
+            frame_type = length_type & 0xff
+            if frame_type == FRAME_SETTINGS and not flags & FLAG_ACK:
+                self.writer.write(make_frame(FRAME_SETTINGS, FLAG_ACK, 0))
+            elif frame_type == FRAME_PING and not flags & FLAG_ACK:
+                self.writer.write(make_frame(FRAME_PING, FLAG_ACK, 0, payload))
+            elif frame_type == FRAME_GOAWAY:
+                raise ConnectionError("GOAWAY")
+            elif frame_type == FRAME_HEADERS:
+                headers = self.decoder.decode(payload)
+                if headers[0][0] == ":status":
+                    self.responses[stream_id][0] = int(headers[0][1])
+            elif frame_type == FRAME_DATA and payload:
+                self.responses[stream_id][1] += len(payload)
+                increment = len(payload).to_bytes(4, "big")
+                self.writer.writelines((
+                    make_frame(FRAME_WINDOW_UPDATE, 0, 0, increment),
+                    make_frame(FRAME_WINDOW_UPDATE, 0, stream_id, increment)))
+            elif frame_type == FRAME_RST_STREAM:
+                self.responses.pop(stream_id)[2].set_exception(ConnectionError("RST_STREAM"))
+            if frame_type in (FRAME_HEADERS, FRAME_DATA) and flags & FLAG_END_STREAM:
+                status, received, future = self.responses.pop(stream_id)
+                future.set_result((status, received))
+
+    async def get(self, path: str) -> tuple[int, int]:
+        """
+        :return: status code, body size
+        """
+
+        stream_id = self.next_stream_id
+        self.next_stream_id += 2
+        future = asyncio.get_running_loop().create_future()
+        self.responses[stream_id] = [0, 0, future]
+        block = self.encoder.encode([
+            (":method", "GET"), (":scheme", "http"), (":authority", self.authority), (":path", path),
+            ("accept-encoding", "gzip, br")])
+        self.writer.write(make_frame(FRAME_HEADERS, FLAG_END_STREAM | FLAG_END_HEADERS, stream_id, block))
+        return await future
+
+    async def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+async def http1_page_load(host: str, port: int, paths: list[str]) -> None:
+    """
+    Loads page over HTTP/1.1, page first, then assets over a pool of connections
+    """
+
+    connections = [await asyncio.open_connection(host, port) for _ in range(HTTP1_CONNECTIONS)]
+
+    async def fetch(reader, writer, path):
+        writer.write(f"GET {path} HTTP/1.1\r\nhost: {host}\r\naccept-encoding: gzip, br\r\n\r\n".encode())
+        status, _, _ = await read_response(reader)
+        assert status == 200, status
+
+    async def worker(reader, writer, queue: list[str]):
+        while queue:
+            await fetch(reader, writer, queue.pop())
+
+    await fetch(*connections[0], paths[0])
+    queue = paths[1:]
+    await asyncio.gather(*(worker(reader, writer, queue) for reader, writer in connections))
+    for _, writer in connections:
+        writer.close()
+
+
+async def http2_page_load(host: str, port: int, paths: list[str]) -> None:
+    """
+    Loads page over HTTP/2, page first, then all assets at once over the same connection
+    """
+
+    client = await H2Client.connect(host, port)
+    status, _ = await client.get(paths[0])
+    assert status == 200, status
+    for status, _ in await asyncio.gather(*(client.get(path) for path in paths[1:])):
+        assert status == 200, status
+    await client.close()
+
+
+async def start_delay_proxy(host: str, port: int, latency: float) -> asyncio.Server:
+    """
+    Starts proxy that delays data in both directions by half of 'latency' seconds
+    :return: proxy server, on a free port
+    """
+
+    async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        while data := await reader.read(2 ** 16):
+            loop.call_later(latency / 2, writer.write, data)
+        loop.call_later(latency / 2, writer.close)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        try:
+            await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer), return_exceptions=True)
+        except asyncio.CancelledError:  # benchmark is over
+            upstream_writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def measure(load, host: str, port: int, paths: list[str], page_loads: int) -> list[float]:
+    """
+    :return: page load times in seconds
+    """
+
+    await load(host, port, paths)  # warm up caches
+    times = []
+    for _ in range(page_loads):
+        start = time.perf_counter()
+        await load(host, port, paths)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+async def run(host: str, port: int, page_loads: int, assets: int, latency: float):
+    paths = [PAGE] + [ASSETS[i % len(ASSETS)] for i in range(assets)]
+    print(f"page load of {len(paths)} requests, {latency * 1e3:.0f} ms round trip")
+    if latency:
+        proxy = await start_delay_proxy(host, port, latency)
+        host, port = proxy.sockets[0].getsockname()[:2]
+    for name, load, connections in (
+            ("HTTP/1.1", http1_page_load, HTTP1_CONNECTIONS),
+            ("HTTP/2", http2_page_load, 1)):
+        times = await measure(load, host, port, paths, page_loads)
+        print(f"{name:<9} median: {statistics.median(times) * 1e3:7.2f} ms   "
+              f"p90: {statistics.quantiles(times, n=10)[-1] * 1e3:7.2f} ms   connections: {connections}")
+
+
+def main():
+    parser = ArgumentParser(description="HTTP/2 page load benchmark")
+    parser.add_argument("-n", "--page-loads", type=int, default=200)
+    parser.add_argument("-r", "--assets", type=int, default=60, help="asset requests per page load")
+    parser.add_argument("-l", "--latency", type=float, default=0, help="simulated round trip time, ms")
+    parser.add_argument("-a", "--address", help="already running server, started on localhost otherwise")
+    args = parser.parse_args()
+
+    if args.address:
+        host, port = args.address.rsplit(":", 1)
+        asyncio.run(run(host, int(port), args.page_loads, args.assets, args.latency / 1e3))
+        return
+
+    port = free_port()
+    process = start_server(port, 1)
+    try:
+        asyncio.run(run("127.0.0.1", port, args.page_loads, args.assets, args.latency / 1e3))
+    finally:
+        stop_server(process)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Asyncio HTTP/1.1 load generator.
+Drives a running server with concurrent clients and reports throughput and latency as JSON.
+
+Usage: python bench/load.py -a 127.0.0.1:8080 [-c CONCURRENCY] [-t SECONDS] [--no-keep-alive] [--tls]
+                            [-p PATH[=WEIGHT] ...]
+"""
+
+import ssl
+import json
+import time
+import random
+import asyncio
+from argparse import ArgumentParser
+
+
+# path: weight; static, localized index and news list / post
+DEFAULT_PATHS: dict[str, float] = {
+    "/": 3,
+    "/css/styles.css": 3,
+    "/favicon.ico": 2,
+    "/news": 1,
+    "/news?post=post-1": 1,
+}
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, int, bool]:
+    """
+    Reads a single response
+    :param reader: server connection
+    :return: status code, number of bytes read, True if the server keeps connection alive
+    """
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head[9:12])
+    headers = dict()
+    for line in head.decode("latin-1").split("\r\n")[1:]:
+        key, _, value = line.partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    received = len(head)
+    keep_alive = headers.get("connection", "").lower() != "close"
+    if "content-length" in headers:
+        received += len(await reader.readexactly(int(headers["content-length"])))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";")[0], 16)
+            received += len(size_line) + len(await reader.readexactly(size + 2))
+            if size == 0:
+                break
+    elif status != 304 and status >= 200:  # body is delimited by connection closing
+        received += len(await reader.read())
+        keep_alive = False
+    return status, received, keep_alive
+
+
+async def run_load(
+        address: tuple[str, int],
+        paths: dict[str, float] | None = None,
+        concurrency: int = 16,
+        duration: float = 10,
+        keep_alive: bool = True,
+        tls: bool = False,
+        headers: dict[str, str] | None = None
+) -> dict:
+    """
+    Runs load against the server
+    :param address: server (host, port)
+    :param paths: path: weight mix of requested paths
+    :param concurrency: number of concurrent clients
+    :param duration: test duration in seconds
+    :param keep_alive: reuse connections between requests
+    :param tls: connect using TLS, server certificate is not verified
+    :param headers: extra request headers
+    :return: results
+    """
+
+    paths = paths or DEFAULT_PATHS
+    population, weights = list(paths.keys()), list(paths.values())
+
+    ctx = None
+    if tls:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+
+    extra_headers = "".join(f"{key}: {value}\r\n" for key, value in (headers or {}).items())
+    connection = "keep-alive" if keep_alive else "close"
+    requests = {
+        path: (f"GET {path} HTTP/1.1\r\n"
+               f"Host: {address[0]}\r\n"
+               f"Connection: {connection}\r\n"
+               f"{extra_headers}\r\n").encode("latin-1")
+        for path in population}
+
+    latencies: list[float] = []
+    statuses: dict[int, int] = dict()
+    received_total = 0
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal received_total, errors
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            path = random.choices(population, weights)[0]
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(*address, ssl=ctx)
+                writer.write(requests[path])
+                status, received, alive = await read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                errors += 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                continue
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            received_total += received
+            if not (keep_alive and alive):
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "bytes_per_sec": round(received_total / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(0.50), 3),
+            "p95": round(percentile(0.95), 3),
+            "p99": round(percentile(0.99), 3)},
+        "statuses": {str(key): value for key, value in sorted(statuses.items())},
+        "concurrency": concurrency,
+        "keep_alive": keep_alive,
+        "tls": tls,
+    }
+
+
+def parse_paths(raw_paths: list[str] | None) -> dict[str, float] | None:
+    """
+    Parses 'path=weight' arguments
+    """
+
+    if not raw_paths:
+        return
+    paths = dict()
+    for raw_path in raw_paths:
+        path, _, weight = raw_path.partition("=")
+        paths[path] = float(weight) if weight else 1
+    return paths
+
+
+def main():
+    parser = ArgumentParser(description="HTTP load generator")
+    parser.add_argument("-a", "--address", required=True, help="server address:port")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-t", "--duration", type=float, default=10, help="seconds")
+    parser.add_argument("-p", "--path", action="append", help="path[=weight], may be repeated")
+    parser.add_argument("--no-keep-alive", action="store_true")
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+
+    host, port = args.address.split(":")
+    results = asyncio.run(run_load(
+        address=(host, int(port)),
+        paths=parse_paths(args.path),
+        concurrency=args.concurrency,
+        duration=args.duration,
+        keep_alive=not args.no_keep_alive,
+        tls=args.tls))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Markdown rendering benchmark.
+Compares current 'parse_md2html' against the original character by character parser on a large post,
+made by repeating the news posts until it reaches the requested size.
+Then renders unclosed spans that made scanning quadratic, at doubling sizes; time should roughly double too.
+
+Usage: python bench/markdown.py [-s SIZE_KIB] [-r ROUNDS]
+"""
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.functions import parse_md2html
+from source.settings import WEB_DIRECTORY
+
+
+class _CharIter:
+    def __init__(self, string: str):
+        self.string: str = string
+        self._count: int = -1
+
+    def next(self) -> str | None:
+        self._count += 1
+        return self.string[self._count] if self._count < len(self.string) else None
+
+    def prev(self) -> str | None:
+        self._count -= 1
+        return self.string[self._count] if self._count > -1 else None
+
+    def is_done(self):
+        if self._count+1 >= len(self.string):
+            return True
+        return False
+
+
+def legacy_parse_md2html(text: str) -> str:
+    """
+    Original parser, walks the text one character at a time
+    """
+
+    out = ""
+    text = text.replace("\r", "").replace("  \n", "\n")
+
+    is_bold = False
+    is_italics = False
+
+    header = 0
+
+    iterator = _CharIter(text)
+    while not iterator.is_done():
+        char = iterator.next()
+        if char == "*":  # bold / italics
+            if iterator.next() == "*":  # bold
+                is_bold = not is_bold
+                if is_bold:
+                    out += "<b>"
+                else:
+                    out += "</b>"
+            else:  # italics
+                iterator.prev()
+                is_italics = not is_italics
+                if is_italics:
+                    out += "<i>"
+                else:
+                    out += "</i>"
+            continue
+        if char == "\n":
+            if header > 0:
+                out += f"</h{header}>"
+                header = 0
+            else:
+                out += "<br>"
+            continue
+        if char == "#":
+            header = 1
+            while (char := iterator.next()) == "#":
+                header += 1
+            if char != " ":  # not '# Text', but `#Text` thing
+                iterator.prev()
+            out += f"<h{header}>"
+            continue
+
+        out += char
+
+    return out
+
+
+def make_post(size: int) -> str:
+    """
+    Makes markdown text of given size out of news posts' bodies
+    """
+
+    posts_path = f"{WEB_DIRECTORY}/pages/news/posts/"
+    bodies = []
+    for filename in sorted(os.listdir(posts_path)):
+        with open(f"{posts_path}{filename}", "r", encoding="utf-8") as file:
+            while len(file.readline()) > 2:  # skip configs section
+                pass
+            bodies.append(file.read().strip("\n"))
+    chunk = "\n\n".join(bodies) + "\n\n"
+    return (chunk * (size // len(chunk) + 1))[:size]
+
+
+# blocks of openers without a valid closing part, and the one closing bracket at the very end
+PATHOLOGICAL: tuple[tuple[str, str], ...] = (
+    ("[a](", ""), ("[a](b ", ""), ("[a]", ""), ("`", ""), ("``", ""), ("[a](", ")"))
+
+
+def measure(parse, text: str, rounds: int) -> float:
+    """
+    Measures average render time in seconds
+    """
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parse(text)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = ArgumentParser(description="markdown rendering benchmark")
+    parser.add_argument("-s", "--size", type=int, default=1024, help="post size in KiB")
+    parser.add_argument("-r", "--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_post(args.size * 1024)
+    legacy = measure(legacy_parse_md2html, text, args.rounds)
+    current = measure(parse_md2html, text, args.rounds)
+    print(f"{args.size} KiB post   legacy: {legacy * 1000:8.2f} ms   current: {current * 1000:8.2f} ms   "
+          f"speedup: {legacy / current:.2f}x")
+
+    for unit, end in PATHOLOGICAL:
+        times = []
+        for size in (8, 16, 32):
+            text = unit * (size * 1024 // len(unit)) + end
+            times.append(f"{size} KiB: {measure(parse_md2html, text, args.rounds) * 1000:7.2f} ms")
+        print(f"{unit + '...' + end!r:<14} " + "   ".join(times))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Metrics recording overhead benchmark.
+Measures the cost 'ClientHandler' pays per request for recording metrics, and the cost of an export.
+
+Usage: python bench/metrics.py [-n REQUESTS] [-r ROUTES]
+"""
+
+import os
+import sys
+import time
+import random
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.metrics import Metrics
+
+
+def main():
+    parser = ArgumentParser(description="Metrics overhead benchmark")
+    parser.add_argument("-n", "--requests", type=int, default=1_000_000, help="recorded requests")
+    parser.add_argument("-r", "--routes", type=int, default=16, help="distinct routes")
+    args = parser.parse_args()
+
+    routes = [f"/route-{i}" for i in range(args.routes)]
+    samples = [(random.choice(routes), random.choice((200, 200, 200, 304, 404)),
+                random.expovariate(1000), random.expovariate(500), random.randrange(100, 100_000))
+               for _ in range(min(args.requests, 100_000))]
+
+    # baseline is the loop with two 'perf_counter' calls the handler makes anyway
+    start = time.perf_counter()
+    for i in range(args.requests):
+        time.perf_counter()
+        time.perf_counter()
+    baseline = time.perf_counter() - start
+
+    record = Metrics.record_request
+    start = time.perf_counter()
+    for i in range(args.requests):
+        route, status, ttfb, duration, sent = samples[i % len(samples)]
+        time.perf_counter()
+        time.perf_counter()
+        record(route, status, ttfb, duration, sent)
+    recorded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    size = len(Metrics.export())
+    export = time.perf_counter() - start
+
+    print(f"record_request: {(recorded - baseline) / args.requests * 1e6:.3f} us per request "
+          f"({args.requests} requests, {args.routes} routes)")
+    print(f"timing baseline: {baseline / args.requests * 1e6:.3f} us per request")
+    print(f"export: {export * 1000:.3f} ms, {size} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+Redirect server benchmark.
+Runs the original stream based redirect handler and current 'TinyServer' protocol in a separate process,
+and counts redirects per second: with a new connection per request, and over keep-alive connections
+with pipelined requests, which the original handler didn't support.
+
+Usage: python bench/redirect.py [-t SECONDS] [-c CONNECTIONS] [-p PIPELINE_DEPTH]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import logging
+import multiprocessing
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.classes import Response
+from source.status import STATUS_CODE_MOVED_PERMANENTLY
+from source.http_to_https import TinyServer
+
+
+REQUEST: bytes = b"GET /news?post=post-1 HTTP/1.1\r\nhost: localhost\r\nuser-agent: bench\r\n\r\n"
+
+
+class LegacyTinyServer(TinyServer):
+    """
+    Original redirect server, a response object per request and a connection per response
+    """
+
+    async def run_coro(self):
+        self.server = await asyncio.start_server(self.client_handle, *self.bind_address)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def client_handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await reader.read(2 ** 15)
+            response = Response(
+                data=f"Moved Permanently. Redirecting to {self.redirect}".encode("ascii"),
+                status=STATUS_CODE_MOVED_PERMANENTLY,
+                headers={"Location": self.redirect})
+            await response.write(writer)
+        finally:
+            writer.close()
+
+
+def serve(server_class: type, port: int):
+    logging.disable(logging.CRITICAL)
+    server_class(("127.0.0.1", port), "https://localhost").run()
+
+
+async def client(port: int, keep_alive: bool, depth: int, deadline: float) -> int:
+    """
+    Sends requests until deadline
+    :return: number of responses
+    """
+
+    responses = 0
+    batch = REQUEST * depth
+    while time.perf_counter() < deadline:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                writer.write(batch if keep_alive else REQUEST)
+                expected = depth if keep_alive else 1
+                received = 0
+                tail = b""
+                while received < expected:
+                    data = await reader.read(2 ** 16)
+                    if not data:
+                        break
+                    data = tail + data
+                    received += data.count(b"\r\n\r\n")
+                    tail = data[-3:]
+                responses += received
+                if not keep_alive or received < expected:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    return responses
+
+
+async def measure(port: int, connections: int, keep_alive: bool, depth: int, duration: float) -> float:
+    """
+    :return: redirects per second
+    """
+
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    counts = await asyncio.gather(*(client(port, keep_alive, depth, deadline) for _ in range(connections)))
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = ArgumentParser(description="redirect server benchmark")
+    parser.add_argument("-t", "--duration", type=float, default=5, help="seconds per case")
+    parser.add_argument("-c", "--connections", type=int, default=16)
+    parser.add_argument("-p", "--pipeline", type=int, default=64, help="pipelined requests per keep-alive batch")
+    args = parser.parse_args()
+
+    for name, server_class, cases in (
+            ("legacy", LegacyTinyServer, ((False, 1),)),
+            ("current", TinyServer, ((False, 1), (True, 1), (True, args.pipeline)))):
+        port = free_port()
+        process = multiprocessing.Process(target=serve, args=(server_class, port), daemon=True)
+        process.start()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        for keep_alive, depth in cases:
+            rate = asyncio.run(measure(port, args.connections, keep_alive, depth, args.duration))
+            mode = f"keep-alive, pipeline {depth}" if keep_alive else "connection per request"
+            print(f"{name:<8} {mode:<26} {rate:>10.0f} redirects/s")
+        process.terminate()
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Request head parsing microbenchmark.
+Compares current 'Request.read' against the original single-read regex parser.
+
+Usage: python bench/request_parser.py [-n ITERATIONS]
+"""
+
+import os
+import re
+import sys
+import time
+import asyncio
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.classes import Request, RequestTypes, ReadDeadline, parse_accept_language
+from source.settings import MAX_QUERY_ARGS
+
+
+REQUESTS: dict[str, bytes] = {
+    "minimal": b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n",
+    "browser": (
+        b"GET /news?tags=general&page=0 HTTP/1.1\r\n"
+        b"Host: localhost:8080\r\n"
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+        b"Accept-Language: en-US,en;q=0.5\r\n"
+        b"Accept-Encoding: gzip, deflate, br, zstd\r\n"
+        b"Connection: keep-alive\r\n"
+        b"Upgrade-Insecure-Requests: 1\r\n"
+        b"Sec-Fetch-Dest: document\r\n"
+        b"Sec-Fetch-Mode: navigate\r\n"
+        b"Sec-Fetch-Site: none\r\n"
+        b"Sec-Fetch-User: ?1\r\n"
+        b"Priority: u=0, i\r\n\r\n"),
+}
+
+
+async def legacy_read(reader: asyncio.StreamReader):
+    """
+    Original request parser, kept for comparison
+    """
+
+    data = await reader.read(2 ** 15)
+
+    for rtype in RequestTypes.RAW_ALL:
+        if data[:len(rtype)] == rtype:
+            break
+    else:
+        return
+
+    raw_rpath = data[len(rtype)+1:data.find(b' ', len(rtype)+1, 255)]
+    path_split = raw_rpath.split(b'?', 1)
+    rpath = path_split[0]
+
+    rquery_args = dict()
+    raw_query_args = path_split[1] if len(path_split) == 2 else b''
+    for raw_arg in raw_query_args.split(b'&', MAX_QUERY_ARGS):
+        if len(raw_arg := raw_arg.split(b'=', 1)) == 2:
+            rquery_args[raw_arg[0].decode("ascii")] = raw_arg[1].decode("utf-8")
+
+    rheaders = dict()
+    for raw_header in re.findall(r"\r\n(.*:.*)\r\n", data.decode("ascii")):
+        raw_header = raw_header.split(": ")
+        rheaders[raw_header[0].lower()] = raw_header[1]
+
+    if "accept-language" in rheaders:
+        try:
+            rheaders["accept-language"] = parse_accept_language(rheaders["accept-language"])
+        except Exception:
+            rheaders["accept-language"] = []
+    else:
+        rheaders["accept-language"] = []
+
+    return Request(
+        type=rtype.decode("ascii"),
+        path=rpath.decode("utf-8"),
+        query_args=rquery_args,
+        headers=rheaders)
+
+
+async def measure(read, data: bytes, iterations: int) -> tuple[float, int]:
+    """
+    Measures average parse time
+    :param read: request reading coroutine function, takes reader and connection's read deadline
+    :param data: raw request
+    :param iterations: number of requests to parse
+    :return: seconds per request, number of parsed headers
+    """
+
+    reader = asyncio.StreamReader()
+    deadline = ReadDeadline(reader)
+    request = None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        reader.feed_data(data)
+        request = await read(reader, deadline)
+    return (time.perf_counter() - start) / iterations, len(request.headers)
+
+
+async def main():
+    parser = ArgumentParser(description="request parser microbenchmark")
+    parser.add_argument("-n", "--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for name, data in REQUESTS.items():
+        # legacy parser skips every other header, so header counts are shown as well
+        legacy, legacy_headers = await measure(
+            lambda reader, deadline: legacy_read(reader), data, args.iterations)
+        current, current_headers = await measure(
+            lambda reader, deadline: Request.read(reader, None, deadline), data, args.iterations)
+        print(f"{name:<10} legacy: {legacy * 1e6:7.2f} us/request ({legacy_headers} headers)   "
+              f"current: {current * 1e6:7.2f} us/request ({current_headers} headers)   "
+              f"speedup: {legacy / current:.2f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
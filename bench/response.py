@@ -0,0 +1,111 @@
+"""
+Response serialization microbenchmark.
+Compares current 'Response.write' against the original per-header writes on small pages, over a socket pair.
+Transport writes per response are counted as well, each one of those is a send syscall when the buffer is empty.
+Each case is measured several times and the best run is reported, single runs vary by a few microseconds.
+
+Usage: python bench/response.py [-n ITERATIONS] [-r REPEAT]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.classes import Response
+from source.status import STATUS_CODE_OK, STATUS_CODE_NOT_MODIFIED
+
+
+async def legacy_write(response: Response, writer: asyncio.StreamWriter):
+    """
+    Original response writing, status line and every header were encoded and written separately
+    """
+
+    writer.write(b'HTTP/1.1 ' + f"{response.status.code} {response.status.message}".encode("utf8") + b'\r\n')
+    for key, value in response.headers.items():
+        writer.write(f"{key}: {value}\r\n".encode("utf8"))
+    if "content-length" not in response.headers and response.data is not None:
+        writer.write(f"content-length: {len(response.data)}\r\n".encode("utf8"))
+    writer.write(b'\r\n')
+    if response.data is not None:
+        writer.write(response.data)
+
+
+def make_responses() -> dict[str, Response]:
+    """
+    Typical small responses
+    """
+
+    headers = {
+        "content-type": "text/html",
+        "vary": "accept-encoding",
+        "etag": '"695665e7c9cd0efe9360ba882784a757"',
+        "last-modified": "Tue, 01 Apr 2025 06:47:39 GMT",
+        "connection": "keep-alive"}
+    return {
+        "page-2KiB": Response(status=STATUS_CODE_OK, data=b"x" * 2048, headers=dict(headers)),
+        "page-16KiB": Response(status=STATUS_CODE_OK, data=b"x" * 16384, headers=dict(headers)),
+        "not-modified": Response(status=STATUS_CODE_NOT_MODIFIED, headers=dict(headers)),
+    }
+
+
+async def measure(write, response: Response, iterations: int) -> tuple[float, float]:
+    """
+    Measures average write time over a real socket, including send syscalls
+    :return: seconds per response, transport writes per response
+    """
+
+    # the other end is read and discarded on the same loop
+    ours, theirs = socket.socketpair()
+    reader, writer = await asyncio.open_connection(sock=ours)
+    sink_reader, sink_writer = await asyncio.open_connection(sock=theirs)
+
+    async def sink():
+        while await sink_reader.read(2 ** 20):
+            pass
+    sink_task = asyncio.create_task(sink())
+
+    # count writes that reach the transport
+    writes = 0
+    transport_write = writer.transport.write
+
+    def counting_write(data):
+        nonlocal writes
+        writes += 1
+        transport_write(data)
+    writer.transport.write = counting_write
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await write(response, writer)
+        await writer.drain()
+    elapsed = time.perf_counter() - start
+
+    writer.close()
+    await sink_task
+    sink_writer.close()
+    return elapsed / iterations, writes / iterations
+
+
+async def main():
+    parser = ArgumentParser(description="response serialization microbenchmark")
+    parser.add_argument("-n", "--iterations", type=int, default=100_000)
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per case, best one is reported")
+    args = parser.parse_args()
+
+    for name, response in make_responses().items():
+        legacy, legacy_writes = min([await measure(legacy_write, response, args.iterations)
+                                     for _ in range(args.repeat)])
+        current, current_writes = min([await measure(Response.write, response, args.iterations)
+                                       for _ in range(args.repeat)])
+        print(f"{name:<13} legacy: {legacy * 1e6:6.2f} us, {legacy_writes:.0f} writes   "
+              f"current: {current * 1e6:6.2f} us, {current_writes:.0f} writes   "
+              f"speedup: {legacy / current:.2f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Router lookup benchmark.
+Compares 'Router.match' against the original PathTree walk on route tables of growing size,
+for exact routes, wildcard routes and paths that match nothing.
+
+Usage: python bench/router.py [-n ITERATIONS]
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.page_manager import Router
+
+
+SIZES: tuple[int, ...] = (10, 100, 1000, 10000)
+
+
+class FakePage:
+    """
+    Page stand-in, routes only look at these attributes
+    """
+
+    def __init__(self):
+        self.route: str | None = None
+        self.is_scripted: bool = False
+
+
+class LegacyPathTree:
+    """
+    Original tree of paths, walked twice per request
+    """
+
+    def __init__(self):
+        self.tree: dict = {}
+
+    def __contains__(self, item) -> bool:
+        if isinstance(item, str):
+            return self.get(item) is not None
+        return False
+
+    def add(self, path: str, page) -> None:
+        node = self.tree
+        split_path = path.split("/")
+        for split in split_path[:-1]:
+            if split not in node:
+                node[split] = dict()
+            node = node[split]
+        node[split_path[-1]] = page
+
+    def get(self, path: str):
+        node = self.tree
+        split_path = path.split("/")
+        for split in split_path:
+            if "*" in node:
+                return node["*"]
+            if split not in node:
+                return None
+            node = node[split]
+        if isinstance(node, dict) and "*" in node:
+            return node["*"]
+        return node
+
+
+def make_routes(size: int) -> tuple[list[str], list[str], list[str]]:
+    """
+    Makes routes three to five segments deep, a quarter of them are wildcard ones
+    :return: exact routes, wildcard route prefixes, and paths that match nothing
+    """
+
+    rng = random.Random(size)
+    exact, wildcard, misses = [], [], []
+    for i in range(size):
+        segments = [f"section-{rng.randrange(20)}", f"group-{rng.randrange(50)}", f"item-{i}"]
+        segments += [f"part-{rng.randrange(10)}"] * rng.randrange(3)
+        path = "/" + "/".join(segments)
+        if i % 4 == 0:
+            wildcard.append(path)
+        else:
+            exact.append(path)
+        misses.append(f"/{segments[0]}/{segments[1]}/missing-{i}")
+    return exact, wildcard, misses
+
+
+def measure(lookup, paths: list[str], iterations: int) -> float:
+    """
+    Measures average lookup time in seconds
+    """
+
+    count = len(paths)
+    start = time.perf_counter()
+    for i in range(iterations):
+        lookup(paths[i % count])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = ArgumentParser(description="router lookup benchmark")
+    parser.add_argument("-n", "--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # routes log every addition
+
+    print(f"{'routes':>7}  {'kind':<9} {'legacy':>10} {'current':>10}")
+    for size in SIZES:
+        exact, wildcard, misses = make_routes(size)
+        router = Router()
+        legacy = LegacyPathTree()
+        for path in exact:
+            page = FakePage()
+            router.add(path, page)
+            legacy.add(path, page)
+        for path in wildcard:
+            page = FakePage()
+            router.add(f"{path}/*", page)
+            legacy.add(f"{path}/*", page)
+        router.freeze()
+
+        def legacy_lookup(path: str):
+            if path in legacy:
+                return legacy.get(path)
+
+        queries = {
+            "exact": exact,
+            "wildcard": [f"{path}/some/thing" for path in wildcard],
+            "miss": misses}
+        for kind, paths in queries.items():
+            legacy_time = measure(legacy_lookup, paths, args.iterations)
+            current_time = measure(router.match, paths, args.iterations)
+            print(f"{size:>7}  {kind:<9} {legacy_time * 1e9:>8.0f}ns {current_time * 1e9:>8.0f}ns")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark suite. Starts HTTPyServer (plain, TLS, and plain on the protocol core) with its TinyServer on localhost,
+runs load scenarios against them and prints results as JSON, so runs can be compared across commits.
+
+Usage: python bench/run.py [-t SECONDS] [-c CONCURRENCY] [-w WORKERS] [-s SCENARIO ...] [-o OUTPUT]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import tempfile
+import platform
+import subprocess
+from argparse import ArgumentParser
+
+from load import run_load
+
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: (server, load arguments)
+SCENARIOS: dict[str, tuple[str, dict]] = {
+    "plain-keep-alive": ("plain", {"keep_alive": True}),
+    "plain-close": ("plain", {"keep_alive": False}),
+    "plain-keep-alive-gzip": ("plain", {"keep_alive": True, "headers": {"Accept-Encoding": "gzip, br"}}),
+    "plain-static": ("plain", {"keep_alive": True, "paths": {"/css/styles.css": 1, "/favicon.ico": 1}}),
+    "plain-news": ("plain", {"keep_alive": True, "paths": {"/news": 1, "/news?post=post-1": 1}}),
+    "tls-keep-alive": ("tls", {"keep_alive": True, "tls": True}),
+    "tls-close": ("tls", {"keep_alive": False, "tls": True}),
+    "redirect": ("redirect", {"keep_alive": False, "paths": {"/": 1}}),
+    "protocol-keep-alive": ("protocol", {"keep_alive": True}),
+    "protocol-close": ("protocol", {"keep_alive": False}),
+    "protocol-static": ("protocol", {"keep_alive": True, "paths": {"/css/styles.css": 1, "/favicon.ico": 1}}),
+}
+
+
+def free_port() -> int:
+    """
+    Finds a free port pair, server uses port and port + 1
+    """
+
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        with socket.socket() as sock:
+            try:
+                sock.bind(("127.0.0.1", port + 1))
+                return port
+            except OSError:
+                continue
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    """
+    Makes throwaway self-signed certificate using openssl
+    :param directory: where to put the files
+    :return: (certfile, keyfile) pair
+    """
+
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def start_server(
+        port: int,
+        workers: int,
+        ssl_keys: tuple[str, str] | None = None,
+        low_level: bool = False
+) -> subprocess.Popen:
+    """
+    Starts the server and waits until it accepts connections
+    :param port: HTTPy port, redirect server uses the next one
+    :param workers: number of worker processes
+    :param ssl_keys: (certfile, keyfile) pair
+    :param low_level: use protocol core instead of streams
+    :return: server process
+    """
+
+    command = [sys.executable, "main.py", "-a", f"127.0.0.1:{port}", "-d", "localhost", "-w", str(workers)]
+    if ssl_keys:
+        command += ["-c", ssl_keys[0], "-k", ssl_keys[1]]
+    if low_level:
+        command += ["-l"]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited on startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            socket.create_connection(("127.0.0.1", port + 1), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Server didn't start")
+
+
+def stop_server(process: subprocess.Popen):
+    """
+    Stops the server
+    """
+
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def git_commit() -> str | None:
+    """
+    Returns current commit hash
+    """
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = ArgumentParser(description="HTTPy benchmark suite")
+    parser.add_argument("-t", "--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-w", "--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("-s", "--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run, may be repeated; runs all by default")
+    parser.add_argument("-o", "--output", help="write results to file as well")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or list(SCENARIOS)
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "workers": args.workers,
+        "scenarios": dict()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        ssl_keys = None
+        if any(SCENARIOS[name][0] == "tls" for name in scenarios):
+            ssl_keys = make_certificate(directory)
+
+        servers: dict[str, tuple[subprocess.Popen, int]] = dict()
+        try:
+            for name in scenarios:
+                kind, load_args = SCENARIOS[name]
+                server_kind = kind if kind in ("tls", "protocol") else "plain"
+                if server_kind not in servers:
+                    port = free_port()
+                    process = start_server(
+                        port, args.workers, ssl_keys if server_kind == "tls" else None, server_kind == "protocol")
+                    servers[server_kind] = (process, port)
+                port = servers[server_kind][1] + (1 if kind == "redirect" else 0)
+
+                print(f"running '{name}'...", file=sys.stderr)
+                results["scenarios"][name] = asyncio.run(run_load(
+                    address=("127.0.0.1", port),
+                    concurrency=args.concurrency,
+                    duration=args.duration,
+                    **load_args))
+        finally:
+            for process, _ in servers.values():
+                stop_server(process)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+
+
+if __name__ == '__main__':
+    main()
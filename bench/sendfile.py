@@ -0,0 +1,109 @@
+"""
+Static file throughput benchmark.
+Compares current 'Response.write' (sendfile / large chunks) against the original line by line writes.
+
+Usage: python bench/sendfile.py [-s SIZE_MIB] [-r ROUNDS] [-c CERT -k KEY]
+"""
+
+import os
+import sys
+import ssl
+import time
+import asyncio
+import tempfile
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.classes import Response
+from source.status import STATUS_CODE_OK
+from source.settings import WRITE_BUFFER_SIZE
+
+
+async def legacy_write(file, writer: asyncio.StreamWriter):
+    """
+    Original file writing, file was iterated over line by line
+    """
+
+    writer.write(b"HTTP/1.1 200 OK\r\n\r\n")
+    for data in file:
+        writer.write(data)
+        if writer.transport.get_write_buffer_size() >= WRITE_BUFFER_SIZE:
+            await writer.drain()
+    await writer.drain()
+    file.close()
+
+
+async def current_write(file, writer: asyncio.StreamWriter):
+    """
+    Current file writing
+    """
+
+    await Response(status=STATUS_CODE_OK, data=file).write(writer)
+
+
+async def measure(write, filepath: str, rounds: int, ctx: ssl.SSLContext | None) -> float:
+    """
+    Measures download throughput
+    :param write: response writing coroutine function
+    :param filepath: file to serve
+    :param rounds: number of downloads
+    :param ctx: server SSL context, None for plaintext
+    :return: bytes per second
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.readuntil(b"\r\n\r\n")
+        await write(open(filepath, "rb"), writer)
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=ctx)
+    port = server.sockets[0].getsockname()[1]
+    client_ctx = None
+    if ctx:
+        client_ctx = ssl.create_default_context()
+        client_ctx.check_hostname = False
+        client_ctx.verify_mode = ssl.CERT_NONE
+
+    received = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port, ssl=client_ctx)
+        writer.write(b"GET / HTTP/1.1\r\n\r\n")
+        while data := await reader.read(2 ** 20):
+            received += len(data)
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    server.close()
+    await server.wait_closed()
+    return received / elapsed
+
+
+async def main():
+    parser = ArgumentParser(description="static file throughput benchmark")
+    parser.add_argument("-s", "--size", type=int, default=100, help="file size in MiB")
+    parser.add_argument("-r", "--rounds", type=int, default=3)
+    parser.add_argument("-c", "--certificate", help="SSL certificate, benchmarks TLS when given")
+    parser.add_argument("-k", "--private-key", help="SSL private key")
+    args = parser.parse_args()
+
+    ctx = None
+    if args.certificate and args.private_key:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(certfile=args.certificate, keyfile=args.private_key)
+
+    # random bytes contain '\n' every 256 bytes on average, like real media does
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as file:
+        for _ in range(args.size):
+            file.write(os.urandom(2 ** 20))
+    try:
+        for name, write in (("legacy", legacy_write), ("current", current_write)):
+            throughput = await measure(write, file.name, args.rounds, ctx)
+            print(f"{name:<8} {throughput / 2 ** 20:9.1f} MiB/s")
+    finally:
+        os.remove(file.name)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
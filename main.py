@@ -6,7 +6,15 @@ import logging
 import source.settings
 import source.page_manager
 from source.clients import client_callback
+from source.protocol import HTTPProtocol
+from source.watcher import ContentWatcher
+from source.script_pool import ScriptPool
+from source.compression import CompressionCache
+from source.workers import WorkerSupervisor
 from source.http_to_https import TinyServer
+from source.metrics import Metrics
+from source.access_log import AccessLog
+from source.settings import MAX_REQUEST_HEAD_SIZE, METRICS_PATH, HEADER_TIMEOUT, HTTP2_ENABLED
 
 
 LOGGER: logging.Logger = logging.getLogger()
@@ -20,20 +28,27 @@ class HTTPyServer:
     def __init__(
             self,
             bind_address: tuple[str, int],
-            ssl_keys: tuple[str, str] | None = None
+            ssl_keys: tuple[str, str] | None = None,
+            reuse_port: bool = False,
+            low_level: bool = False
     ):
         """
         :param bind_address: binding (address, port)
         :param ssl_keys: (certfile, keyfile) pair
+        :param reuse_port: share the port with other worker processes
+        :param low_level: serve connections using 'HTTPProtocol' instead of streams
         """
 
         self.server: asyncio.Server | None = None
         self.bind_address: tuple[str, int] = bind_address
+        self.reuse_port: bool = reuse_port
+        self.low_level: bool = low_level
 
         self.ctx: ssl.SSLContext | None = None
         if ssl_keys and ssl_keys[0] and ssl_keys[1]:
             self.ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER, check_hostname=False)
             self.ctx.load_cert_chain(certfile=ssl_keys[0], keyfile=ssl_keys[1])
+            self.ctx.set_alpn_protocols(["h2", "http/1.1"] if HTTP2_ENABLED else ["http/1.1"])
 
     def run(self):
         """
@@ -47,11 +62,23 @@ class HTTPyServer:
         Starts the HTTPy server. Coroutine
         """
 
-        self.server = await asyncio.start_server(
-            client_connected_cb=client_callback,
-            host=self.bind_address[0],
-            port=self.bind_address[1],
-            ssl=self.ctx)
+        if self.low_level:
+            self.server = await asyncio.get_running_loop().create_server(
+                HTTPProtocol,
+                host=self.bind_address[0],
+                port=self.bind_address[1],
+                ssl=self.ctx,
+                ssl_handshake_timeout=HEADER_TIMEOUT if self.ctx else None,
+                reuse_port=self.reuse_port)
+        else:
+            self.server = await asyncio.start_server(
+                client_connected_cb=client_callback,
+                host=self.bind_address[0],
+                port=self.bind_address[1],
+                ssl=self.ctx,
+                limit=MAX_REQUEST_HEAD_SIZE,
+                ssl_handshake_timeout=HEADER_TIMEOUT if self.ctx else None,
+                reuse_port=self.reuse_port)
 
         LOGGER.info(f"Server running on '{self.bind_address[0]}:{self.bind_address[1]}'")
 
@@ -97,6 +124,16 @@ def parse_args():
                         help="SSL certificate (or fullchain.pem)")
     parser.add_argument("-k", "--private-key",
                         help="SSL private key")
+    parser.add_argument("-w", "--workers",
+                        help="number of worker processes",
+                        type=int,
+                        default=1)
+    parser.add_argument("-m", "--metrics",
+                        help=f"serve metrics on '{METRICS_PATH}' to localhost clients",
+                        action="store_true")
+    parser.add_argument("-l", "--low-level",
+                        help="serve connections using asyncio protocol instead of streams",
+                        action="store_true")
 
     # parse arguments
     args = parser.parse_args()
@@ -117,28 +154,55 @@ def parse_args():
     return args
 
 
-def main():
-    args = parse_args()
+def run_servers(args, reuse_port: bool = False):
+    """
+    Runs HTTPy and redirect servers until stopped
+    :param args: terminal arguments
+    :param reuse_port: share ports with other worker processes
+    """
 
     httpy = HTTPyServer(
         bind_address=(args.address, args.port),
-        ssl_keys=(args.certificate, args.private_key))
+        ssl_keys=(args.certificate, args.private_key),
+        reuse_port=reuse_port,
+        low_level=args.low_level)
     redirect = TinyServer(
         bind_address=(args.address, args.port+1),
-        redirect=args.domain)
+        redirect=args.domain,
+        reuse_port=reuse_port)
 
     def stop(*args):
+        ContentWatcher.stop()
+        ScriptPool.shutdown()
+        CompressionCache.shutdown()
+        AccessLog.stop()
         httpy.stop()
         redirect.stop()
-    signal.signal(signal.SIGINT, stop)
 
     async def coro():
+        # loop's signal handlers wake up the loop, unlike 'signal.signal' ones
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGINT, stop)
+        loop.add_signal_handler(signal.SIGTERM, stop)
+        ContentWatcher.start()
         await asyncio.gather(
             httpy.run_coro(),
             redirect.run_coro())
     asyncio.run(coro())
 
 
+def main():
+    args = parse_args()
+
+    if args.metrics:
+        Metrics.enabled = True
+
+    if args.workers > 1:  # pages are loaded before forking, so workers share them
+        WorkerSupervisor(lambda: run_servers(args, reuse_port=True), args.workers).run()
+    else:
+        run_servers(args)
+
+
 if __name__ == '__main__':
     source.settings.init()
     source.page_manager.PageManager.init()
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from urllib.parse import quote
+from source.metrics import Metrics
+from source.settings import ACCESS_LOG_ENABLED, ACCESS_LOG_FORMAT, ACCESS_LOG_SAMPLE_RATE, ACCESS_LOG_QUEUE_SIZE
+from source.settings import ACCESS_LOG_BATCH_SIZE, ACCESS_LOG_FLUSH_INTERVAL, ACCESS_LOG_MAX_SIZE, ACCESS_LOG_BACKUPS
+from source.settings import LOGS_DIRECTORY
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+# characters left as is in logged paths, the rest is percent encoded so that lines can't be forged
+_PATH_SAFE: str = "/:@!$&'()*+,;=-._~"
+
+
+def format_record(record: tuple, log_format: str) -> str:
+    """
+    Formats access log record
+    :param record: (time, peer, method, path, version, status, sent, duration)
+    :param log_format: 'line' or 'json'
+    :return: log line, without line break
+    """
+
+    timestamp, peer, method, path, version, status, sent, duration = record
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1000):03}Z"
+    client = peer[0] if peer else "-"
+    if log_format == "json":
+        return json.dumps({
+            "time": timestamp, "client": client, "method": method, "path": path, "version": version,
+            "status": status, "bytes": sent, "duration": round(duration, 6)}, ensure_ascii=False)
+    return f"{timestamp} {client} {method} {quote(path, safe=_PATH_SAFE)} {version} {status} {sent} {duration:.6f}"
+
+
+class AccessLog:
+    """
+    Access log, a record per request. Handlers only put records in a queue, when the log is enabled and
+    the request is sampled; a background thread formats them and writes them to file in batches.
+    Forked worker processes write to their own 'access.<pid>.log', as each of them rotates its file
+    """
+
+    enabled: bool = ACCESS_LOG_ENABLED
+    sample_rate: float = ACCESS_LOG_SAMPLE_RATE
+    log_format: str = ACCESS_LOG_FORMAT
+    path: str = f"{LOGS_DIRECTORY}/access.log"
+
+    records: queue.SimpleQueue | None = None
+    thread: threading.Thread | None = None
+
+    @classmethod
+    def record(
+            cls,
+            peer: tuple | None,
+            method: str,
+            path: str,
+            version: str,
+            status: int,
+            sent: int,
+            duration: float
+    ) -> None:
+        """
+        Records served request. Callers check 'AccessLog.enabled' first
+        :param peer: client address, as given by 'peername'
+        :param method: request method
+        :param path: request path
+        :param version: protocol version
+        :param status: response status code
+        :param sent: bytes written
+        :param duration: seconds it took to respond
+        """
+
+        if cls.sample_rate < 1 and random.random() >= cls.sample_rate:
+            return
+        if cls.records is None:
+            cls.start()
+        elif cls.records.qsize() >= ACCESS_LOG_QUEUE_SIZE:  # disk can't keep up
+            Metrics.increment("access_log_dropped")
+            return
+        cls.records.put((time.time(), peer, method, path, version, status, sent, duration))
+
+    @classmethod
+    def start(cls) -> None:
+        """
+        Starts writer thread
+        """
+
+        cls.records = queue.SimpleQueue()
+        cls.thread = threading.Thread(target=cls._run, args=(cls.records,), name="access-log", daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def stop(cls) -> None:
+        """
+        Writes out queued records, and stops writer thread
+        """
+
+        if cls.records is None:
+            return
+        cls.records.put(None)
+        cls.thread.join(ACCESS_LOG_FLUSH_INTERVAL * 2)
+        cls.records = None
+        cls.thread = None
+
+    @classmethod
+    def _forget(cls) -> None:
+        """
+        Forked process doesn't have parent's writer thread, and starts its own, writing to its own file
+        """
+
+        cls.records = None
+        cls.thread = None
+        cls.path = f"{LOGS_DIRECTORY}/access.{os.getpid()}.log"
+
+    @classmethod
+    def _run(cls, records: queue.SimpleQueue) -> None:
+        """
+        Writer thread, batches records until there's 'ACCESS_LOG_BATCH_SIZE' of them,
+        or the oldest one waited for 'ACCESS_LOG_FLUSH_INTERVAL'
+        """
+
+        file = None
+        running = True
+        while running:
+            record = records.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + ACCESS_LOG_FLUSH_INTERVAL
+            while len(batch) < ACCESS_LOG_BATCH_SIZE and (timeout := deadline - time.monotonic()) > 0:
+                try:
+                    record = records.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is None:
+                    running = False
+                    break
+                batch.append(record)
+
+            try:
+                data = "".join(f"{format_record(record, cls.log_format)}\n" for record in batch).encode("utf-8")
+                file = cls._write(file, data)
+            except OSError as e:
+                LOGGER.warning(f"Failed to write access log: {e}")
+        if file is not None:
+            file.close()
+
+    @classmethod
+    def _write(cls, file, data: bytes):
+        """
+        Appends data to log file, rotating it when it grows too large
+        :return: opened file
+        """
+
+        # file may have been moved away by an external tool, like logrotate
+        if file is not None:
+            try:
+                if os.stat(cls.path).st_ino != os.fstat(file.fileno()).st_ino:
+                    file.close()
+                    file = None
+            except FileNotFoundError:
+                file.close()
+                file = None
+
+        if file is not None and os.fstat(file.fileno()).st_size + len(data) > ACCESS_LOG_MAX_SIZE:
+            file.close()
+            file = None
+            for i in range(ACCESS_LOG_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{cls.path}.{i}"):
+                    os.replace(f"{cls.path}.{i}", f"{cls.path}.{i + 1}")
+            if os.path.exists(cls.path):
+                os.replace(cls.path, f"{cls.path}.1")
+
+        if file is None:
+            file = open(cls.path, "ab", buffering=0)
+        file.write(data)
+        return file
+
+
+os.register_at_fork(after_in_child=AccessLog._forget)
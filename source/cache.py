@@ -0,0 +1,169 @@
+import os
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from source.settings import FILE_CACHE_SIZE, FILE_CACHE_ENTRY_SIZE, FILE_CACHE_REVALIDATE_INTERVAL
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """
+    Cached file contents with the file's stats at the time of reading
+    """
+
+    __slots__ = ("data", "mtime", "size", "checked")
+
+    def __init__(self, data: bytes, mtime: int, size: int):
+        self.data: bytes = data
+        self.mtime: int = mtime
+        self.size: int = size
+        self.checked: float = time.monotonic()
+
+
+class FileValidators:
+    """
+    Strong ETag and modification time of a file
+    """
+
+    __slots__ = ("etag", "last_modified", "mtime", "size", "checked")
+
+    def __init__(self, etag: str, mtime: int, size: int):
+        self.etag: str = etag
+        self.last_modified: float = mtime / 1e9
+        self.mtime: int = mtime
+        self.size: int = size
+        self.checked: float = time.monotonic()
+
+
+def make_etag(data: bytes) -> str:
+    """
+    Makes strong ETag out of content hash
+    :param data: content bytes
+    :return: quoted ETag
+    """
+
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+class ValidatorCache:
+    """
+    ETags of static files, content hash is computed once per file version.
+    Files are revalidated by mtime and size at most once per 'FILE_CACHE_REVALIDATE_INTERVAL'
+    """
+
+    # filepath: FileValidators(...)
+    cache: dict[str, FileValidators] = dict()
+
+    @classmethod
+    def get(cls, filepath: str) -> FileValidators:
+        """
+        Returns file validators
+        :param filepath: path to file
+        :return: validators
+        """
+
+        entry = cls.cache.get(filepath)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked < FILE_CACHE_REVALIDATE_INTERVAL:
+            return entry
+
+        stat = os.stat(filepath)
+        if entry is not None and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+            entry.checked = now
+            return entry
+
+        with open(filepath, "rb") as file:
+            digest = hashlib.file_digest(file, lambda: hashlib.blake2b(digest_size=16))
+        entry = FileValidators(f'"{digest.hexdigest()}"', stat.st_mtime_ns, stat.st_size)
+        cls.cache[filepath] = entry
+        return entry
+
+
+class FileCache:
+    """
+    Process-wide LRU cache of small static files.
+    Files are revalidated by mtime and size at most once per 'FILE_CACHE_REVALIDATE_INTERVAL'
+    """
+
+    # filepath: CacheEntry(...), least recently used first
+    cache: OrderedDict[str, CacheEntry] = OrderedDict()
+    total_size: int = 0
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @classmethod
+    def get(cls, filepath: str) -> bytes | None:
+        """
+        Returns file contents
+        :param filepath: path to file
+        :return: file bytes, None if file is too large to be cached
+        """
+
+        entry = cls.cache.get(filepath)
+        if entry is not None:
+            now = time.monotonic()
+            if now - entry.checked < FILE_CACHE_REVALIDATE_INTERVAL:
+                cls.hits += 1
+                cls.cache.move_to_end(filepath)
+                return entry.data
+
+            stat = os.stat(filepath)
+            if stat.st_mtime_ns == entry.mtime and stat.st_size == entry.size:
+                cls.hits += 1
+                entry.checked = now
+                cls.cache.move_to_end(filepath)
+                return entry.data
+
+            # file was modified
+            cls._remove(filepath)
+        else:
+            stat = os.stat(filepath)
+
+        cls.misses += 1
+        if stat.st_size > FILE_CACHE_ENTRY_SIZE:
+            return
+
+        with open(filepath, "rb") as file:
+            data = file.read()
+        cls._insert(filepath, CacheEntry(data, stat.st_mtime_ns, len(data)))
+        return data
+
+    @classmethod
+    def _insert(cls, filepath: str, entry: CacheEntry) -> None:
+        """
+        Inserts new entry, evicting least recently used ones to fit into cache size
+        """
+
+        cls.cache[filepath] = entry
+        cls.total_size += entry.size
+        while cls.total_size > FILE_CACHE_SIZE:
+            evicted = next(iter(cls.cache))
+            cls._remove(evicted)
+            cls.evictions += 1
+            LOGGER.debug(f"Evicted '{evicted}' from file cache")
+
+    @classmethod
+    def _remove(cls, filepath: str) -> None:
+        """
+        Removes entry from cache
+        """
+
+        cls.total_size -= cls.cache.pop(filepath).size
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        """
+        Returns cache counters
+        """
+
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "evictions": cls.evictions,
+            "entries": len(cls.cache),
+            "size": cls.total_size}
@@ -1,32 +1,183 @@
+import os
 import re
+import time
 import asyncio
-from io import BytesIO
-from collections.abc import Iterable
-from dataclasses import dataclass, field
+from io import BytesIO, BufferedReader
+from functools import lru_cache
+from urllib.parse import unquote_to_bytes
+from collections.abc import Iterable, AsyncIterable, AsyncIterator
+from dataclasses import dataclass, field, replace
 from source.status import StatusCode
-from source.settings import READ_BUFFER_SIZE, WRITE_BUFFER_SIZE, MAX_QUERY_ARGS
+from source.metrics import Metrics
+from source.exceptions import *
+from source.functions import format_http_date
+from source.settings import READ_BUFFER_SIZE, WRITE_BUFFER_SIZE, FILE_CHUNK_SIZE, COALESCE_BODY_SIZE
+from source.settings import CHUNK_COALESCE_SIZE
+from source.settings import MAX_QUERY_ARGS, MAX_REQUEST_LINE_SIZE, MAX_HEADERS, MAX_BODY_SIZE
+from source.settings import KEEP_ALIVE_TIMEOUT, HEADER_TIMEOUT, BODY_TIMEOUT, WRITE_TIMEOUT, SENDFILE_CHUNK_SIZE
+
+
+# chunk size is hex digits only, 16 of them already exceed any body size limit
+_CHUNK_SIZE: re.Pattern = re.compile(rb"[0-9A-Fa-f]{1,16}")
+
+# header name is a token, no whitespace is allowed before the colon (RFC 9112, section 5.1)
+_TOKEN: re.Pattern = re.compile(r"[!#$%&'*+.^_`|~0-9A-Za-z-]+")
 
 
 def parse_accept_language(header_val: str) -> list[tuple[str, float]]:
     """
     Parses 'Accept-Language' header in request
     :param header_val: header value
-    :return: list of tuples of accepted languages
+    :return: list of (lowercase language range, quality) pairs, most preferred first. Refused ones are left out
     """
 
-    langs = header_val.split(",")
     locale_q_pairs = []
-
-    for lang in langs:
-        if (lang_pair := lang.split(";")[0]) == lang:
-            locale_q_pairs.append((lang.strip(), 1))
-        else:
-            locale = lang_pair[0].strip()
-            q = float(lang_pair[1].split("=")[1])
+    for lang in header_val.split(","):
+        locale, _, params = lang.partition(";")
+        if not (locale := locale.strip().lower()):
+            continue
+        q = 1.0
+        if (params := params.strip())[:2] == "q=":
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
             locale_q_pairs.append((locale, q))
+
+    # sort is stable, so equally preferred languages keep header's order
+    locale_q_pairs.sort(key=lambda pair: pair[1], reverse=True)
     return locale_q_pairs
 
 
+@lru_cache(maxsize=256)
+def header_name(raw_name: str) -> str:
+    """
+    Validates and lowercases header name.
+    Clients send the same few names in every request, so results are memoized
+    :param raw_name: name as it was received
+    :return: lowercase name
+    """
+
+    if not _TOKEN.fullmatch(raw_name):
+        raise BadRequestError("Malformed header")
+    return raw_name.lower()
+
+
+@lru_cache(maxsize=1024)
+def negotiate_locale(header_val: str | None, locales: tuple[str, ...] | None) -> str | None:
+    """
+    Chooses page locale using 'Accept-Language' header in request.
+    Language ranges are tried in order of preference, first as they are, then by their primary tag ('ru-RU' -> 'ru').
+    Clients send only a few distinct header values, so results are memoized
+    :param header_val: header value
+    :param locales: page's available locales
+    :return: chosen locale; 'en', or the first locale, if none is acceptable; None if page has no locales
+    """
+
+    if not locales:
+        return None
+
+    if header_val:
+        available = {locale.lower(): locale for locale in locales}
+        for locale, _ in parse_accept_language(header_val):
+            if (chosen := available.get(locale)) is not None:
+                return chosen
+            if (chosen := available.get(locale.partition("-")[0])) is not None:
+                return chosen
+    return "en" if "en" in locales else locales[0]
+
+
+def _unquote_query(value: bytes) -> str:
+    """
+    Percent-decodes query argument
+    :param value: raw query key or value
+    :return: decoded string
+    """
+
+    if b"+" in value:
+        value = value.replace(b"+", b" ")
+    if b"%" in value:
+        value = unquote_to_bytes(value)
+    return value.decode("utf-8", "replace")
+
+
+async def drain(writer: asyncio.StreamWriter) -> None:
+    """
+    Waits until client reads enough of written data
+    :param writer: client stream
+    """
+
+    # drain only waits while the buffer is above high-water mark
+    transport = writer.transport
+    if transport.get_write_buffer_size() <= transport.get_write_buffer_limits()[1]:
+        await writer.drain()
+        return
+
+    try:
+        async with asyncio.timeout(WRITE_TIMEOUT):
+            await writer.drain()
+    except TimeoutError:
+        Metrics.increment("timeouts_write")
+        raise ConnectionStalledError("Client stopped reading")
+
+
+class ReadDeadline:
+    """
+    Deadline for reading from client stream, an expired one fails the pending read with TimeoutError.
+    Timer is moved lazily, it only checks the deadline when it fires, so setting a deadline per request is cheap
+    """
+
+    def __init__(self, reader: asyncio.StreamReader):
+        """
+        :param reader: client stream
+        """
+
+        self.reader: asyncio.StreamReader = reader
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self.deadline: float | None = None
+        self.timer: asyncio.TimerHandle | None = None
+
+    def set(self, timeout: float) -> None:
+        """
+        Sets deadline
+        :param timeout: seconds from now
+        """
+
+        self.deadline = self.loop.time() + timeout
+        if self.timer is None or self.deadline < self.timer.when():
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = self.loop.call_at(self.deadline, self._on_timer)
+
+    def clear(self) -> None:
+        """
+        Clears deadline, once the read is done
+        """
+
+        self.deadline = None
+
+    def cancel(self) -> None:
+        """
+        Cancels timer, once the connection is closed
+        """
+
+        self.deadline = None
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _on_timer(self) -> None:
+        self.timer = None
+        if self.deadline is None:
+            return
+        if self.deadline > self.loop.time():
+            self.timer = self.loop.call_at(self.deadline, self._on_timer)
+            return
+        self.deadline = None
+        self.reader.set_exception(TimeoutError())
+
+
 class RequestTypes:
     GET = 'GET'
     HEAD = 'HEAD'
@@ -42,6 +193,142 @@ class RequestTypes:
     RAW_ALL = [x.encode("ascii") for x in ALL]
 
 
+class RequestBody:
+    """
+    Request body stream. Decodes 'Content-Length' and chunked bodies as they are iterated over,
+    so only one piece of the body is held in memory at a time
+    """
+
+    def __init__(
+            self,
+            reader: asyncio.StreamReader,
+            length: int | None = None,
+            continue_writer: asyncio.StreamWriter | None = None
+    ):
+        """
+        :param reader: client connection
+        :param length: body length; None for chunked body
+        :param continue_writer: client stream, awaiting '100 Continue' before sending the body
+        """
+
+        self.reader: asyncio.StreamReader = reader
+        self.length: int | None = length
+        self.received: int = 0
+
+        self._continue_writer: asyncio.StreamWriter | None = continue_writer
+        self._chunk_left: int = 0
+        self._done: bool = length == 0
+
+    @staticmethod
+    def from_headers(
+            headers: dict[str, str],
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter | None = None
+    ):
+        """
+        Makes body stream for request with given headers
+        :param headers: request headers
+        :param reader: client connection
+        :param writer: client stream, used to respond to 'Expect: 100-continue'
+        :return: body stream, None if request has no body
+        """
+
+        transfer_encoding = headers.get("transfer-encoding")
+        content_length = headers.get("content-length")
+        if transfer_encoding is None and content_length is None:
+            return
+
+        if transfer_encoding is not None:
+            # both headers at once is a request smuggling attempt
+            if content_length is not None or transfer_encoding.lower() != "chunked":
+                raise BadRequestError("Unsupported body framing")
+            length = None
+        else:
+            if not (content_length.isascii() and content_length.isdigit()):
+                raise BadRequestError("Bad content length")
+            length = int(content_length)
+            if length > MAX_BODY_SIZE:
+                raise PayloadTooLargeError("Request body too large")
+
+        expects_continue = headers.get("expect", "").lower() == "100-continue"
+        return RequestBody(reader, length, writer if expects_continue else None)
+
+    @property
+    def is_done(self) -> bool:
+        """
+        True when the whole body was read from the connection
+        """
+
+        return self._done
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self._done:
+            raise StopAsyncIteration
+
+        # client waits for permission to send the body
+        if self._continue_writer is not None:
+            self._continue_writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            self._continue_writer = None
+
+        try:
+            async with asyncio.timeout(BODY_TIMEOUT):
+                if self.length is None:
+                    data = await self._read_chunked()
+                else:
+                    data = await self.reader.read(min(self.length - self.received, READ_BUFFER_SIZE))
+                    if not data:
+                        raise BadRequestError("Incomplete body")
+                    if self.received + len(data) == self.length:
+                        self._done = True
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise BadRequestError("Incomplete body")
+        except TimeoutError:
+            Metrics.increment("timeouts_body")
+            raise RequestTimeoutError("Request body timed out")
+
+        self.received += len(data)
+        if self.received > MAX_BODY_SIZE:
+            raise PayloadTooLargeError("Request body too large")
+        return data
+
+    async def _read_chunked(self) -> bytes:
+        """
+        Reads next piece of chunked body
+        """
+
+        if self._chunk_left == 0:
+            if self.received > 0 and await self.reader.readexactly(2) != b"\r\n":  # previous chunk's end
+                raise BadRequestError("Bad chunk")
+            size_line = await self.reader.readuntil(b"\r\n")
+            size = size_line[:-2].split(b";", 1)[0]
+            if not _CHUNK_SIZE.fullmatch(size):  # 'int' would take signs, spaces, underscores and '0x'
+                raise BadRequestError("Bad chunk size")
+            self._chunk_left = int(size, 16)
+
+            if self._chunk_left == 0:  # last chunk, skip trailers
+                while await self.reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                self._done = True
+                raise StopAsyncIteration
+
+        data = await self.reader.read(min(self._chunk_left, READ_BUFFER_SIZE))
+        if not data:
+            raise BadRequestError("Incomplete body")
+        self._chunk_left -= len(data)
+        return data
+
+    async def read(self) -> bytes:
+        """
+        Reads the rest of the body at once
+        :return: body bytes
+        """
+
+        return b"".join([data async for data in self])
+
+
 @dataclass(frozen=True)
 class Request:
     """
@@ -52,100 +339,450 @@ class Request:
     path: str
     query_args: dict[str, str]
     headers: dict[str, str]
-    data_stream: Iterable | None = None
+    data_stream: RequestBody | None = None
+    version: str = "HTTP/1.1"
 
     @staticmethod
-    async def read(reader: asyncio.StreamReader):
+    async def read(
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter | None = None,
+            deadline: ReadDeadline | None = None
+    ):
         """
-        Reads request from client's stream
+        Reads request from client's stream.
+        Client has 'KEEP_ALIVE_TIMEOUT' to start sending the request, and 'HEADER_TIMEOUT' after that to finish its head
         :param reader: client connection
+        :param writer: client stream, used to respond to 'Expect: 100-continue'
+        :param deadline: connection's read deadline, no timeouts if None
+        :return: request class, None if connection was closed or stayed idle
+        """
+
+        # read only the request head, pipelined requests stay in the stream.
+        # the reader keeps accumulating segments until the head is complete
+        is_started = False
+        try:
+            if deadline is not None:
+                deadline.set(KEEP_ALIVE_TIMEOUT)
+            head = await reader.readexactly(1)
+            is_started = True
+            if deadline is not None:
+                deadline.set(HEADER_TIMEOUT)
+            head += await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:  # connection closed
+            return
+        except TimeoutError:
+            if is_started:  # slowly dripping head
+                Metrics.increment("timeouts_header")
+                raise RequestTimeoutError("Request head timed out")
+            Metrics.increment("timeouts_idle")
+            return
+        except asyncio.LimitOverrunError:  # head doesn't fit into reader's limit
+            data = await reader.read(MAX_REQUEST_LINE_SIZE + 2)
+            if b"\r\n" not in data:
+                raise URITooLongError("Request line too long")
+            raise HeaderFieldsTooLargeError("Request head too large")
+        finally:
+            if deadline is not None:
+                deadline.clear()
+
+        if head == b"PRI * HTTP/2.0\r\n\r\n":  # first part of HTTP/2 connection preface
+            raise HTTP2Requested("HTTP/2 with prior knowledge")
+        request = Request.parse(head)
+
+        # body is left in the stream, and read only when data stream is iterated over
+        if body := RequestBody.from_headers(request.headers, reader, writer):
+            request = replace(request, data_stream=body)
+        return request
+
+    @staticmethod
+    def parse(head: bytes):
+        """
+        Parses request head
+        :param head: request line and headers, ending with empty line
         :return: request class
         """
 
-        data = await reader.read(READ_BUFFER_SIZE)
+        # some clients send an extra empty line after request body
+        head = head.lstrip(b"\r\n")
 
-        # request type
-        for rtype in RequestTypes.RAW_ALL:
-            if data[:len(rtype)] == rtype:
-                break
-        else:
-            return
+        # request line
+        line_end = head.find(b"\r\n")
+        if line_end > MAX_REQUEST_LINE_SIZE:
+            raise URITooLongError("Request line too long")
+        request_line = head[:line_end].split(b" ")
+        if len(request_line) != 3:
+            raise BadRequestError("Malformed request line")
+        rtype, target, rversion = request_line
+        if rtype not in RequestTypes.RAW_ALL or rversion[:7] != b"HTTP/1.":
+            raise BadRequestError("Unsupported request")
+
+        # headers. latin-1 maps bytes 1:1, so decoding the block never fails
+        raw_headers = head[line_end+2:].decode("latin-1").split("\r\n")
+        if len(raw_headers) - 2 > MAX_HEADERS:  # head ends with 2 empty lines
+            raise HeaderFieldsTooLargeError("Too many headers")
+        rheaders = dict()
+        for raw_header in raw_headers:
+            if not raw_header:
+                continue
+            key, sep, value = raw_header.partition(":")
+            if not sep:
+                raise BadRequestError("Malformed header")
+            key = header_name(key)
+            if key in rheaders:  # repeated headers are same as comma separated list
+                rheaders[key] = f"{rheaders[key]}, {value.strip()}"
+            else:
+                rheaders[key] = value.strip()
+
+        return Request.make(rtype.decode("ascii"), target, rheaders, rversion.decode("ascii"))
 
-        # raw request path
-        raw_rpath = data[len(rtype)+1:data.find(b' ', len(rtype)+1, 255)]
+    @staticmethod
+    def make(rtype: str, target: bytes, rheaders: dict[str, str], rversion: str):
+        """
+        Makes request out of its parsed parts, shared by HTTP/1.1 and HTTP/2
+        :param rtype: request method
+        :param target: raw request target, path with query
+        :param rheaders: headers with lowercase names
+        :param rversion: protocol version
+        :return: request class
+        """
 
         # request path
-        path_split = raw_rpath.split(b'?', 1)
-        rpath = path_split[0]
+        raw_rpath, _, raw_query_args = target.partition(b"?")
+        if b"%" in raw_rpath:
+            raw_rpath = unquote_to_bytes(raw_rpath)
+        rpath = raw_rpath.decode("utf-8", "replace")
 
         # query args
         rquery_args = dict()
-        raw_query_args = path_split[1] if len(path_split) == 2 else b''
-        for raw_arg in raw_query_args.split(b'&', MAX_QUERY_ARGS):
-            if len(raw_arg := raw_arg.split(b'=', 1)) == 2:
-                rquery_args[raw_arg[0].decode("ascii")] = raw_arg[1].decode("utf-8")
+        if raw_query_args:
+            for raw_arg in raw_query_args.split(b"&")[:MAX_QUERY_ARGS]:
+                key, sep, value = raw_arg.partition(b"=")
+                if sep:
+                    rquery_args[_unquote_query(key)] = _unquote_query(value)
 
-        # headers
-        rheaders = dict()
-        for raw_header in re.findall(r"\r\n(.*:.*)\r\n", data.decode("ascii")):
-            raw_header = raw_header.split(": ")
-            rheaders[raw_header[0].lower()] = raw_header[1]
+        return Request(
+            type=rtype,
+            path=rpath,
+            query_args=rquery_args,
+            headers=rheaders,
+            version=rversion)
 
-        if "accept-language" in rheaders:
-            try:
-                rheaders["accept-language"] = parse_accept_language(rheaders["accept-language"])
-            except Exception:
-                rheaders["accept-language"] = []
-        else:
-            rheaders["accept-language"] = []
 
-        # data
-        # TODO: make data streams
+@dataclass(frozen=True)
+class FileRange:
+    """
+    Part of opened file, sent without reading what's before it
+    """
 
-        return Request(
-            type=rtype.decode("ascii"),
-            path=rpath.decode("utf-8"),
-            query_args=rquery_args,
-            headers=rheaders)
+    file: BufferedReader
+    offset: int
+    count: int
+
+
+async def iterate_chunks(chunks: Iterable | AsyncIterable) -> AsyncIterator[bytes]:
+    """
+    Iterates over sync or async iterable of body chunks
+    """
+
+    if isinstance(chunks, AsyncIterable):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
+
+
+# (unix second, HTTP date, 'date' header line), the header only changes once per second
+_date_header: tuple[int, str, bytes] = (0, "", b"")
+
+
+def _current_date() -> tuple[int, str, bytes]:
+    global _date_header
+    now = int(time.time())
+    if _date_header[0] != now:
+        date = format_http_date(now)
+        _date_header = (now, date, f"date: {date}\r\n".encode("ascii"))
+    return _date_header
+
+
+def date_header() -> bytes:
+    """
+    Returns 'date' header line for current time
+    """
+
+    return _current_date()[2]
+
+
+def http_date() -> str:
+    """
+    Returns 'date' header value for current time
+    """
+
+    return _current_date()[1]
 
 
 @dataclass(frozen=True)
 class Response:
     """
-    Server HTTP response
+    Server HTTP response.
+    Body of unknown length, like iterable or async iterable of chunks, is sent using chunked encoding.
+    Small chunks are joined into frames of 'CHUNK_COALESCE_SIZE', an empty chunk sends what's joined so far.
+    Trailers are sent after chunked body, their values may be filled in while the body is generated
     """
 
     status: StatusCode
-    data: bytes | Iterable | BytesIO | None = None
+    data: bytes | Iterable | AsyncIterable | BytesIO | BufferedReader | FileRange | list[bytes | FileRange] | None = None
     headers: dict[str, str] = field(default_factory=lambda: dict())
+    trailers: dict[str, str] | None = None
+
+    @property
+    def length(self) -> int | None:
+        """
+        Length of response body in bytes
+        :return: body length, None if it can't be known beforehand
+        """
+
+        if self.data is None:
+            return 0
+        if isinstance(self.data, bytes):
+            return len(self.data)
+        if isinstance(self.data, BytesIO):
+            return self.data.getbuffer().nbytes - self.data.tell()
+        if isinstance(self.data, BufferedReader):  # opened file
+            return os.fstat(self.data.fileno()).st_size - self.data.tell()
+        if isinstance(self.data, FileRange):
+            return self.data.count
+        if isinstance(self.data, list):  # multipart body
+            return sum(part.count if isinstance(part, FileRange) else len(part) for part in self.data)
+        return None
 
-    async def write(self, writer: asyncio.StreamWriter):
+    async def write(self, writer: asyncio.StreamWriter, chunked: bool = True) -> int:
         """
-        Writes response to client stream
+        Writes response to client stream. Head is assembled into a single buffer,
+        and small bodies are written along with it
         :param writer: client stream
+        :param chunked: body of unknown length may be sent chunked, otherwise it's delimited by closing connection
+        :return: number of bytes written
         """
 
-        writer.write(b'HTTP/1.1 ' + self.status.__bytes__() + b'\r\n')
-        for key, value in self.headers.items():
-            writer.write(f"{key}: {value}\r\n".encode("utf-8"))
-        writer.write(b'\r\n')
+        lines = [f"{key}: {value}\r\n" for key, value in self.headers.items()]
 
-        if isinstance(self.data, bytes):
-            writer.write(self.data)
-        elif isinstance(self.data, Iterable):
-            for data in self.data:
-                writer.write(data)
-                if writer.transport.get_write_buffer_size() >= WRITE_BUFFER_SIZE:
-                    await writer.drain()
+        # 304 response has no body, but its length would be the length of the unmodified page
+        is_chunked = False
+        if self.status.code != 304 and "content-length" not in self.headers and "transfer-encoding" not in self.headers:
+            if (length := self.length) is not None:
+                lines.append(f"content-length: {length}\r\n")
+            elif chunked:
+                lines.append("transfer-encoding: chunked\r\n")
+                is_chunked = True
+                if self.trailers:
+                    lines.append(f"trailer: {', '.join(self.trailers)}\r\n")
+        lines.append("\r\n")
+        head = b"".join((self.status.status_line, date_header(), "".join(lines).encode("utf-8")))
+        sent = len(head)
+
+        if self.data is None:  # 304s, HEAD responses and errors
+            writer.write(head)
+        elif isinstance(self.data, bytes):
+            if len(self.data) <= COALESCE_BODY_SIZE:
+                writer.writelines((head, self.data))
+            else:  # not worth copying
+                writer.write(head)
+                writer.write(self.data)
+            sent += len(self.data)
+        else:
+            writer.write(head)
+            sent += await self._write_body(writer, is_chunked)
+
+        if writer.transport.get_write_buffer_size() > 0:
+            await drain(writer)
+        return sent
+
+    async def _write_body(self, writer: asyncio.StreamWriter, is_chunked: bool) -> int:
+        """
+        Writes response body that isn't plain bytes
+        :param writer: client stream
+        :param is_chunked: use chunked encoding for body of unknown length
+        :return: number of bytes written
+        """
+
+        sent = 0
+        if isinstance(self.data, BufferedReader):
+            try:
+                sent += await self._write_file(writer, self.data, self.data.tell(), None)
+            finally:
+                self.data.close()
+        elif isinstance(self.data, FileRange):
+            try:
+                sent += await self._write_file(writer, self.data.file, self.data.offset, self.data.count)
+            finally:
+                self.data.file.close()
+        elif isinstance(self.data, list):
+            try:
+                for part in self.data:
+                    if isinstance(part, FileRange):
+                        sent += await self._write_file(writer, part.file, part.offset, part.count)
+                    else:
+                        writer.write(part)
+                        sent += len(part)
+            finally:
+                for part in self.data:
+                    if isinstance(part, FileRange):
+                        part.file.close()
         elif isinstance(self.data, BytesIO):
             try:
                 while data := self.data.read(WRITE_BUFFER_SIZE):
                     writer.write(data)
+                    sent += len(data)
                     if writer.transport.get_write_buffer_size() >= WRITE_BUFFER_SIZE:
-                        await writer.drain()
+                        await drain(writer)
             except Exception as e:
                 self.data.close()
                 raise e
+        elif isinstance(self.data, Iterable | AsyncIterable):
+            sent += await self._write_chunks(writer, is_chunked)
 
-        if writer.transport.get_write_buffer_size() > 0:
-            await writer.drain()
+        return sent
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """
+        Yields response body in pieces, for protocols that frame the body themselves
+        """
+
+        if self.data is None:
+            return
+        if isinstance(self.data, bytes):
+            if self.data:
+                yield self.data
+        elif isinstance(self.data, BufferedReader):
+            try:
+                while data := self.data.read(FILE_CHUNK_SIZE):
+                    yield data
+            finally:
+                self.data.close()
+        elif isinstance(self.data, FileRange | list):
+            parts = self.data if isinstance(self.data, list) else [self.data]
+            try:
+                for part in parts:
+                    if not isinstance(part, FileRange):
+                        yield part
+                        continue
+                    part.file.seek(part.offset)
+                    left = part.count
+                    while left > 0 and (data := part.file.read(min(left, FILE_CHUNK_SIZE))):
+                        left -= len(data)
+                        yield data
+            finally:
+                for part in parts:
+                    if isinstance(part, FileRange):
+                        part.file.close()
+        elif isinstance(self.data, BytesIO):
+            try:
+                while data := self.data.read(FILE_CHUNK_SIZE):
+                    yield data
+            finally:
+                self.data.close()
+        elif isinstance(self.data, Iterable | AsyncIterable):
+            try:
+                async for data in iterate_chunks(self.data):
+                    if data:
+                        yield data
+            finally:
+                if hasattr(self.data, "aclose"):
+                    await self.data.aclose()
+                elif hasattr(self.data, "close"):
+                    self.data.close()
+
+    async def _write_chunks(self, writer: asyncio.StreamWriter, is_chunked: bool) -> int:
+        """
+        Writes iterable or async iterable body, joining small chunks together
+        :param writer: client stream
+        :param is_chunked: frame chunks using chunked encoding, otherwise write them as is
+        :return: number of bytes written
+        """
+
+        sent = 0
+        pending = []  # chunks joined into next frame
+        pending_size = 0
+        try:
+            async for data in iterate_chunks(self.data):
+                if data:
+                    pending.append(data)
+                    pending_size += len(data)
+                    if pending_size < CHUNK_COALESCE_SIZE:
+                        continue
+                elif not pending:
+                    continue
+
+                if is_chunked:
+                    frame = f"{pending_size:x}\r\n".encode("ascii")
+                    writer.writelines((frame, *pending, b"\r\n"))
+                    sent += len(frame) + 2
+                else:
+                    writer.writelines(pending)
+                sent += pending_size
+                pending.clear()
+                pending_size = 0
+                if writer.transport.get_write_buffer_size() >= WRITE_BUFFER_SIZE:
+                    await drain(writer)
+        finally:  # stop generator, if client went away
+            if hasattr(self.data, "aclose"):
+                await self.data.aclose()
+            elif hasattr(self.data, "close"):
+                self.data.close()
+
+        if not is_chunked:
+            writer.writelines(pending)
+            return sent + pending_size
+
+        end = []
+        if pending:
+            end.append(f"{pending_size:x}\r\n".encode("ascii"))
+            end.extend(pending)
+            end.append(b"\r\n")
+        end.append(b"0\r\n")
+        if self.trailers:
+            end.append("".join(f"{key}: {value}\r\n" for key, value in self.trailers.items()).encode("utf-8"))
+        end.append(b"\r\n")
+        writer.writelines(end)
+        return sent + sum(len(data) for data in end)
+
+    @staticmethod
+    async def _write_file(writer: asyncio.StreamWriter, file: BufferedReader, offset: int, count: int | None) -> int:
+        """
+        Writes part of opened file to client stream
+        :param writer: client stream
+        :param file: opened file
+        :param offset: where to start
+        :param count: number of bytes to write, None to write until the end of file
+        :return: number of bytes written
+        """
+
+        if writer.get_extra_info("sslcontext") is None:  # kernel copies file to socket
+            await drain(writer)
+            left = count if count is not None else os.fstat(file.fileno()).st_size - offset
+            sent = 0
+            while left > 0:  # in parts, so that stalled client is noticed
+                try:
+                    async with asyncio.timeout(WRITE_TIMEOUT):
+                        part = await asyncio.get_running_loop().sendfile(
+                            writer.transport, file, offset + sent, min(left, SENDFILE_CHUNK_SIZE))
+                except TimeoutError:
+                    Metrics.increment("timeouts_write")
+                    raise ConnectionStalledError("Client stopped reading")
+                if part == 0:  # file was truncated
+                    break
+                left -= part
+                sent += part
+            return sent
+
+        # data has to go through TLS, so read in large chunks
+        file.seek(offset)
+        left = count if count is not None else os.fstat(file.fileno()).st_size - offset
+        sent = 0
+        while left > 0 and (data := file.read(min(left, FILE_CHUNK_SIZE))):
+            writer.write(data)
+            await drain(writer)
+            left -= len(data)
+            sent += len(data)
+        return sent
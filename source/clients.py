@@ -1,50 +1,544 @@
+import time
 import logging
+import secrets
 from source.status import *
 from source.classes import *
 from source.exceptions import *
-from source.page_manager import PageManager, PathTree
+from source.page_manager import PageManager, Page, DummyPage
+from source.metrics import Metrics
+from source.access_log import AccessLog
+from source.http2 import H2Connection
+from source.cache import ValidatorCache, FileValidators, make_etag
+from source.functions import format_http_date, parse_http_date
+from source.compression import CompressionCache, is_compressible, negotiate_encoding, compress, compress_stream
+from source.settings import KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS, MAX_RANGES
+from source.settings import MAX_CONNECTIONS, MAX_CONNECTIONS_PER_IP, HTTP2_ENABLED
+from source.settings import COMPRESSION_MIN_SIZE, COMPRESSION_MAX_SIZE, METRICS_PATH
 
 
 LOGGER: logging.Logger = logging.getLogger(__name__)
 
 
+# sent to clients over connection limits, without reading their requests
+_UNAVAILABLE_RESPONSE: bytes = (
+    STATUS_CODE_SERVICE_UNAVAILABLE.status_line +
+    b"content-length: 0\r\nretry-after: 1\r\nconnection: close\r\n\r\n")
+
+# arguments passed to page scripts by the server, query arguments can't override them
+_RESERVED_ARGS: frozenset[str] = frozenset(("path", "locale", "method", "data_stream"))
+
+
 class ClientHandler:
+    # number of open connections, in total and per client address
+    connections: int = 0
+    connections_per_ip: dict[str, int] = dict()
+
     def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         self.reader: asyncio.StreamReader = reader
         self.writer: asyncio.StreamWriter = writer
 
-    async def handle_client(self) -> None:
+        self.request_count: int = 0
+
+        # current request's route and start time, for metrics
+        self.route: str = "unmatched"
+        self.request_start: float | None = None
+        self.method: str | None = None  # current request's method, for error responses
+        self.deadline: ReadDeadline | None = None  # created with the first request read from the stream
+
+    async def serve(self) -> None:
+        """
+        Serves client's requests until the connection is closed
+        """
+
+        reader, writer = self.reader, self.writer
+
+        # HTTP/2 negotiated during TLS handshake
+        ssl_object = writer.get_extra_info("ssl_object")
+        if HTTP2_ENABLED and ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+            await H2Connection(reader, writer, ClientHandler).run()
+            return
+
+        # serve requests one after another, pipelined ones are left in the reader
+        keep_alive = True
+        while keep_alive:
+            response = None
+            try:
+                keep_alive = await self.handle_client()
+            except ConnectionStalledError:  # nothing more can be written
+                writer.transport.abort()
+                break
+            except HTTP2Requested:
+                if HTTP2_ENABLED and self.request_count == 0:
+                    await H2Connection(reader, writer, ClientHandler, preface_read=True).run()
+                    break
+                response = ClientHandler.error_response(BadRequestError("Unsupported request"))
+            except Exception as e:
+                response = ClientHandler.error_response(e, self.method)
+
+            # if there's an exception response
+            if response:
+                keep_alive = False
+                response.headers["connection"] = "close"
+                response_start = time.perf_counter()
+                try:
+                    sent = await response.write(writer)
+                except ConnectionStalledError:
+                    writer.transport.abort()
+                    sent = 0
+                except Exception:  # I don't know what it raises
+                    sent = 0
+                request_start = self.request_start or response_start
+                if Metrics.enabled:
+                    Metrics.record_request(
+                        self.route, response.status.code,
+                        response_start - request_start, time.perf_counter() - request_start, sent)
+                if AccessLog.enabled:
+                    AccessLog.record(
+                        writer.get_extra_info("peername"), "-", "-", "-", response.status.code,
+                        sent, time.perf_counter() - request_start)
+
+    async def handle_client(self) -> bool:
         """
-        Handles the client's request
+        Handles a single client's request
+        :return: True if the connection should be kept alive
         """
 
-        request = await Request.read(self.reader)
+        self.route = "unmatched"
+        self.request_start = None
+        self.method = None
+        request = await self.read_request()
         if request is None:
+            return False
+        self.method = request.type
+        self.request_count += 1
+        self.request_start = time.perf_counter()
+
+        response = await self.make_response(request)
+
+        # HTTP/1.0 has no chunked encoding, so body without known length is delimited by closing the connection,
+        # and unread request body would be mistaken for the next request
+        chunked = request.version != "HTTP/1.0"
+        keep_alive = self.is_keep_alive(request) and (chunked or response.length is not None)
+        if request.data_stream is not None and not request.data_stream.is_done:
+            keep_alive = False
+        if keep_alive:
+            response.headers["connection"] = "keep-alive"
+            if request.version == "HTTP/1.0":
+                response.headers["keep-alive"] = \
+                    f"timeout={KEEP_ALIVE_TIMEOUT}, max={KEEP_ALIVE_MAX_REQUESTS - self.request_count}"
+        else:
+            response.headers["connection"] = "close"
+
+        response_start = time.perf_counter()
+        sent = await response.write(self.writer, chunked)
+        if Metrics.enabled:
+            Metrics.record_request(
+                self.route, response.status.code,
+                response_start - self.request_start, time.perf_counter() - self.request_start, sent)
+        if AccessLog.enabled:
+            AccessLog.record(
+                self.writer.get_extra_info("peername"), request.type, request.path, request.version,
+                response.status.code, sent, time.perf_counter() - self.request_start)
+        self.request_start = None
+        return keep_alive
+
+    async def read_request(self) -> Request | None:
+        """
+        Reads next request from the connection
+        :return: request, None if connection was closed or stayed idle
+        """
+
+        if self.deadline is None:
+            self.deadline = ReadDeadline(self.reader)
+        return await Request.read(self.reader, self.writer, self.deadline)
+
+    async def make_response(self, request: Request) -> Response:
+        """
+        Routes request, and makes response to it
+        :param request: client request
+        :return: response
+        """
+
+        if Metrics.enabled and request.path == METRICS_PATH and self.is_local():
+            self.route = METRICS_PATH
+            return Response(
+                data=Metrics.export().encode("utf-8"),
+                status=STATUS_CODE_OK,
+                headers={"content-type": "text/plain; version=0.0.4"})
+
+        if (match := PageManager.router.match(request.path)) is not None:
+            page_class = match[0]
+            self.route = page_class.route
+
+            # static pages are only fetched, scripted ones may accept request body
+            if request.type == RequestTypes.GET or request.type == RequestTypes.HEAD or page_class.is_scripted:
+                return await self.make_page_response(request, page_class)
+        return Response(status=STATUS_CODE_NOT_FOUND)
+
+    @staticmethod
+    def error_response(error: Exception, method: str | None = None) -> Response:
+        """
+        Makes response to exception raised while handling request
+        :param error: raised exception
+        :param method: request method, None if request wasn't parsed
+        :return: response
+        """
+
+        Metrics.record_exception(error)
+        if isinstance(error, ClientSideErrors):
+            data = error.status.message.encode()
+            if method == RequestTypes.HEAD:  # body is only described
+                return Response(status=error.status, headers={"content-length": str(len(data))})
+            return Response(data=data, status=error.status)
+        LOGGER.warning(f"Error occurred when handling client request:", exc_info=error)
+        if isinstance(error, ServerSideErrors):
+            return Response(status=error.status)
+        return Response(status=STATUS_CODE_INTERNAL_SERVER_ERROR)
+
+    @classmethod
+    def admit(cls, writer: asyncio.StreamWriter, address: str) -> bool:
+        """
+        Counts new connection in, if it's within connection limits.
+        Connections over the limits are answered with 503 and closed
+        :param writer: client stream
+        :param address: client address
+        :return: True if the connection was admitted, and has to be released later
+        """
+
+        if cls.connections >= MAX_CONNECTIONS:
+            Metrics.increment("connections_rejected")
+        elif cls.connections_per_ip.get(address, 0) >= MAX_CONNECTIONS_PER_IP:
+            Metrics.increment("connections_rejected_per_ip")
+        else:
+            cls.connections += 1
+            cls.connections_per_ip[address] = cls.connections_per_ip.get(address, 0) + 1
+            return True
+
+        writer.write(_UNAVAILABLE_RESPONSE)
+        writer.close()
+        return False
+
+    @classmethod
+    def release(cls, address: str) -> None:
+        """
+        Counts closed connection out
+        :param address: client address, TLS transports forget it once closed
+        """
+
+        cls.connections -= 1
+        if (count := cls.connections_per_ip[address] - 1) > 0:
+            cls.connections_per_ip[address] = count
+        else:
+            del cls.connections_per_ip[address]
+
+    def is_local(self) -> bool:
+        """
+        Checks if the client connected from localhost
+        """
+
+        peer = self.writer.get_extra_info("peername")
+        return peer is not None and peer[0] in ("127.0.0.1", "::1")
+
+    @staticmethod
+    async def make_page_response(request: Request, page_class: Page) -> Response:
+        """
+        Makes response with page contents
+        :param request: client request
+        :param page_class: requested page
+        :return: response
+        """
+
+        headers = {"content-type": page_class.type}
+
+        vary = []
+        encoding = "identity"
+        if is_compressible(page_class.type):
+            vary.append("accept-encoding")
+            encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+
+        locale = negotiate_locale(request.headers.get("accept-language"), page_class.locales)
+        if page_class.locales is not None and len(page_class.locales) > 1:
+            vary.append("accept-language")
+
+        if vary:
+            headers["vary"] = ", ".join(vary)
+
+        if page_class.is_scripted:
+            return await ClientHandler._make_scripted_response(request, page_class, headers, encoding, locale)
+        return await ClientHandler._make_static_response(request, page_class, headers, encoding, locale)
+
+    @staticmethod
+    async def _make_static_response(
+            request: Request,
+            page_class: Page,
+            headers: dict[str, str],
+            encoding: str,
+            locale: str | None
+    ) -> Response:
+        """
+        Makes response with static file. File is only read when its contents are sent
+        """
+
+        filepath = page_class.get_filepath(locale)
+        validators = ValidatorCache.get(filepath)
+        headers["accept-ranges"] = "bytes"
+
+        # byte ranges are served from the file itself
+        ranges = ClientHandler.get_ranges(request, validators)
+        if ranges is not None or not COMPRESSION_MIN_SIZE <= validators.size <= COMPRESSION_MAX_SIZE:
+            encoding = "identity"
+
+        # static files are compressed once in background, and sent as they are until then
+        page_data = None
+        if encoding != "identity" and (page_data := CompressionCache.get(filepath, encoding)) is None:
+            encoding = "identity"
+
+        headers["etag"] = validators.etag if encoding == "identity" else f'{validators.etag[:-1]}-{encoding}"'
+        headers["last-modified"] = format_http_date(validators.last_modified)
+        if ClientHandler.is_not_modified(request, headers["etag"], validators.last_modified):
+            return Response(status=STATUS_CODE_NOT_MODIFIED, headers=headers)
+
+        if ranges is not None:
+            return await ClientHandler._make_range_response(page_class, locale, headers, validators.size, ranges)
+
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+
+        if request.type == RequestTypes.HEAD:
+            headers["content-length"] = str(validators.size if page_data is None else len(page_data))
+            return Response(status=STATUS_CODE_OK, headers=headers)
+
+        if page_data is None:
+            page_data = await page_class.get_data(locale=locale)
+        return Response(
+            data=page_data,
+            status=STATUS_CODE_OK,
+            headers=headers)
+
+    @staticmethod
+    async def _make_range_response(
+            page_class: Page,
+            locale: str | None,
+            headers: dict[str, str],
+            size: int,
+            ranges: list[tuple[int, int]]
+    ) -> Response:
+        """
+        Makes partial response with requested byte ranges of static file
+        """
+
+        if not ranges:
+            headers["content-range"] = f"bytes */{size}"
+            return Response(status=STATUS_CODE_RANGE_NOT_SATISFIABLE, headers=headers)
+
+        # cached files are sliced, opened ones are sent from offsets
+        page_data = await page_class.get_data(locale=locale)
+
+        def make_part(start: int, end: int) -> bytes | FileRange:
+            if isinstance(page_data, bytes):
+                return page_data[start:end]
+            return FileRange(page_data, start, end - start)
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+            return Response(
+                data=make_part(start, end),
+                status=STATUS_CODE_PARTIAL_CONTENT,
+                headers=headers)
+
+        boundary = secrets.token_hex(16)
+        part_type = headers["content-type"]
+        headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        parts = []
+        for start, end in ranges:
+            parts.append(
+                f"\r\n--{boundary}\r\n"
+                f"content-type: {part_type}\r\n"
+                f"content-range: bytes {start}-{end - 1}/{size}\r\n\r\n".encode("ascii"))
+            parts.append(make_part(start, end))
+        parts.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+        return Response(
+            data=parts,
+            status=STATUS_CODE_PARTIAL_CONTENT,
+            headers=headers)
+
+    @staticmethod
+    def get_ranges(request: Request, validators: FileValidators) -> list[tuple[int, int]] | None:
+        """
+        Parses request's 'Range' header, respecting 'If-Range'
+        :param request: client request
+        :param validators: requested file validators
+        :return: list of (start, end) byte ranges, empty if none are satisfiable; None to send whole file
+        """
+
+        if request.type != RequestTypes.GET or (header_val := request.headers.get("range")) is None:
+            return
+
+        # range is only valid for unchanged file
+        if (if_range := request.headers.get("if-range")) is not None:
+            if if_range[:1] == '"' or if_range[:2] == "W/":
+                if if_range != validators.etag:  # strong comparison
+                    return
+            elif parse_http_date(if_range) != int(validators.last_modified):
+                return
+
+        unit, _, range_set = header_val.partition("=")
+        specs = range_set.split(",")
+        if unit.strip() != "bytes" or len(specs) > MAX_RANGES:
             return
 
-        LOGGER.debug(request)
-
-        response = Response(status=STATUS_CODE_NOT_FOUND)
-        if request.type == RequestTypes.GET:
-            if request.path in PathTree():
-                # fetch page info
-                page_class = PathTree.get(request.path)
-                page_data = page_class.get_data(
-                    path=request.path,
-                    locale=request.headers.get("accept-language"),
-                    **request.query_args)
-                headers = {"content-type": page_class.type}
-                response = Response(
-                    data=page_data,
-                    status=STATUS_CODE_OK,
-                    headers=headers)
-        await response.write(self.writer)
+        size = validators.size
+        ranges = []
+        for spec in specs:
+            first, sep, last = spec.strip().partition("-")
+            digits = first + last
+            if not sep or not digits.isascii() or not digits.isdigit():
+                return
+            if not first:  # last N bytes
+                start, end = max(size - int(last), 0), size
+            else:
+                start, end = int(first), size
+                if last:
+                    if int(last) < start:
+                        return
+                    end = min(int(last) + 1, size)
+            if start < end:
+                ranges.append((start, end))
+        return ranges
+
+    @staticmethod
+    async def _make_scripted_response(
+            request: Request,
+            page_class: Page,
+            headers: dict[str, str],
+            encoding: str,
+            locale: str | None
+    ) -> Response:
+        """
+        Makes response with generated page
+        """
+
+        page = await page_class.generate(
+            path=request.path,
+            locale=locale,
+            method=request.type,
+            data_stream=request.data_stream,
+            **{key: value for key, value in request.query_args.items() if key not in _RESERVED_ARGS})
+        if page.is_streamed:
+            return await ClientHandler._make_streamed_response(request, page, headers, encoding)
+
+        page_data = await page.get_data()
+        if len(page_data) < COMPRESSION_MIN_SIZE:
+            encoding = "identity"
+
+        etag = page.etag or make_etag(page_data)
+        headers["etag"] = etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+        last_modified = None
+        if page.last_modified:
+            last_modified = page.last_modified.timestamp()
+            headers["last-modified"] = format_http_date(last_modified)
+        if ClientHandler.is_not_modified(request, headers["etag"], last_modified):
+            return Response(status=STATUS_CODE_NOT_MODIFIED, headers=headers)
+
+        if encoding != "identity":
+            if page.encoded is not None and (compressed := page.encoded.get(encoding)) is not None:
+                page_data = compressed
+            else:  # cached page is worth compressing better, which is done in background
+                if page.encoded is not None:
+                    CompressionCache.compress_later(page_data, encoding, page.encoded)
+                page_data = compress(page_data, encoding)
+            headers["content-encoding"] = encoding
+
+        if request.type == RequestTypes.HEAD:
+            headers["content-length"] = str(len(page_data))
+            return Response(status=STATUS_CODE_OK, headers=headers)
+        return Response(
+            data=page_data,
+            status=STATUS_CODE_OK,
+            headers=headers)
+
+    @staticmethod
+    async def _make_streamed_response(
+            request: Request,
+            page: DummyPage,
+            headers: dict[str, str],
+            encoding: str
+    ) -> Response:
+        """
+        Makes response with page that's sent while it's being generated.
+        Its length isn't known, so it can only be validated by ETag the page provides
+        """
+
+        if page.etag:
+            headers["etag"] = page.etag if encoding == "identity" else f'{page.etag[:-1]}-{encoding}"'
+        last_modified = None
+        if page.last_modified:
+            last_modified = page.last_modified.timestamp()
+            headers["last-modified"] = format_http_date(last_modified)
+        if page.etag or last_modified is not None:
+            if ClientHandler.is_not_modified(request, headers.get("etag", ""), last_modified):
+                return Response(status=STATUS_CODE_NOT_MODIFIED, headers=headers)
+
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+
+        if request.type == RequestTypes.HEAD:
+            if request.version != "HTTP/1.0":
+                headers["transfer-encoding"] = "chunked"
+            return Response(status=STATUS_CODE_OK, headers=headers)
+
+        page_data = await page.get_data()
+        return Response(
+            data=page_data if encoding == "identity" else compress_stream(page_data, encoding),
+            status=STATUS_CODE_OK,
+            headers=headers)
+
+    @staticmethod
+    def is_not_modified(request: Request, etag: str, last_modified: float | None) -> bool:
+        """
+        Checks request's conditional headers, 'If-None-Match' takes precedence over 'If-Modified-Since'
+        :param request: client request
+        :param etag: current ETag of the page
+        :param last_modified: page modification timestamp
+        :return: True if client's cached copy is still valid
+        """
+
+        if request.type != RequestTypes.GET and request.type != RequestTypes.HEAD:
+            return False
+
+        if (if_none_match := request.headers.get("if-none-match")) is not None:
+            if if_none_match.strip() == "*":
+                return True
+            return etag in {x.strip().removeprefix("W/") for x in if_none_match.split(",")}
+
+        if last_modified is not None and (if_modified_since := request.headers.get("if-modified-since")):
+            since = parse_http_date(if_modified_since)
+            return since is not None and int(last_modified) <= since
+        return False
+
+    def is_keep_alive(self, request: Request) -> bool:
+        """
+        Checks if the connection can be reused after given request
+        :param request: client request
+        :return: True if connection is persistent
+        """
+
+        if self.request_count >= KEEP_ALIVE_MAX_REQUESTS:
+            return False
+
+        options = {x.strip().lower() for x in request.headers.get("connection", "").split(",")}
+        if request.version == "HTTP/1.0":  # persistent only when asked for
+            return "keep-alive" in options
+        return "close" not in options
 
     def close(self) -> None:
         """
         Closes client connection
         """
 
+        if self.deadline is not None:
+            self.deadline.cancel()
         self.writer.close()
 
 
@@ -56,22 +550,16 @@ async def client_callback(reader: asyncio.StreamReader, writer: asyncio.StreamWr
     :return: Client handle
     """
 
-    client = ClientHandler(reader, writer)
+    peer = writer.get_extra_info("peername")
+    address = peer[0] if peer else ""
+    if not ClientHandler.admit(writer, address):
+        return
 
-    response = None
+    client = ClientHandler(reader, writer)
+    Metrics.active_connections += 1
     try:
-        await client.handle_client()
-    except ClientSideErrors as e:
-        response = Response(data=e.status.message.encode(), status=e.status)
-    except (Exception, ServerSideErrors) as e:
-        LOGGER.warning(f"Error occurred when handling client request:", exc_info=e)
-        response = Response(status=STATUS_CODE_INTERNAL_SERVER_ERROR)
-
-    # if there's an exception response
-    if response:
-        try:
-            await response.write(writer)
-        except Exception:  # I don't know what it raises
-            pass
-
-    client.close()
+        await client.serve()
+    finally:
+        Metrics.active_connections -= 1
+        ClientHandler.release(address)
+        client.close()
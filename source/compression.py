@@ -0,0 +1,236 @@
+import os
+import gzip
+import zlib
+import time
+import asyncio
+import logging
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Iterable, AsyncIterable, AsyncIterator
+from source.cache import CacheEntry
+from source.classes import iterate_chunks
+from source.settings import FILE_CACHE_REVALIDATE_INTERVAL
+from source.settings import COMPRESSION_MIN_SIZE, COMPRESSION_MAX_SIZE, COMPRESSION_WORKERS
+from source.settings import COMPRESSION_STATIC_BROTLI_QUALITY, COMPRESSION_STATIC_GZIP_LEVEL
+from source.settings import COMPRESSION_DYNAMIC_BROTLI_QUALITY, COMPRESSION_DYNAMIC_GZIP_LEVEL
+
+try:
+    import brotli
+except ImportError:  # fallback to gzip only
+    brotli = None
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+# encodings in order of preference
+ENCODINGS: list[str] = ["br", "gzip"] if brotli else ["gzip"]
+
+COMPRESSIBLE_TYPES: set[str] = {
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/json", "image/svg+xml"}
+
+
+def is_compressible(content_type: str) -> bool:
+    """
+    Checks if content of given type is worth compressing
+    :param content_type: MIME type
+    :return: True if compressible
+    """
+
+    return content_type in COMPRESSIBLE_TYPES
+
+
+@lru_cache(maxsize=256)
+def negotiate_encoding(header_val: str | None) -> str:
+    """
+    Chooses content encoding using 'Accept-Encoding' header in request
+    :param header_val: header value
+    :return: 'br', 'gzip' or 'identity'
+    """
+
+    if not header_val:
+        return "identity"
+
+    qualities = dict()
+    for coding in header_val.split(","):
+        name, _, params = coding.partition(";")
+        q = 1.0
+        if (params := params.strip())[:2] == "q=":
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name.strip().lower()] = q
+
+    best_q = 0.0
+    best_encoding = "identity"
+    for encoding in ENCODINGS:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best_q = q
+            best_encoding = encoding
+    return best_encoding
+
+
+def compress(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """
+    Compresses data
+    :param data: raw bytes
+    :param encoding: 'br' or 'gzip'
+    :param static: use maximum compression, for data that's compressed once
+    :return: compressed bytes
+    """
+
+    if encoding == "br":
+        quality = COMPRESSION_STATIC_BROTLI_QUALITY if static else COMPRESSION_DYNAMIC_BROTLI_QUALITY
+        return brotli.compress(data, quality=quality)
+    level = COMPRESSION_STATIC_GZIP_LEVEL if static else COMPRESSION_DYNAMIC_GZIP_LEVEL
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+async def compress_stream(chunks: Iterable | AsyncIterable, encoding: str) -> AsyncIterator[bytes]:
+    """
+    Compresses streamed body chunk by chunk.
+    An empty chunk flushes the compressor, so that what's been generated so far reaches the client
+    :param chunks: iterable or async iterable of raw chunks
+    :param encoding: 'br' or 'gzip'
+    :return: compressed chunks
+    """
+
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=COMPRESSION_DYNAMIC_BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:  # gzip container, with empty header
+        compressor = zlib.compressobj(COMPRESSION_DYNAMIC_GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)  # noqa
+
+    # compressor buffers small chunks, empty output isn't passed on, as it would flush the response
+    async for chunk in iterate_chunks(chunks):
+        if chunk:
+            if compressed := process(chunk):
+                yield compressed
+        else:
+            if compressed := flush():
+                yield compressed
+            yield b""
+    yield finish()
+
+
+class CompressionCache:
+    """
+    Compressed static files. Files are compressed on first hit, and recompressed when modified.
+    Maximum compression takes seconds on large files, so it's done by a background thread,
+    and files are sent as they are until it's done. Cached generated pages are compressed the same way
+    Files are revalidated at most once per 'FILE_CACHE_REVALIDATE_INTERVAL'
+    """
+
+    # (filepath, encoding): CacheEntry(compressed data, ...)
+    cache: dict[tuple[str, str], CacheEntry] = dict()
+    pending: set[tuple[str, str]] = set()  # files being compressed
+    executor: ThreadPoolExecutor | None = None
+
+    @classmethod
+    def get(cls, filepath: str, encoding: str) -> bytes | None:
+        """
+        Returns compressed file, starting its compression if it's not compressed yet
+        :param filepath: path to file
+        :param encoding: 'br' or 'gzip'
+        :return: compressed bytes, None if file is not worth compressing, or is still being compressed
+        """
+
+        key = (filepath, encoding)
+        entry = cls.cache.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked < FILE_CACHE_REVALIDATE_INTERVAL:
+            return entry.data
+
+        stat = os.stat(filepath)
+        if entry is not None and entry.mtime == stat.st_mtime_ns and entry.size == stat.st_size:
+            entry.checked = now
+            return entry.data
+
+        # modified file isn't sent compressed until it's recompressed
+        cls.cache.pop(key, None)
+        if not COMPRESSION_MIN_SIZE <= stat.st_size <= COMPRESSION_MAX_SIZE or key in cls.pending:
+            return
+
+        cls.pending.add(key)
+        future = asyncio.get_running_loop().run_in_executor(cls.get_executor(), _compress_file, filepath, encoding)
+        future.add_done_callback(lambda done: cls._compressed(key, done))
+
+    @classmethod
+    def compress_later(cls, data: bytes, encoding: str, encoded: dict[str, bytes | None]) -> None:
+        """
+        Compresses data with maximum compression in background, for cached pages
+        :param data: raw bytes
+        :param encoding: 'br' or 'gzip'
+        :param encoded: 'content-encoding': compressed data, where result is put. None while it's being compressed
+        """
+
+        if encoding in encoded:
+            return
+        encoded[encoding] = None
+        future = asyncio.get_running_loop().run_in_executor(cls.get_executor(), compress, data, encoding, True)
+        future.add_done_callback(lambda done: cls._compressed_data(encoding, encoded, done))
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """
+        Returns compression executor, creating it if needed
+        """
+
+        if cls.executor is None:
+            cls.executor = ThreadPoolExecutor(COMPRESSION_WORKERS, thread_name_prefix="compression")
+        return cls.executor
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Stops compression threads, dropping queued compressions
+        """
+
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False, cancel_futures=True)
+            cls.executor = None
+
+    @classmethod
+    def _compressed(cls, key: tuple[str, str], future: asyncio.Future) -> None:
+        """
+        Caches compressed file
+        """
+
+        cls.pending.discard(key)
+        if future.cancelled():
+            return
+        if (error := future.exception()) is not None:
+            LOGGER.warning(f"Failed to compress '{key[0]}': {error}")
+            return
+        data, mtime, size = future.result()
+        cls.cache[key] = CacheEntry(data, mtime, size)
+        LOGGER.info(f"Compressed '{key[0]}' using '{key[1]}': {size} -> {len(data)} bytes")
+
+
+    @staticmethod
+    def _compressed_data(encoding: str, encoded: dict[str, bytes | None], future: asyncio.Future) -> None:
+        """
+        Puts compressed data where it was requested
+        """
+
+        if not future.cancelled() and future.exception() is None:
+            encoded[encoding] = future.result()
+        elif encoded.get(encoding, b"") is None:  # may be compressed again later
+            del encoded[encoding]
+
+
+def _compress_file(filepath: str, encoding: str) -> tuple[bytes, int, int]:
+    """
+    Compresses file, in compression thread
+    :return: compressed data, file's mtime and size when it was read
+    """
+
+    with open(filepath, "rb") as file:
+        stat = os.fstat(file.fileno())
+        data = file.read()
+    return compress(data, encoding, static=True), stat.st_mtime_ns, stat.st_size
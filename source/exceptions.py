@@ -9,6 +9,10 @@ class ClientSideErrors(Exception):
     status = STATUS_CODE_BAD_REQUEST
 
 
+class BadRequestError(ClientSideErrors):
+    status = STATUS_CODE_BAD_REQUEST
+
+
 class NotFoundError(ClientSideErrors):
     status = STATUS_CODE_NOT_FOUND
 
@@ -17,6 +21,34 @@ class ForbiddenError(ClientSideErrors):
     status = STATUS_CODE_FORBIDDEN
 
 
+class PayloadTooLargeError(ClientSideErrors):
+    status = STATUS_CODE_PAYLOAD_TOO_LARGE
+
+
+class URITooLongError(ClientSideErrors):
+    status = STATUS_CODE_URI_TOO_LONG
+
+
+class HeaderFieldsTooLargeError(ClientSideErrors):
+    status = STATUS_CODE_REQUEST_HEADER_FIELDS_TOO_LARGE
+
+
+class RequestTimeoutError(ClientSideErrors):
+    status = STATUS_CODE_REQUEST_TIMEOUT
+
+
+class HTTP2Requested(Exception):
+    """
+    Client started HTTP/2 connection with prior knowledge, instead of sending HTTP/1.1 request
+    """
+
+
+class ConnectionStalledError(Exception):
+    """
+    Client stopped reading the response, so the connection can only be dropped
+    """
+
+
 class ServerSideErrors(Exception):
     """
     O no :<
@@ -27,3 +59,7 @@ class ServerSideErrors(Exception):
 
 class InternalServerError(ServerSideErrors):
     status = STATUS_CODE_INTERNAL_SERVER_ERROR
+
+
+class ServiceUnavailableError(ServerSideErrors):
+    status = STATUS_CODE_SERVICE_UNAVAILABLE
@@ -1,76 +1,194 @@
-class _CharIter:
-    def __init__(self, string: str):
-        self.string: str = string
-        self._count: int = -1
+import re
+import html
+from email.utils import formatdate, parsedate_to_datetime
 
-    def next(self) -> str | None:
-        self._count += 1
-        return self.string[self._count] if self._count < len(self.string) else None
 
-    def prev(self) -> str | None:
-        self._count -= 1
-        return self.string[self._count] if self._count > -1 else None
-
-    def is_done(self):
-        if self._count+1 >= len(self.string):
-            return True
-        return False
+def format_http_date(timestamp: float) -> str:
+    """
+    Formats timestamp as HTTP date
+    :param timestamp: unix timestamp
+    :return: date string, like 'Sun, 06 Nov 1994 08:49:37 GMT'
+    """
 
-    @property
-    def count(self) -> int:
-        return self._count
+    return formatdate(timestamp, usegmt=True)
 
 
-def parse_md2html(text: str) -> str:
+def parse_http_date(date: str) -> float | None:
     """
-    Parses md to html
-    :param text: md formatted string
-    :return: html formatted string list
+    Parses HTTP date
+    :param date: date string
+    :return: unix timestamp, None if date is malformed
     """
 
-    out = ""
-    text = text.replace("\r", "").replace("  \n", "\n")
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+# block level markdown
+_FENCE: re.Pattern = re.compile(r"```[ \t]*([\w+-]*)")
+_HEADER: re.Pattern = re.compile(r"(#{1,6})#* ?(.*)")
+_LIST_ITEM: re.Pattern = re.compile(r"[ \t]*(?:([-+*])|\d{1,9}[.)])[ \t]+(.*)")
+
+# inline markdown
+_INLINE_START: re.Pattern = re.compile(r"[`\[*]")
+_WHITESPACE: re.Pattern = re.compile(r"\s")
+
+
+def _render_inline(text: str, out: list[str]) -> None:
+    """
+    Renders inline markdown of a single block. Emphasis left open is closed at the end of the block.
+    Closing delimiters are looked up with 'str.find' and remembered, so unclosed spans
+    don't make the scan quadratic
+    :param text: html escaped block text
+    :param out: output list
+    """
 
     is_bold = False
     is_italics = False
 
-    header = 0
+    # 'delimiter': position of its next occurrence, -1 if there are none left
+    next_found: dict[str, int] = dict()
+
+    def find(delimiter: str, start: int) -> int:
+        found = next_found.get(delimiter, -2)
+        if found != -1 and found < start:
+            found = next_found[delimiter] = text.find(delimiter, start)
+        return found
 
-    iterator = _CharIter(text)
-    while not iterator.is_done():
-        char = iterator.next()
-        if char == "*":  # bold / italics
-            if iterator.next() == "*":  # bold
+    def find_whitespace(start: int) -> int:
+        found = next_found.get("\\s", -2)
+        if found != -1 and found < start:
+            found = next_found["\\s"] = match.start() if (match := _WHITESPACE.search(text, start)) else -1
+        return found
+
+    position = 0
+    search_from = 0
+    while (match := _INLINE_START.search(text, search_from)) is not None:
+        start = match.start()
+        char = text[start]
+        if char == "*":
+            out.append(text[position:start].replace("\n", "<br>"))
+            if text.startswith("**", start):
                 is_bold = not is_bold
-                if is_bold:
-                    out += "<b>"
-                else:
-                    out += "</b>"
-            else:  # italics
-                iterator.prev()
+                out.append("<b>" if is_bold else "</b>")
+                position = search_from = start + 2
+            else:
                 is_italics = not is_italics
-                if is_italics:
-                    out += "<i>"
-                else:
-                    out += "</i>"
+                out.append("<i>" if is_italics else "</i>")
+                position = search_from = start + 1
+
+        elif char == "`":  # inline code, delimited by a run of one or two backticks
+            ticks = "``" if text.startswith("``", start) else "`"
+            end = find(ticks, start + len(ticks) + 1)
+            if end == -1 or text.find("\n", start, end) != -1:
+                search_from = start + len(ticks)
+                continue
+            out.append(text[position:start].replace("\n", "<br>"))
+            out.append(f"<code>{text[start + len(ticks):end]}</code>")
+            position = search_from = end + len(ticks)
+
+        else:  # link, '[text](url)'
+            end = find("]", start + 1)
+            target_end = -1
+            if (end > start + 1 and text.startswith("(", end + 1) and
+                    text.find("[", start + 1, end) == -1 and text.find("\n", start, end) == -1):
+                # url ends with ')', and can't be empty or contain whitespace
+                target_end = find(")", end + 2)
+                whitespace = find_whitespace(end + 2)
+                if target_end == end + 2 or whitespace != -1 and whitespace < target_end:
+                    target_end = -1
+            if target_end == -1:
+                search_from = start + 1
+                continue
+
+            # text is already escaped, so only quotes are left
+            url = text[end + 2:target_end].replace("\"", "&quot;")
+            out.append(text[position:start].replace("\n", "<br>"))
+            out.append(f"<a href=\"{url}\">{text[start + 1:end]}</a>")
+            position = search_from = target_end + 1
+    out.append(text[position:].replace("\n", "<br>"))
+
+    if is_italics:
+        out.append("</i>")
+    if is_bold:
+        out.append("</b>")
+
+
+def parse_md2html(text: str) -> str:
+    """
+    Parses md to html. Supports headers, paragraphs, lists, fenced code blocks,
+    bold, italics, inline code and links. Lines inside a paragraph are separated with line breaks
+    :param text: md formatted string
+    :return: html formatted string
+    """
+
+    text = html.escape(text.replace("\r", "").replace("  \n", "\n"), quote=False)
+    lines = text.split("\n")
+
+    out = []
+    paragraph = []
+    list_tag = None
+
+    def close_blocks():
+        nonlocal list_tag
+        if paragraph:
+            out.append("<p>")
+            _render_inline("\n".join(paragraph), out)
+            out.append("</p>")
+            paragraph.clear()
+        if list_tag:
+            out.append(f"</{list_tag}>")
+            list_tag = None
+
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+
+        # fenced code block, contents are left as is
+        if line.startswith("```"):
+            close_blocks()
+            language = _FENCE.match(line).group(1)
+            end = index
+            while end < len(lines) and not lines[end].startswith("```"):
+                end += 1
+            out.append(f"<pre><code class=\"language-{language}\">" if language else "<pre><code>")
+            out.append("\n".join(lines[index:end]))
+            out.append("</code></pre>")
+            index = end + 1
             continue
-        if char == "\n":
-            if header > 0:
-                out += f"</h{header}>"
-                header = 0
-            else:
-                out += "<br>"
+
+        # header
+        if line.startswith("#"):
+            close_blocks()
+            match = _HEADER.match(line)
+            level = len(match.group(1))
+            out.append(f"<h{level}>")
+            _render_inline(match.group(2), out)
+            out.append(f"</h{level}>")
             continue
-        if char == "#":
-            header = 1
-            while (char := iterator.next()) == "#":
-                header += 1
-            if char != " ":  # not '# Text', but `#Text` thing
-                iterator.prev()
-            out += f"<h{header}>"
-            is_header = True
+
+        # list item
+        if (match := _LIST_ITEM.match(line)) is not None:
+            tag = "ul" if match.group(1) else "ol"
+            if tag != list_tag:
+                close_blocks()
+                out.append(f"<{tag}>")
+                list_tag = tag
+            out.append("<li>")
+            _render_inline(match.group(2), out)
+            out.append("</li>")
             continue
 
-        out += char
+        # paragraph text, blank lines end paragraphs
+        if line.strip():
+            if list_tag:
+                close_blocks()
+            paragraph.append(line)
+        else:
+            close_blocks()
+    close_blocks()
 
-    return out
+    return "".join(out)
@@ -0,0 +1,448 @@
+from collections import deque
+
+
+class HPACKError(Exception):
+    """
+    Header block can't be decoded, connection has to be closed with COMPRESSION_ERROR
+    """
+
+
+STATIC_TABLE: tuple[tuple[str, str], ...] = (
+    (":authority", ""), (":method", "GET"), (":method", "POST"), (":path", "/"), (":path", "/index.html"),
+    (":scheme", "http"), (":scheme", "https"), (":status", "200"), (":status", "204"), (":status", "206"),
+    (":status", "304"), (":status", "400"), (":status", "404"), (":status", "500"), ("accept-charset", ""),
+    ("accept-encoding", "gzip, deflate"), ("accept-language", ""), ("accept-ranges", ""), ("accept", ""),
+    ("access-control-allow-origin", ""), ("age", ""), ("allow", ""), ("authorization", ""),
+    ("cache-control", ""), ("content-disposition", ""), ("content-encoding", ""), ("content-language", ""),
+    ("content-length", ""), ("content-location", ""), ("content-range", ""), ("content-type", ""),
+    ("cookie", ""), ("date", ""), ("etag", ""), ("expect", ""), ("expires", ""), ("from", ""), ("host", ""),
+    ("if-match", ""), ("if-modified-since", ""), ("if-none-match", ""), ("if-range", ""),
+    ("if-unmodified-since", ""), ("last-modified", ""), ("link", ""), ("location", ""), ("max-forwards", ""),
+    ("proxy-authenticate", ""), ("proxy-authorization", ""), ("range", ""), ("referer", ""), ("refresh", ""),
+    ("retry-after", ""), ("server", ""), ("set-cookie", ""), ("strict-transport-security", ""),
+    ("transfer-encoding", ""), ("user-agent", ""), ("vary", ""), ("via", ""), ("www-authenticate", ""))
+
+# (name, value): static index, name: first static index with that name
+_STATIC_PAIRS: dict[tuple[str, str], int] = {pair: i + 1 for i, pair in reversed(list(enumerate(STATIC_TABLE)))}
+_STATIC_NAMES: dict[str, int] = {name: i + 1 for i, (name, _) in reversed(list(enumerate(STATIC_TABLE)))}
+
+# headers whose values rarely repeat, indexing them would only churn the dynamic table
+_NOT_INDEXED: frozenset[str] = frozenset((
+    "content-length", "content-range", "etag", "last-modified", ":path", "if-none-match", "if-modified-since"))
+
+# headers that intermediaries must never index either
+_NEVER_INDEXED: frozenset[str] = frozenset(("authorization", "cookie", "set-cookie", "proxy-authorization"))
+
+# every entry takes this much space in the dynamic table on top of name and value
+_ENTRY_OVERHEAD: int = 32
+
+DEFAULT_TABLE_SIZE: int = 4096
+
+# Huffman code lengths of symbols 0-255 and EOS (RFC 7541, Appendix B).
+# The code is canonical, so codes themselves follow from the lengths
+HUFFMAN_LENGTHS: tuple[int, ...] = (
+    13, 23, 28, 28, 28, 28, 28, 28, 28, 24, 30, 28, 28, 30, 28, 28,
+    28, 28, 28, 28, 28, 28, 30, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+    6, 10, 10, 12, 13, 6, 8, 11, 10, 10, 8, 11, 8, 6, 6, 6,
+    5, 5, 5, 6, 6, 6, 6, 6, 6, 6, 7, 8, 15, 6, 12, 10,
+    13, 6, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7, 7,
+    7, 7, 7, 7, 7, 7, 7, 7, 8, 7, 8, 13, 19, 13, 14, 6,
+    15, 5, 6, 5, 6, 5, 6, 6, 6, 5, 7, 7, 6, 6, 6, 5,
+    6, 7, 6, 5, 5, 6, 7, 7, 7, 7, 7, 15, 11, 14, 13, 28,
+    20, 22, 20, 20, 22, 22, 22, 23, 22, 23, 23, 23, 23, 23, 24, 23,
+    24, 24, 22, 23, 24, 23, 23, 23, 23, 21, 22, 23, 22, 23, 23, 24,
+    22, 21, 20, 22, 22, 23, 23, 21, 23, 22, 22, 24, 21, 22, 23, 23,
+    21, 21, 22, 21, 23, 22, 23, 23, 20, 22, 22, 22, 23, 22, 22, 23,
+    26, 26, 20, 19, 22, 23, 22, 25, 26, 26, 26, 27, 27, 26, 24, 25,
+    19, 21, 26, 27, 27, 26, 27, 24, 21, 21, 26, 26, 28, 27, 27, 27,
+    20, 24, 20, 21, 22, 21, 21, 23, 22, 22, 25, 25, 24, 24, 26, 23,
+    26, 27, 26, 26, 27, 27, 27, 27, 27, 28, 27, 27, 27, 27, 27, 26,
+    30)
+_EOS: int = 256
+
+
+def _make_huffman_codes() -> list[int]:
+    """
+    Assigns canonical codes in order of length, then symbol
+    """
+
+    codes = [0] * len(HUFFMAN_LENGTHS)
+    code = 0
+    previous = 0
+    for length, symbol in sorted((length, symbol) for symbol, length in enumerate(HUFFMAN_LENGTHS)):
+        code <<= length - previous
+        codes[symbol] = code
+        code += 1
+        previous = length
+    return codes
+
+
+def _make_huffman_decoder() -> tuple[list[tuple[int, bytes, bool]], frozenset[int]]:
+    """
+    Makes decoding state machine that consumes 4 bits at a time.
+    States are internal nodes of the code tree
+    :return: transitions indexed by 'state * 16 + nibble' -> (next state, decoded bytes, failed),
+    and states in which decoding may end
+    """
+
+    children = [[0, 0]]  # internal nodes, leaves are stored as '~symbol'
+    for symbol, (code, length) in enumerate(zip(HUFFMAN_CODES, HUFFMAN_LENGTHS)):
+        node = 0
+        for shift in range(length - 1, 0, -1):
+            bit = (code >> shift) & 1
+            if children[node][bit] == 0:
+                children.append([0, 0])
+                children[node][bit] = len(children) - 1
+            node = children[node][bit]
+        children[node][code & 1] = ~symbol
+
+    transitions = []
+    for state in range(len(children)):
+        for nibble in range(16):
+            node = state
+            out = bytearray()
+            failed = False
+            for shift in (3, 2, 1, 0):
+                child = children[node][(nibble >> shift) & 1]
+                if child < 0:
+                    if ~child == _EOS:  # EOS inside string is an error
+                        failed = True
+                        break
+                    out.append(~child)
+                    node = 0
+                else:
+                    node = child
+            transitions.append((node, bytes(out), failed))
+
+    # padding is a prefix of EOS, which is all ones, shorter than a byte
+    accepting = {0}
+    node = 0
+    for _ in range(7):
+        node = children[node][1]
+        accepting.add(node)
+    return transitions, frozenset(accepting)
+
+
+HUFFMAN_CODES: list[int] = _make_huffman_codes()
+_HUFFMAN_TRANSITIONS, _HUFFMAN_ACCEPTING = _make_huffman_decoder()
+
+
+def huffman_encode(data: bytes) -> bytes:
+    """
+    Huffman encodes string, padding it with ones
+    """
+
+    value = 0
+    bits = 0
+    for byte in data:
+        length = HUFFMAN_LENGTHS[byte]
+        value = (value << length) | HUFFMAN_CODES[byte]
+        bits += length
+    padding = -bits % 8
+    value = (value << padding) | ((1 << padding) - 1)
+    return value.to_bytes((bits + padding) // 8, "big")
+
+
+def huffman_decode(data: bytes) -> bytes:
+    """
+    Decodes Huffman encoded string
+    """
+
+    transitions = _HUFFMAN_TRANSITIONS
+    state = 0
+    out = []
+    for byte in data:
+        state, emitted, failed = transitions[(state << 4) | (byte >> 4)]
+        if failed:
+            raise HPACKError("EOS in string")
+        if emitted:
+            out.append(emitted)
+        state, emitted, failed = transitions[(state << 4) | (byte & 15)]
+        if failed:
+            raise HPACKError("EOS in string")
+        if emitted:
+            out.append(emitted)
+    if state not in _HUFFMAN_ACCEPTING:
+        raise HPACKError("Bad string padding")
+    return b"".join(out)
+
+
+def _huffman_size(data: bytes) -> int:
+    """
+    Length of Huffman encoded string in bytes
+    """
+
+    return (sum(HUFFMAN_LENGTHS[byte] for byte in data) + 7) // 8
+
+
+def encode_integer(value: int, prefix: int, flags: int = 0) -> bytes:
+    """
+    Encodes integer with N-bit prefix
+    :param value: integer
+    :param prefix: number of bits in first byte
+    :param flags: bits of first byte above the prefix
+    """
+
+    limit = (1 << prefix) - 1
+    if value < limit:
+        return bytes((flags | value,))
+    out = bytearray((flags | limit,))
+    value -= limit
+    while value >= 128:
+        out.append((value & 127) | 128)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_integer(data: bytes, offset: int, prefix: int) -> tuple[int, int]:
+    """
+    Decodes integer with N-bit prefix
+    :return: value, offset after it
+    """
+
+    limit = (1 << prefix) - 1
+    try:
+        value = data[offset] & limit
+        offset += 1
+        if value < limit:
+            return value, offset
+        shift = 0
+        while True:
+            byte = data[offset]
+            offset += 1
+            value += (byte & 127) << shift
+            if not byte & 128:
+                return value, offset
+            shift += 7
+            if shift > 28:  # way larger than any table or string
+                raise HPACKError("Integer too large")
+    except IndexError:
+        raise HPACKError("Truncated integer")
+
+
+def encode_string(value: str) -> bytes:
+    """
+    Encodes string literal, Huffman encoded if that's shorter
+    """
+
+    data = value.encode("latin-1")
+    if (size := _huffman_size(data)) < len(data):
+        return encode_integer(size, 7, 0x80) + huffman_encode(data)
+    return encode_integer(len(data), 7) + data
+
+
+def decode_string(data: bytes, offset: int) -> tuple[str, int]:
+    """
+    Decodes string literal
+    :return: string, offset after it
+    """
+
+    is_huffman = data[offset] & 0x80 if offset < len(data) else 0
+    length, offset = decode_integer(data, offset, 7)
+    end = offset + length
+    if end > len(data):
+        raise HPACKError("Truncated string")
+    raw = data[offset:end]
+    return (huffman_decode(raw) if is_huffman else raw).decode("latin-1"), end
+
+
+class _DynamicTable:
+    """
+    Table of recently sent headers, newest entry first
+    """
+
+    def __init__(self, max_size: int):
+        self.entries: deque[tuple[str, str]] = deque()
+        self.size: int = 0
+        self.max_size: int = max_size
+
+    def add(self, name: str, value: str) -> list[tuple[str, str]]:
+        """
+        Adds entry, evicting old ones to fit it
+        :return: evicted entries
+        """
+
+        entry_size = len(name) + len(value) + _ENTRY_OVERHEAD
+        evicted = self._evict(self.max_size - entry_size)
+        if entry_size <= self.max_size:  # larger entry just empties the table
+            self.entries.appendleft((name, value))
+            self.size += entry_size
+        return evicted
+
+    def resize(self, max_size: int) -> list[tuple[str, str]]:
+        """
+        Changes table size
+        :return: evicted entries
+        """
+
+        self.max_size = max_size
+        return self._evict(max_size)
+
+    def _evict(self, size: int) -> list[tuple[str, str]]:
+        evicted = []
+        while self.entries and self.size > size:
+            name, value = entry = self.entries.pop()
+            self.size -= len(name) + len(value) + _ENTRY_OVERHEAD
+            evicted.append(entry)
+        return evicted
+
+
+class Decoder:
+    """
+    Decodes HPACK (RFC 7541) header blocks of a single connection
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TABLE_SIZE):
+        """
+        :param max_size: dynamic table size advertised in SETTINGS_HEADER_TABLE_SIZE
+        """
+
+        self.table: _DynamicTable = _DynamicTable(max_size)
+        self.max_size: int = max_size
+
+    def _get(self, index: int) -> tuple[str, str]:
+        if 0 < index <= len(STATIC_TABLE):
+            return STATIC_TABLE[index - 1]
+        try:
+            return self.table.entries[index - len(STATIC_TABLE) - 1]
+        except IndexError:
+            raise HPACKError(f"Bad index {index}")
+
+    def decode(self, data: bytes, max_list_size: int | None = None) -> list[tuple[str, str]]:
+        """
+        Decodes header block
+        :param data: complete header block
+        :param max_list_size: limit of decoded size, counted as in SETTINGS_MAX_HEADER_LIST_SIZE
+        :return: list of (name, value) pairs, in order
+        """
+
+        headers = []
+        list_size = 0
+        offset = 0
+        can_resize = True  # size updates are only allowed at the beginning of block
+        while offset < len(data):
+            byte = data[offset]
+            if byte & 0x80:  # indexed
+                index, offset = decode_integer(data, offset, 7)
+                name, value = self._get(index)
+            elif byte & 0x40:  # literal with incremental indexing
+                index, offset = decode_integer(data, offset, 6)
+                name, offset = (self._get(index)[0], offset) if index else decode_string(data, offset)
+                value, offset = decode_string(data, offset)
+                self.table.add(name, value)
+            elif byte & 0x20:  # dynamic table size update
+                if not can_resize:
+                    raise HPACKError("Late table size update")
+                size, offset = decode_integer(data, offset, 5)
+                if size > self.max_size:
+                    raise HPACKError("Table size over the limit")
+                self.table.resize(size)
+                continue
+            else:  # literal without indexing, or never indexed
+                index, offset = decode_integer(data, offset, 4)
+                name, offset = (self._get(index)[0], offset) if index else decode_string(data, offset)
+                value, offset = decode_string(data, offset)
+            can_resize = False
+
+            list_size += len(name) + len(value) + _ENTRY_OVERHEAD
+            if max_list_size is not None and list_size > max_list_size:
+                raise HPACKError("Header list too large")
+            headers.append((name, value))
+        return headers
+
+
+class Encoder:
+    """
+    Encodes HPACK (RFC 7541) header blocks of a single connection
+    """
+
+    def __init__(self, max_size: int = DEFAULT_TABLE_SIZE):
+        """
+        :param max_size: dynamic table size, up to peer's SETTINGS_HEADER_TABLE_SIZE
+        """
+
+        self.table: _DynamicTable = _DynamicTable(max_size)
+
+        # entries are numbered as they're added, so that their index can be found without searching the table
+        self.added: int = 0
+        self.pairs: dict[tuple[str, str], int] = dict()
+        self.names: dict[str, int] = dict()
+
+        self._resize: int | None = None
+
+    def resize(self, max_size: int) -> None:
+        """
+        Changes dynamic table size, when peer changes SETTINGS_HEADER_TABLE_SIZE.
+        Change is signalled at the beginning of next header block
+        """
+
+        self._resize = max_size if self._resize is None else min(self._resize, max_size)
+        self._forget(self.table.resize(max_size))
+
+    def _forget(self, evicted: list[tuple[str, str]]) -> None:
+        """
+        Removes evicted entries from lookup dicts
+        """
+
+        # lookups may point to newer entries with the same name or value, those are kept
+        oldest = self.added - len(self.table.entries) + 1
+        for name, value in evicted:
+            if self.pairs.get((name, value), oldest) < oldest:
+                del self.pairs[(name, value)]
+            if self.names.get(name, oldest) < oldest:
+                del self.names[name]
+
+    def _index(self, number: int) -> int:
+        """
+        Index of entry with given number, newest entry is right after the static table
+        """
+
+        return len(STATIC_TABLE) + 1 + self.added - number
+
+    def encode(self, headers: list[tuple[str, str]]) -> bytes:
+        """
+        Encodes header block
+        :param headers: list of (name, value) pairs, names in lowercase
+        :return: header block
+        """
+
+        out = []
+        if self._resize is not None:
+            if self._resize < self.table.max_size:  # table was shrunk then grown
+                out.append(encode_integer(self._resize, 5, 0x20))
+            out.append(encode_integer(self.table.max_size, 5, 0x20))
+            self._resize = None
+
+        for name, value in headers:
+            pair = (name, value)
+            if (index := _STATIC_PAIRS.get(pair)) is not None:
+                out.append(encode_integer(index, 7, 0x80))
+                continue
+            if (number := self.pairs.get(pair)) is not None:
+                out.append(encode_integer(self._index(number), 7, 0x80))
+                continue
+
+            if (index := _STATIC_NAMES.get(name)) is None and (number := self.names.get(name)) is not None:
+                index = self._index(number)
+
+            if name in _NEVER_INDEXED:
+                prefix, flags = 4, 0x10
+            elif name in _NOT_INDEXED:
+                prefix, flags = 4, 0
+            else:
+                prefix, flags = 6, 0x40
+            out.append(encode_integer(index or 0, prefix, flags))
+            if not index:
+                out.append(encode_string(name))
+            out.append(encode_string(value))
+
+            if flags == 0x40:
+                fits = len(name) + len(value) + _ENTRY_OVERHEAD <= self.table.max_size
+                evicted = self.table.add(name, value)
+                if fits:
+                    self.added += 1
+                    self.pairs[pair] = self.added
+                    self.names[name] = self.added
+                self._forget(evicted)
+        return b"".join(out)
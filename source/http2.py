@@ -0,0 +1,821 @@
+import time
+import struct
+import asyncio
+import logging
+from collections import deque
+from source.classes import *
+from source.metrics import Metrics
+from source.access_log import AccessLog
+from source.exceptions import *
+from source.hpack import Encoder, Decoder, HPACKError, DEFAULT_TABLE_SIZE
+from source.settings import HTTP2_MAX_STREAMS, HTTP2_WINDOW_SIZE, HTTP2_STREAM_BUFFER
+from source.settings import KEEP_ALIVE_TIMEOUT, HEADER_TIMEOUT, BODY_TIMEOUT, WRITE_TIMEOUT
+from source.settings import MAX_REQUEST_HEAD_SIZE, MAX_HEADERS, MAX_BODY_SIZE
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+PREFACE: bytes = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+# frame types
+FRAME_DATA: int = 0x0
+FRAME_HEADERS: int = 0x1
+FRAME_PRIORITY: int = 0x2
+FRAME_RST_STREAM: int = 0x3
+FRAME_SETTINGS: int = 0x4
+FRAME_PUSH_PROMISE: int = 0x5
+FRAME_PING: int = 0x6
+FRAME_GOAWAY: int = 0x7
+FRAME_WINDOW_UPDATE: int = 0x8
+FRAME_CONTINUATION: int = 0x9
+
+# frame flags
+FLAG_END_STREAM: int = 0x1
+FLAG_ACK: int = 0x1
+FLAG_END_HEADERS: int = 0x4
+FLAG_PADDED: int = 0x8
+FLAG_PRIORITY: int = 0x20
+
+# settings
+SETTINGS_HEADER_TABLE_SIZE: int = 0x1
+SETTINGS_ENABLE_PUSH: int = 0x2
+SETTINGS_MAX_CONCURRENT_STREAMS: int = 0x3
+SETTINGS_INITIAL_WINDOW_SIZE: int = 0x4
+SETTINGS_MAX_FRAME_SIZE: int = 0x5
+SETTINGS_MAX_HEADER_LIST_SIZE: int = 0x6
+
+# error codes
+NO_ERROR: int = 0x0
+PROTOCOL_ERROR: int = 0x1
+INTERNAL_ERROR: int = 0x2
+FLOW_CONTROL_ERROR: int = 0x3
+STREAM_CLOSED: int = 0x5
+FRAME_SIZE_ERROR: int = 0x6
+REFUSED_STREAM: int = 0x7
+CANCEL: int = 0x8
+COMPRESSION_ERROR: int = 0x9
+
+# length << 8 | type, flags, stream id
+FRAME_HEAD: struct.Struct = struct.Struct(">IBI")
+_SETTING: struct.Struct = struct.Struct(">HI")
+_UINT32: struct.Struct = struct.Struct(">I")
+
+DEFAULT_WINDOW_SIZE: int = 65535
+MAX_WINDOW_SIZE: int = 2 ** 31 - 1
+MAX_FRAME_SIZE: int = 2 ** 14  # largest frame the server accepts, which is the smallest allowed
+DEFAULT_WEIGHT: int = 16
+
+# headers that only make sense for HTTP/1.1 connection
+_CONNECTION_HEADERS: frozenset[str] = frozenset((
+    "connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"))
+
+
+def make_frame(frame_type: int, flags: int, stream_id: int, payload: bytes = b"") -> bytes:
+    """
+    Makes frame
+    """
+
+    return FRAME_HEAD.pack(len(payload) << 8 | frame_type, flags, stream_id) + payload
+
+
+class H2Error(Exception):
+    """
+    Protocol error. Errors of stream 0 close the connection, others only reset their stream
+    """
+
+    def __init__(self, code: int, message: str, stream_id: int = 0):
+        super().__init__(message)
+        self.code: int = code
+        self.stream_id: int = stream_id
+
+
+class H2RequestBody:
+    """
+    Request body received in DATA frames, same interface as 'RequestBody'.
+    Stream window is granted back as the body is read, so unread body can't pile up
+    """
+
+    def __init__(self, connection: "H2Connection", stream_id: int, length: int | None):
+        """
+        :param connection: HTTP/2 connection
+        :param stream_id: request stream
+        :param length: 'content-length' of the body, if client sent it
+        """
+
+        self.connection: H2Connection = connection
+        self.stream_id: int = stream_id
+        self.length: int | None = length
+        self.received: int = 0
+
+        self.window: int = HTTP2_WINDOW_SIZE  # bytes client may still send
+        self.is_ended: bool = False  # END_STREAM received
+
+        self._chunks: deque[bytes] = deque()
+        self._consumed: int = 0  # read bytes, not yet granted back
+        self._ready: asyncio.Event = asyncio.Event()
+        self._done: bool = False
+
+    @property
+    def is_done(self) -> bool:
+        """
+        True when the whole body was read
+        """
+
+        return self._done
+
+    def feed(self, data: bytes, end: bool) -> None:
+        """
+        Adds received data
+        :param data: DATA frame payload, without padding
+        :param end: that was the last frame
+        """
+
+        if data:
+            self._chunks.append(data)
+        self.is_ended = self.is_ended or end
+        self._ready.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._chunks:
+            if self.is_ended:
+                self._done = True
+                if self.length is not None and self.received != self.length:
+                    raise BadRequestError("Incomplete body")
+                raise StopAsyncIteration
+            self._ready.clear()
+            try:
+                async with asyncio.timeout(BODY_TIMEOUT):
+                    await self._ready.wait()
+            except TimeoutError:
+                Metrics.increment("timeouts_body")
+                raise RequestTimeoutError("Request body timed out")
+
+        data = self._chunks.popleft()
+        self.received += len(data)
+        if self.received > MAX_BODY_SIZE or (self.length is not None and self.received > self.length):
+            raise PayloadTooLargeError("Request body too large")
+
+        # grant window back in batches, half a window at a time
+        self._consumed += len(data)
+        if not self.is_ended and self._consumed >= HTTP2_WINDOW_SIZE // 2:
+            self.connection.send_window_update(self.stream_id, self._consumed)
+            self.window += self._consumed
+            self._consumed = 0
+        return data
+
+    async def read(self) -> bytes:
+        """
+        Reads the rest of the body at once
+        :return: body bytes
+        """
+
+        return b"".join([data async for data in self])
+
+
+class H2Stream:
+    """
+    Single request-response exchange
+    """
+
+    __slots__ = ("id", "weight", "window", "pending", "pending_size", "is_ended", "trailers",
+                 "body", "task", "virtual_time", "writable", "finished", "sent")
+
+    def __init__(self, stream_id: int, window: int, weight: int):
+        self.id: int = stream_id
+        self.weight: int = weight
+        self.window: int = window  # bytes peer allows to be sent on the stream
+
+        # response data waiting to be framed
+        self.pending: deque[memoryview] = deque()
+        self.pending_size: int = 0
+        self.is_ended: bool = False  # all response data is pending
+        self.trailers: dict[str, str] | None = None
+
+        self.body: H2RequestBody | None = None
+        self.task: asyncio.Task | None = None
+
+        self.virtual_time: float = 0  # bytes sent divided by weight, least served stream goes first
+        self.writable: asyncio.Event = asyncio.Event()  # set while pending data is below stream buffer size
+        self.writable.set()
+        self.finished: asyncio.Event = asyncio.Event()  # set when END_STREAM was sent
+        self.sent: int = 0
+
+
+class H2Connection:
+    """
+    HTTP/2 connection (RFC 9113). Streams are served concurrently, by the same handlers as HTTP/1.1 requests.
+    Response DATA is framed by a single sender, which respects flow control windows and stream priorities:
+    a stream waits while its parent has data to send, and siblings share bandwidth by weight
+    """
+
+    def __init__(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            handler_class: type,
+            preface_read: bool = False
+    ):
+        """
+        :param reader: client connection
+        :param writer: client stream
+        :param handler_class: 'ClientHandler', makes responses to requests
+        :param preface_read: first part of connection preface was already read as HTTP/1.1 request head
+        """
+
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.handler_class: type = handler_class
+        self.preface_read: bool = preface_read
+
+        self.encoder: Encoder = Encoder()
+        self.decoder: Decoder = Decoder()
+
+        self.streams: dict[int, H2Stream] = dict()
+        self.last_stream_id: int = 0
+        self.is_closing: bool = False  # GOAWAY was received
+
+        # 'stream id': [parent id, weight], includes idle and closed streams, which others may depend on
+        self.priorities: dict[int, list[int]] = dict()
+        self.virtual_time: float = 0
+
+        # peer's settings
+        self.window: int = DEFAULT_WINDOW_SIZE  # connection send window
+        self.initial_window: int = DEFAULT_WINDOW_SIZE
+        self.max_frame_size: int = MAX_FRAME_SIZE
+
+        self._header_block: tuple[int, int, bytearray] | None = None  # headers waiting for CONTINUATION
+        self._output: list[bytes | memoryview] = []  # frames written together by sender
+        self._output_size: int = 0
+        self._wakeup: asyncio.Event = asyncio.Event()  # wakes up sender
+
+    async def run(self) -> None:
+        """
+        Serves the connection until it's closed
+        """
+
+        sender = None
+        try:
+            try:
+                async with asyncio.timeout(HEADER_TIMEOUT):
+                    preface = await self.reader.readexactly(6 if self.preface_read else len(PREFACE))
+            except TimeoutError:
+                Metrics.increment("timeouts_header")
+                return
+            if preface != (PREFACE[-6:] if self.preface_read else PREFACE):
+                return
+
+            self._write(
+                make_frame(FRAME_SETTINGS, 0, 0, b"".join((
+                    _SETTING.pack(SETTINGS_MAX_CONCURRENT_STREAMS, HTTP2_MAX_STREAMS),
+                    _SETTING.pack(SETTINGS_INITIAL_WINDOW_SIZE, HTTP2_WINDOW_SIZE),
+                    _SETTING.pack(SETTINGS_MAX_HEADER_LIST_SIZE, MAX_REQUEST_HEAD_SIZE),
+                    _SETTING.pack(SETTINGS_ENABLE_PUSH, 0)))),
+                # connection window isn't limiting, streams' ones are
+                make_frame(FRAME_WINDOW_UPDATE, 0, 0, _UINT32.pack(MAX_WINDOW_SIZE - DEFAULT_WINDOW_SIZE)))
+            sender = asyncio.create_task(self._send_loop())
+            sender.add_done_callback(self._sender_done)
+
+            while not (self.is_closing and not self.streams):
+                try:
+                    frame_type, flags, stream_id, payload = await self._read_frame()
+                except TimeoutError:
+                    Metrics.increment("timeouts_idle")
+                    self._goaway(NO_ERROR)
+                    break
+                try:
+                    self._handle_frame(frame_type, flags, stream_id, payload)
+                except H2Error as e:
+                    if e.stream_id == 0:
+                        raise
+                    self._reset_stream(e.stream_id, e.code)
+        except H2Error as e:
+            LOGGER.debug(f"HTTP/2 connection error: {e}")
+            self._goaway(e.code)
+        except HPACKError as e:
+            LOGGER.debug(f"HTTP/2 compression error: {e}")
+            self._goaway(COMPRESSION_ERROR)
+        except (asyncio.IncompleteReadError, ConnectionError):  # connection closed
+            pass
+        finally:
+            for stream in self.streams.values():
+                if stream.task is not None:
+                    stream.task.cancel()
+            if sender is not None and not sender.done():
+                sender.cancel()
+                try:
+                    await sender
+                except (asyncio.CancelledError, ConnectionStalledError, ConnectionError):
+                    self.writer.transport.abort()
+
+    def _sender_done(self, sender: asyncio.Task) -> None:
+        """
+        Closes the connection when sender stops before it, streams would wait for it forever otherwise
+        """
+
+        if sender.cancelled():
+            return
+        error = sender.exception()
+        if isinstance(error, ConnectionStalledError | ConnectionError):  # client stopped reading or went away
+            LOGGER.debug(f"HTTP/2 sender stopped: {error!r}")
+        else:
+            LOGGER.warning(f"HTTP/2 sender failed:", exc_info=error)
+            Metrics.record_exception(error)
+        for stream in self.streams.values():
+            if stream.task is not None:
+                stream.task.cancel()
+        self.writer.transport.abort()
+
+    async def _read_frame(self) -> tuple[int, int, int, bytes]:
+        """
+        Reads next frame. Connection without streams is idle, and is closed after 'KEEP_ALIVE_TIMEOUT'
+        :return: frame type, flags, stream id, payload
+        """
+
+        async with asyncio.timeout(None if self.streams else KEEP_ALIVE_TIMEOUT):
+            head = await self.reader.readexactly(FRAME_HEAD.size)
+        length_type, flags, stream_id = FRAME_HEAD.unpack(head)
+        length = length_type >> 8
+        if length > MAX_FRAME_SIZE:
+            raise H2Error(FRAME_SIZE_ERROR, "Frame too large")
+        try:
+            async with asyncio.timeout(HEADER_TIMEOUT):
+                payload = await self.reader.readexactly(length) if length else b""
+        except TimeoutError:
+            Metrics.increment("timeouts_header")
+            raise H2Error(PROTOCOL_ERROR, "Frame timed out")
+        return length_type & 0xff, flags, stream_id & 0x7fffffff, payload
+
+    def _handle_frame(self, frame_type: int, flags: int, stream_id: int, payload: bytes) -> None:
+        """
+        Handles received frame
+        """
+
+        if self._header_block is not None:  # header block has to be continued right away
+            if frame_type != FRAME_CONTINUATION or stream_id != self._header_block[0]:
+                raise H2Error(PROTOCOL_ERROR, "Expected CONTINUATION")
+            block = self._header_block[2]
+            block += payload
+            if len(block) > MAX_REQUEST_HEAD_SIZE:
+                raise H2Error(PROTOCOL_ERROR, "Header block too large")
+            if flags & FLAG_END_HEADERS:
+                header_flags = self._header_block[1]
+                self._header_block = None
+                self._on_headers(stream_id, header_flags, bytes(block))
+            return
+
+        match frame_type:
+            case 0x0:  # DATA
+                self._on_data(stream_id, flags, payload)
+            case 0x1:  # HEADERS
+                if stream_id == 0:
+                    raise H2Error(PROTOCOL_ERROR, "HEADERS on stream 0")
+                payload = self._strip_padding(flags, payload)
+                if flags & FLAG_PRIORITY:
+                    if len(payload) < 5:
+                        raise H2Error(FRAME_SIZE_ERROR, "Short HEADERS")
+                    dependency, = _UINT32.unpack_from(payload)
+                    self._set_priority(stream_id, dependency & 0x7fffffff, payload[4] + 1, bool(dependency >> 31))
+                    payload = payload[5:]
+                if flags & FLAG_END_HEADERS:
+                    self._on_headers(stream_id, flags, payload)
+                else:
+                    self._header_block = (stream_id, flags, bytearray(payload))
+            case 0x2:  # PRIORITY
+                if stream_id == 0:
+                    raise H2Error(PROTOCOL_ERROR, "PRIORITY on stream 0")
+                if len(payload) != 5:
+                    raise H2Error(FRAME_SIZE_ERROR, "Bad PRIORITY", stream_id)
+                dependency, = _UINT32.unpack_from(payload)
+                self._set_priority(stream_id, dependency & 0x7fffffff, payload[4] + 1, bool(dependency >> 31))
+            case 0x3:  # RST_STREAM
+                if stream_id == 0 or len(payload) != 4:
+                    raise H2Error(PROTOCOL_ERROR, "Bad RST_STREAM")
+                if (stream := self.streams.pop(stream_id, None)) is not None:
+                    stream.finished.set()
+                    if stream.task is not None:
+                        stream.task.cancel()
+            case 0x4:  # SETTINGS
+                if stream_id != 0:
+                    raise H2Error(PROTOCOL_ERROR, "SETTINGS on a stream")
+                if flags & FLAG_ACK:
+                    return
+                if len(payload) % _SETTING.size:
+                    raise H2Error(FRAME_SIZE_ERROR, "Bad SETTINGS")
+                for offset in range(0, len(payload), _SETTING.size):
+                    self._apply_setting(*_SETTING.unpack_from(payload, offset))
+                self._write(make_frame(FRAME_SETTINGS, FLAG_ACK, 0))
+            case 0x5:  # PUSH_PROMISE, only servers push
+                raise H2Error(PROTOCOL_ERROR, "PUSH_PROMISE from client")
+            case 0x6:  # PING
+                if stream_id != 0:
+                    raise H2Error(PROTOCOL_ERROR, "PING on a stream")
+                if len(payload) != 8:
+                    raise H2Error(FRAME_SIZE_ERROR, "Bad PING")
+                if not flags & FLAG_ACK:
+                    self._write(make_frame(FRAME_PING, FLAG_ACK, 0, payload))
+            case 0x7:  # GOAWAY, streams that were started are still served
+                self.is_closing = True
+            case 0x8:  # WINDOW_UPDATE
+                if len(payload) != 4:
+                    raise H2Error(FRAME_SIZE_ERROR, "Bad WINDOW_UPDATE")
+                increment = _UINT32.unpack(payload)[0] & 0x7fffffff
+                if increment == 0:
+                    raise H2Error(PROTOCOL_ERROR, "Zero WINDOW_UPDATE", stream_id)
+                if stream_id == 0:
+                    self.window += increment
+                    if self.window > MAX_WINDOW_SIZE:
+                        raise H2Error(FLOW_CONTROL_ERROR, "Window too large")
+                elif (stream := self.streams.get(stream_id)) is not None:
+                    stream.window += increment
+                    if stream.window > MAX_WINDOW_SIZE:
+                        raise H2Error(FLOW_CONTROL_ERROR, "Window too large", stream_id)
+                self._wakeup.set()
+            case 0x9:  # CONTINUATION
+                raise H2Error(PROTOCOL_ERROR, "Unexpected CONTINUATION")
+            # unknown frame types are ignored
+
+    @staticmethod
+    def _strip_padding(flags: int, payload: bytes) -> bytes:
+        """
+        Removes padding from DATA or HEADERS payload
+        """
+
+        if not flags & FLAG_PADDED:
+            return payload
+        if not payload or payload[0] >= len(payload):
+            raise H2Error(PROTOCOL_ERROR, "Bad padding")
+        return payload[1:len(payload) - payload[0]]
+
+    def _apply_setting(self, setting: int, value: int) -> None:
+        """
+        Applies peer's setting
+        """
+
+        if setting == SETTINGS_HEADER_TABLE_SIZE:
+            self.encoder.resize(min(value, DEFAULT_TABLE_SIZE))
+        elif setting == SETTINGS_INITIAL_WINDOW_SIZE:
+            if value > MAX_WINDOW_SIZE:
+                raise H2Error(FLOW_CONTROL_ERROR, "Window too large")
+            for stream in self.streams.values():
+                stream.window += value - self.initial_window
+            self.initial_window = value
+            self._wakeup.set()
+        elif setting == SETTINGS_MAX_FRAME_SIZE:
+            if not MAX_FRAME_SIZE <= value < 2 ** 24:
+                raise H2Error(PROTOCOL_ERROR, "Bad frame size")
+            self.max_frame_size = value
+
+    def _set_priority(self, stream_id: int, parent: int, weight: int, exclusive: bool) -> None:
+        """
+        Moves stream in dependency tree
+        """
+
+        if parent == stream_id:
+            raise H2Error(PROTOCOL_ERROR, "Stream depends on itself", stream_id)
+
+        # new parent can't depend on the stream, it's moved to stream's old place instead
+        ancestor = parent
+        for _ in range(HTTP2_MAX_STREAMS):
+            if ancestor == 0:
+                break
+            if ancestor == stream_id:
+                self.priorities[parent][0] = self.priorities.get(stream_id, [0])[0]
+                break
+            ancestor = self.priorities.get(ancestor, [0])[0]
+
+        if exclusive:
+            for priority in self.priorities.values():
+                if priority[0] == parent:
+                    priority[0] = stream_id
+        self.priorities[stream_id] = [parent, weight]
+        if (stream := self.streams.get(stream_id)) is not None:
+            stream.weight = weight
+
+        # forget the oldest streams that nothing is happening on
+        while len(self.priorities) > 4 * HTTP2_MAX_STREAMS:
+            oldest = next(iter(self.priorities))
+            del self.priorities[oldest]
+
+    def _on_headers(self, stream_id: int, flags: int, block: bytes) -> None:
+        """
+        Handles complete header block, which starts a request or ends its body with trailers
+        """
+
+        # the block has to be decoded even if the stream is refused, to keep compression state in sync
+        headers = self.decoder.decode(block, MAX_REQUEST_HEAD_SIZE)
+
+        if (stream := self.streams.get(stream_id)) is not None:  # trailers
+            if not flags & FLAG_END_STREAM or stream.body is None or stream.body.is_ended:
+                raise H2Error(PROTOCOL_ERROR, "Unexpected HEADERS", stream_id)
+            stream.body.feed(b"", True)
+            return
+
+        if stream_id % 2 == 0 or stream_id <= self.last_stream_id:
+            raise H2Error(PROTOCOL_ERROR, "Bad stream id")
+        self.last_stream_id = stream_id
+        if self.is_closing or len(self.streams) >= HTTP2_MAX_STREAMS:
+            self._reset_stream(stream_id, REFUSED_STREAM)
+            return
+
+        # pseudo-headers come first
+        pseudo = dict()
+        fields = dict()
+        for name, value in headers:
+            if name[:1] == ":":
+                if fields or name in pseudo:
+                    raise H2Error(PROTOCOL_ERROR, "Misplaced pseudo-header", stream_id)
+                pseudo[name] = value
+            elif name in fields:
+                fields[name] = f"{fields[name]}{'; ' if name == 'cookie' else ', '}{value}"
+            else:
+                fields[name] = value
+        if ":method" not in pseudo or ":path" not in pseudo or not fields.keys().isdisjoint(_CONNECTION_HEADERS):
+            raise H2Error(PROTOCOL_ERROR, "Malformed request", stream_id)
+        if ":authority" in pseudo and "host" not in fields:
+            fields["host"] = pseudo[":authority"]
+
+        priority = self.priorities.setdefault(stream_id, [0, DEFAULT_WEIGHT])
+        stream = self.streams[stream_id] = H2Stream(stream_id, self.initial_window, priority[1])
+        stream.virtual_time = self.virtual_time
+        if not flags & FLAG_END_STREAM:
+            length = fields.get("content-length")
+            stream.body = H2RequestBody(
+                self, stream_id, int(length) if length and length.isascii() and length.isdigit() else None)
+        stream.task = asyncio.create_task(self._serve(stream, pseudo[":method"], pseudo[":path"], fields))
+
+    def _on_data(self, stream_id: int, flags: int, payload: bytes) -> None:
+        """
+        Handles DATA frame of request body
+        """
+
+        if stream_id == 0:
+            raise H2Error(PROTOCOL_ERROR, "DATA on stream 0")
+
+        # connection window is given back right away, streams' ones once the body is read
+        if payload:
+            self.send_window_update(0, len(payload))
+
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            if stream_id > self.last_stream_id:
+                raise H2Error(PROTOCOL_ERROR, "DATA on idle stream")
+            return  # stream was closed, data was in flight
+        body = stream.body
+        if body is None or body.is_ended:
+            raise H2Error(STREAM_CLOSED, "DATA after END_STREAM", stream_id)
+
+        body.window -= len(payload)
+        if body.window < 0:
+            raise H2Error(FLOW_CONTROL_ERROR, "Stream window exceeded", stream_id)
+        data = self._strip_padding(flags, payload)
+        body.feed(data, bool(flags & FLAG_END_STREAM))
+
+    def send_window_update(self, stream_id: int, increment: int) -> None:
+        """
+        Allows client to send more data
+        """
+
+        if stream_id == 0 or stream_id in self.streams:
+            self._write(make_frame(FRAME_WINDOW_UPDATE, 0, stream_id, _UINT32.pack(increment)))
+
+    def _reset_stream(self, stream_id: int, code: int) -> None:
+        """
+        Closes stream, sending RST_STREAM
+        """
+
+        self._write(make_frame(FRAME_RST_STREAM, 0, stream_id, _UINT32.pack(code)))
+        if (stream := self.streams.pop(stream_id, None)) is not None:
+            stream.finished.set()
+            if stream.task is not None and stream.task is not asyncio.current_task():
+                stream.task.cancel()
+
+    def _goaway(self, code: int) -> None:
+        """
+        Tells client that the connection is closing
+        """
+
+        self._write(make_frame(
+            FRAME_GOAWAY, 0, 0, _UINT32.pack(self.last_stream_id) + _UINT32.pack(code)))
+        self._flush()
+
+    async def _serve(self, stream: H2Stream, method: str, target: str, fields: dict[str, str]) -> None:
+        """
+        Makes response to the stream's request, and queues it to be sent
+        """
+
+        handler = self.handler_class(self.reader, self.writer)
+        request_start = time.perf_counter()
+        request = None
+        try:
+            if len(fields) > MAX_HEADERS:
+                raise HeaderFieldsTooLargeError("Too many headers")
+            if (length := fields.get("content-length")) is not None and not (length.isascii() and length.isdigit()):
+                raise BadRequestError("Bad content length")
+            if stream.body is not None and stream.body.length is not None and stream.body.length > MAX_BODY_SIZE:
+                raise PayloadTooLargeError("Request body too large")
+            request = Request.make(method, target.encode("utf-8", "replace"), fields, "HTTP/2")
+            if stream.body is not None:
+                request = replace(request, data_stream=stream.body)
+            response = await handler.make_response(request)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            response = self.handler_class.error_response(e, method)
+
+        response_start = time.perf_counter()
+        try:
+            has_body = (
+                response.status.code != 304 and response.data is not None and
+                (request is None or request.type != RequestTypes.HEAD))
+            self._send_headers(stream, response, not has_body)
+            if has_body:
+                chunks = response.chunks()
+                try:
+                    async for data in chunks:
+                        if stream.id not in self.streams:  # reset by client
+                            break
+                        await self._queue_data(stream, data)
+                finally:
+                    await chunks.aclose()
+                stream.trailers = response.trailers or None
+                stream.is_ended = True
+                self._wakeup.set()
+                await stream.finished.wait()
+        except ConnectionStalledError:
+            self._reset_stream(stream.id, CANCEL)
+        except Exception as e:
+            LOGGER.warning(f"Error occurred when sending HTTP/2 response:", exc_info=e)
+            Metrics.record_exception(e)
+            self._reset_stream(stream.id, INTERNAL_ERROR)
+
+        if Metrics.enabled:
+            Metrics.record_request(
+                handler.route, response.status.code,
+                response_start - request_start, time.perf_counter() - request_start, stream.sent)
+        if AccessLog.enabled:
+            AccessLog.record(
+                self.writer.get_extra_info("peername"), method, request.path if request else target, "HTTP/2",
+                response.status.code, stream.sent, time.perf_counter() - request_start)
+
+    def _send_headers(self, stream: H2Stream, response: Response, end_stream: bool) -> None:
+        """
+        Sends response head
+        """
+
+        headers = [(":status", str(response.status.code)), ("date", http_date())]
+        for key, value in response.headers.items():
+            key = key.lower()
+            if key not in _CONNECTION_HEADERS:
+                headers.append((key, str(value)))
+        if response.status.code != 304 and "content-length" not in response.headers:
+            if (length := response.length) is not None:
+                headers.append(("content-length", str(length)))
+        self._write_header_block(stream.id, self.encoder.encode(headers), end_stream)
+        if end_stream:
+            self._finish_stream(stream)
+
+    def _write_header_block(self, stream_id: int, block: bytes, end_stream: bool) -> None:
+        """
+        Writes header block, split into HEADERS and CONTINUATION frames
+        """
+
+        size = self.max_frame_size
+        frames = []
+        for offset in range(0, max(len(block), 1), size):
+            frames.append(make_frame(
+                FRAME_HEADERS if offset == 0 else FRAME_CONTINUATION,
+                (FLAG_END_STREAM if offset == 0 and end_stream else 0) |
+                (FLAG_END_HEADERS if offset + size >= len(block) else 0),
+                stream_id, block[offset:offset + size]))
+        self._write(*frames)
+
+    async def _queue_data(self, stream: H2Stream, data: bytes) -> None:
+        """
+        Queues response data for sending, waiting while too much of it is queued
+        """
+
+        stream.pending.append(memoryview(data))
+        stream.pending_size += len(data)
+        self._wakeup.set()
+        if stream.pending_size >= HTTP2_STREAM_BUFFER:
+            stream.writable.clear()
+            try:
+                async with asyncio.timeout(WRITE_TIMEOUT):
+                    await stream.writable.wait()
+            except TimeoutError:  # client doesn't open the stream's window
+                Metrics.increment("timeouts_write")
+                raise ConnectionStalledError("Stream stalled")
+
+    def _finish_stream(self, stream: H2Stream) -> None:
+        """
+        Closes stream after END_STREAM was sent
+        """
+
+        self.streams.pop(stream.id, None)
+        stream.finished.set()
+
+        # client doesn't have to send the rest of request body
+        if stream.body is not None and not stream.body.is_ended:
+            self._write(make_frame(FRAME_RST_STREAM, 0, stream.id, _UINT32.pack(NO_ERROR)))
+
+    def _pick_stream(self) -> H2Stream | None:
+        """
+        Chooses stream to send next DATA frame of.
+        Streams whose ancestors can send are blocked, the least served of the rest goes first
+        """
+
+        ready = {
+            stream_id: stream for stream_id, stream in self.streams.items()
+            if (stream.pending_size and stream.window > 0 and self.window > 0) or
+               (stream.is_ended and not stream.pending_size)}
+        picked = None
+        for stream in ready.values():
+            parent = self.priorities.get(stream.id, (0,))[0]
+            for _ in range(HTTP2_MAX_STREAMS):
+                if parent == 0 or parent in ready:
+                    break
+                parent = self.priorities.get(parent, (0,))[0]
+            if parent in ready:
+                continue
+            if picked is None or stream.virtual_time < picked.virtual_time:
+                picked = stream
+        return picked
+
+    def _write(self, *frames: bytes | memoryview) -> None:
+        """
+        Queues frames, sender writes everything queued during a loop iteration at once
+        """
+
+        self._output.extend(frames)
+        self._output_size += sum(len(frame) for frame in frames)
+        self._wakeup.set()
+
+    def _flush(self) -> None:
+        """
+        Writes queued frames
+        """
+
+        if self._output:
+            output, self._output = self._output, []
+            self._output_size = 0
+            self.writer.writelines(output)
+
+    async def _send_loop(self) -> None:
+        """
+        Frames queued response data, and writes queued frames
+        """
+
+        transport = self.writer.transport
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while (stream := self._pick_stream()) is not None:
+                self._send_data(stream)
+                if self._output_size >= 4 * self.max_frame_size:
+                    self._flush()
+                    if transport.get_write_buffer_size() > 0:
+                        await drain(self.writer)
+            self._flush()
+
+    def _send_data(self, stream: H2Stream) -> None:
+        """
+        Sends single DATA frame of stream, or ends the stream
+        """
+
+        size = min(stream.pending_size, stream.window, self.window, self.max_frame_size)
+        parts = []
+        left = size
+        while left:
+            data = stream.pending[0]
+            if len(data) <= left:
+                parts.append(stream.pending.popleft())
+                left -= len(data)
+            else:
+                parts.append(data[:left])
+                stream.pending[0] = data[left:]
+                left = 0
+
+        stream.pending_size -= size
+        stream.window -= size
+        self.window -= size
+        stream.sent += size
+        stream.virtual_time += size / stream.weight
+        self.virtual_time = stream.virtual_time
+
+        is_last = stream.is_ended and not stream.pending_size
+        if is_last and stream.trailers:
+            self._write(FRAME_HEAD.pack(size << 8 | FRAME_DATA, 0, stream.id), *parts)
+            trailers = [(key.lower(), str(value)) for key, value in stream.trailers.items()]
+            self._write_header_block(stream.id, self.encoder.encode(trailers), True)
+        else:
+            self._write(
+                FRAME_HEAD.pack(size << 8 | FRAME_DATA, FLAG_END_STREAM if is_last else 0, stream.id), *parts)
+
+        if is_last:
+            self._finish_stream(stream)
+        elif stream.pending_size < HTTP2_STREAM_BUFFER:
+            stream.writable.set()
@@ -1,23 +1,179 @@
-import signal
+import os
+import re
+import time
 import asyncio
 import logging
 from source.status import *
-from source.classes import *
-from source.settings import READ_BUFFER_SIZE, WRITE_BUFFER_SIZE
+from source.classes import date_header
+from source.metrics import Metrics
+from source.settings import MAX_REQUEST_HEAD_SIZE, KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS, HEADER_TIMEOUT
+from source.settings import ACME_CHALLENGE_DIRECTORY
 
 LOGGER: logging.Logger = logging.getLogger()
 
 
+# HTTP-01 challenge tokens have to be reachable over plain HTTP
+ACME_CHALLENGE_PATH: bytes = b"/.well-known/acme-challenge/"
+_TOKEN_CHARACTERS: bytes = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+# bytes that can't appear in request target, they would end up in 'location' header as is
+_INVALID_TARGET: re.Pattern = re.compile(rb"[\x00-\x20\x7f-\xff]")
+
+# prebuilt response parts
+_KEEP_ALIVE: bytes = b"connection: keep-alive\r\n\r\n"
+_CLOSE: bytes = b"connection: close\r\n\r\n"
+_EMPTY_BODY: bytes = b"content-length: 0\r\n"
+
+
+class RedirectProtocol(asyncio.Protocol):
+    """
+    Redirects requests to the same path over HTTPS, except for ACME challenges, which are answered from disk.
+    Only request line is parsed, and responses are assembled from prebuilt parts.
+    Pipelined requests are answered in one go, connection stays open while client keeps it alive
+    """
+
+    def __init__(self, server: "TinyServer"):
+        """
+        :param server: redirect server
+        """
+
+        self.server: TinyServer = server
+        self.transport: asyncio.Transport | None = None
+        self.buffer: bytes = b""  # incomplete request head
+        self.request_count: int = 0
+
+        # timer is moved lazily, it only checks the deadline when it fires
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self.deadline: float = self.loop.time() + HEADER_TIMEOUT
+        self.timer: asyncio.TimerHandle | None = None
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        Metrics.active_connections += 1
+        self.timer = self.loop.call_at(self.deadline, self.timed_out)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        Metrics.active_connections -= 1
+        self.timer.cancel()
+
+    def pause_writing(self) -> None:
+        # client doesn't read responses, so stop reading its requests
+        self.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.transport.resume_reading()
+
+    def timed_out(self) -> None:
+        """
+        Closes connection that stayed idle, or didn't finish request head in time
+        """
+
+        if self.deadline > self.loop.time():
+            self.timer = self.loop.call_at(self.deadline, self.timed_out)
+            return
+        Metrics.increment("timeouts_idle" if self.request_count and not self.buffer else "timeouts_header")
+        self.transport.close()
+
+    def data_received(self, data: bytes) -> None:
+        was_empty = not self.buffer
+        buffer = self.buffer + data if self.buffer else data
+
+        # we don't care what the client has to say after the request line
+        start = 0
+        while (end := buffer.find(b"\r\n\r\n", start)) != -1:
+            self.request_count += 1
+            if not self.respond(buffer[start:end]) or self.request_count >= KEEP_ALIVE_MAX_REQUESTS:
+                self.transport.close()
+                return
+            start = end + 4
+
+        self.buffer = buffer[start:] if start else buffer
+        if len(self.buffer) > MAX_REQUEST_HEAD_SIZE:
+            self.transport.close()
+        elif start or was_empty:  # head timeout starts with its first byte, idle one after last response
+            self.deadline = self.loop.time() + (HEADER_TIMEOUT if self.buffer else KEEP_ALIVE_TIMEOUT)
+            if self.deadline < self.timer.when():
+                self.timer.cancel()
+                self.timer = self.loop.call_at(self.deadline, self.timed_out)
+
+    def respond(self, head: bytes) -> bool:
+        """
+        Responds to request
+        :param head: request head, without the final empty line
+        :return: True if the connection should be kept alive
+        """
+
+        start = time.perf_counter() if Metrics.enabled else 0
+        line_end = head.find(b"\r\n")
+        request_line = head if line_end == -1 else head[:line_end]
+        method, _, rest = request_line.partition(b" ")
+        target, _, version = rest.rpartition(b" ")
+        if not target or version[:7] != b"HTTP/1." or _INVALID_TARGET.search(target):
+            self.transport.write(b"".join((
+                STATUS_CODE_BAD_REQUEST.status_line, date_header(), _EMPTY_BODY, _CLOSE)))
+            return False
+
+        # keep-alive, unless client asks to close, or sends a body that would have to be read
+        keep_alive = version == b"HTTP/1.1"
+        if line_end != -1:
+            headers = head[line_end:].lower()
+            if b"\ncontent-length:" in headers or b"\ntransfer-encoding:" in headers:
+                keep_alive = False
+            elif (index := headers.find(b"\nconnection:")) != -1:
+                value_end = headers.find(b"\r", index)
+                connection = headers[index:value_end if value_end != -1 else len(headers)]
+                keep_alive = b"close" not in connection and (keep_alive or b"keep-alive" in connection)
+
+        # absolute form targets are redirected to their path
+        if target[:1] != b"/":
+            path_start = target.find(b"/", target.find(b"//") + 2) if target[:4] == b"http" else -1
+            target = target[path_start:] if path_start != -1 else b"/"
+
+        if target.startswith(ACME_CHALLENGE_PATH) and (method == b"GET" or method == b"HEAD"):
+            token = target[len(ACME_CHALLENGE_PATH):].partition(b"?")[0]
+            status, response = self.server.acme_response(token, method == b"HEAD", keep_alive)
+            route = "acme-challenge"
+        else:
+            status, route = 301, "redirect"
+            response = b"".join((
+                STATUS_CODE_MOVED_PERMANENTLY.status_line, date_header(), self.server.location, target, b"\r\n",
+                _KEEP_ALIVE if keep_alive else _CLOSE))
+        self.transport.write(response)
+
+        if Metrics.enabled:
+            duration = time.perf_counter() - start
+            Metrics.record_request(route, status, duration, duration, len(response))
+        return keep_alive
+
+
 class TinyServer:
     """
     HTTP to HTTPs redirecting server
     """
 
-    def __init__(self, bind_address: tuple[str, int], redirect: str):
+    def __init__(
+            self,
+            bind_address: tuple[str, int],
+            redirect: str,
+            reuse_port: bool = False,
+            acme_directory: str = ACME_CHALLENGE_DIRECTORY
+    ):
+        """
+        :param bind_address: binding (address, port)
+        :param redirect: domain to redirect to
+        :param reuse_port: share the port with other worker processes
+        :param acme_directory: directory with ACME HTTP-01 challenge tokens
+        """
+
         self.server: asyncio.Server | None = None
         self.bind_address: tuple[str, int] = bind_address
+        self.reuse_port: bool = reuse_port
+
+        self.redirect: str = redirect.rstrip("/")
+        self.acme_directory: str = acme_directory
 
-        self.redirect: str = redirect
+        # headers before the redirect path
+        self.location: bytes = _EMPTY_BODY + f"location: {self.redirect}".encode("ascii")
 
     def run(self):
         """
@@ -31,10 +187,11 @@ class TinyServer:
         Starts the TinyServer server. Coroutine
         """
 
-        self.server = await asyncio.start_server(
-            client_connected_cb=self.client_handle,
+        self.server = await asyncio.get_running_loop().create_server(
+            lambda: RedirectProtocol(self),
             host=self.bind_address[0],
-            port=self.bind_address[1])
+            port=self.bind_address[1],
+            reuse_port=self.reuse_port)
 
         LOGGER.info(f"Redirect server running on '{self.bind_address[0]}:{self.bind_address[1]}'")
 
@@ -55,19 +212,28 @@ class TinyServer:
         for sock in self.server.sockets:
             sock.close()
 
-    async def client_handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    def acme_response(self, token: bytes, head_only: bool, keep_alive: bool) -> tuple[int, bytes]:
         """
-        Quick client handler
+        Makes response to ACME challenge request. Tokens are small files, written by ACME client
+        :param token: requested token
+        :param head_only: respond to HEAD request
+        :param keep_alive: keep connection alive
+        :return: status code, response
         """
 
-        # we don't care what the client has to say
-        await reader.read(READ_BUFFER_SIZE)
-
-        # respond with 301
-        response = Response(
-            data=f"Moved Permanently. Redirecting to {self.redirect}".encode("ascii"),
-            status=STATUS_CODE_MOVED_PERMANENTLY,
-            headers={"Location": self.redirect})
-        await response.write(writer)
+        # tokens are base64url, anything else could escape the directory
+        data = None
+        if token and not token.strip(_TOKEN_CHARACTERS):
+            try:
+                with open(os.path.join(self.acme_directory, token.decode("ascii")), "rb") as file:
+                    data = file.read(2 ** 12)
+            except OSError:
+                pass
 
-        writer.close()
+        status = STATUS_CODE_OK if data is not None else STATUS_CODE_NOT_FOUND
+        data = data or b""
+        return status.code, b"".join((
+            status.status_line, date_header(),
+            f"content-type: text/plain\r\ncontent-length: {len(data)}\r\n".encode("ascii"),
+            _KEEP_ALIVE if keep_alive else _CLOSE,
+            b"" if head_only else data))
@@ -0,0 +1,235 @@
+import time
+from bisect import bisect_left
+from source.cache import FileCache
+from source.settings import METRICS_ENABLED
+
+
+# histogram bucket bounds, in seconds
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram
+    """
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds: tuple[float, ...] = bounds
+        self.counts: list[int] = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Records a value
+        """
+
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    """
+    Metrics of a single route
+    """
+
+    __slots__ = ("statuses", "ttfb", "duration", "bytes_sent")
+
+    def __init__(self):
+        self.statuses: dict[int, int] = dict()
+        self.ttfb: Histogram = Histogram()
+        self.duration: Histogram = Histogram()
+        self.bytes_sent: int = 0
+
+
+class PoolMetrics:
+    """
+    Metrics of a script pool
+    """
+
+    __slots__ = ("workers", "in_flight", "wait", "run", "timeouts", "rejected")
+
+    def __init__(self, workers: int):
+        self.workers: int = workers
+        self.in_flight: int = 0  # submitted scripts that haven't finished yet
+        self.wait: Histogram = Histogram()
+        self.run: Histogram = Histogram()
+        self.timeouts: int = 0
+        self.rejected: int = 0
+
+    def observe(self, wait: float, run: float) -> None:
+        """
+        Records finished script
+        :param wait: seconds it waited for a worker, including result transfer
+        :param run: seconds it ran
+        """
+
+        self.wait.observe(wait)
+        self.run.observe(run)
+
+
+def _escape(value: str) -> str:
+    """
+    Escapes label value for Prometheus text format
+    """
+
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Metrics:
+    """
+    In-process metrics registry.
+    Everything is updated from the event loop thread only, so plain counters need no locks.
+    In worker mode every worker process has its own registry
+    """
+
+    enabled: bool = METRICS_ENABLED
+
+    # 'route': RouteMetrics(...)
+    routes: dict[str, RouteMetrics] = dict()
+
+    # 'exception name': count
+    exceptions: dict[str, int] = dict()
+
+    # 'counter name': count, for counters registered by other parts of the server
+    counters: dict[str, int] = dict()
+
+    # 'pool kind': PoolMetrics(...), updated whether metrics are enabled or not
+    pools: dict[str, PoolMetrics] = dict()
+
+    active_connections: int = 0
+    started: float = time.time()
+
+    @classmethod
+    def record_request(cls, route: str, status: int, ttfb: float, duration: float, sent: int) -> None:
+        """
+        Records served request
+        :param route: route label
+        :param status: response status code
+        :param ttfb: seconds until response started being written
+        :param duration: seconds until response was written
+        :param sent: bytes written
+        """
+
+        if (metrics := cls.routes.get(route)) is None:
+            metrics = cls.routes[route] = RouteMetrics()
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.ttfb.observe(ttfb)
+        metrics.duration.observe(duration)
+        metrics.bytes_sent += sent
+
+    @classmethod
+    def record_exception(cls, exception: BaseException) -> None:
+        """
+        Records exception raised while handling a client
+        """
+
+        name = type(exception).__name__
+        cls.exceptions[name] = cls.exceptions.get(name, 0) + 1
+
+    @classmethod
+    def increment(cls, name: str, value: int = 1) -> None:
+        """
+        Increments named counter
+        """
+
+        cls.counters[name] = cls.counters.get(name, 0) + value
+
+    @classmethod
+    def pool(cls, kind: str, workers: int) -> PoolMetrics:
+        """
+        Registers script pool
+        :param kind: pool label
+        :param workers: number of pool workers
+        """
+
+        if (metrics := cls.pools.get(kind)) is None:
+            metrics = cls.pools[kind] = PoolMetrics(workers)
+        return metrics
+
+    @staticmethod
+    def _export_histogram(lines: list[str], name: str, label: str, histogram: Histogram) -> None:
+        """
+        Appends histogram samples in Prometheus text format
+        """
+
+        cumulative = 0
+        for bound, count in zip((*histogram.bounds, "+Inf"), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+    @classmethod
+    def export(cls) -> str:
+        """
+        Exports metrics in Prometheus text format
+        """
+
+        lines = [
+            "# TYPE httpy_requests_total counter",
+            *(f'httpy_requests_total{{route="{_escape(route)}",status="{status}"}} {count}'
+              for route, metrics in cls.routes.items()
+              for status, count in metrics.statuses.items()),
+            "# TYPE httpy_response_bytes_total counter",
+            *(f'httpy_response_bytes_total{{route="{_escape(route)}"}} {metrics.bytes_sent}'
+              for route, metrics in cls.routes.items())]
+
+        for name, attribute in (("httpy_request_ttfb_seconds", "ttfb"),
+                                ("httpy_request_duration_seconds", "duration")):
+            lines.append(f"# TYPE {name} histogram")
+            for route, metrics in cls.routes.items():
+                cls._export_histogram(lines, name, f'route="{_escape(route)}"', getattr(metrics, attribute))
+
+        lines += [
+            "# TYPE httpy_exceptions_total counter",
+            *(f'httpy_exceptions_total{{type="{_escape(name)}"}} {count}'
+              for name, count in cls.exceptions.items()),
+            "# TYPE httpy_active_connections gauge",
+            f"httpy_active_connections {cls.active_connections}",
+            "# TYPE httpy_start_time_seconds gauge",
+            f"httpy_start_time_seconds {cls.started}"]
+
+        if cls.pools:
+            lines += [
+                "# TYPE httpy_script_pool_workers gauge",
+                *(f'httpy_script_pool_workers{{pool="{kind}"}} {pool.workers}' for kind, pool in cls.pools.items()),
+                "# TYPE httpy_script_pool_running gauge",
+                *(f'httpy_script_pool_running{{pool="{kind}"}} {min(pool.in_flight, pool.workers)}'
+                  for kind, pool in cls.pools.items()),
+                "# TYPE httpy_script_pool_queued gauge",
+                *(f'httpy_script_pool_queued{{pool="{kind}"}} {max(pool.in_flight - pool.workers, 0)}'
+                  for kind, pool in cls.pools.items()),
+                "# TYPE httpy_script_pool_timeouts_total counter",
+                *(f'httpy_script_pool_timeouts_total{{pool="{kind}"}} {pool.timeouts}'
+                  for kind, pool in cls.pools.items()),
+                "# TYPE httpy_script_pool_rejected_total counter",
+                *(f'httpy_script_pool_rejected_total{{pool="{kind}"}} {pool.rejected}'
+                  for kind, pool in cls.pools.items())]
+            for name, attribute in (("httpy_script_wait_seconds", "wait"),
+                                    ("httpy_script_run_seconds", "run")):
+                lines.append(f"# TYPE {name} histogram")
+                for kind, pool in cls.pools.items():
+                    cls._export_histogram(lines, name, f'pool="{kind}"', getattr(pool, attribute))
+
+        for name, count in cls.counters.items():
+            lines.append(f"# TYPE httpy_{name}_total counter")
+            lines.append(f"httpy_{name}_total {count}")
+
+        file_cache = FileCache.stats()
+        lines += [
+            "# TYPE httpy_file_cache_hits_total counter",
+            f"httpy_file_cache_hits_total {file_cache['hits']}",
+            "# TYPE httpy_file_cache_misses_total counter",
+            f"httpy_file_cache_misses_total {file_cache['misses']}",
+            "# TYPE httpy_file_cache_evictions_total counter",
+            f"httpy_file_cache_evictions_total {file_cache['evictions']}",
+            "# TYPE httpy_file_cache_entries gauge",
+            f"httpy_file_cache_entries {file_cache['entries']}",
+            "# TYPE httpy_file_cache_bytes gauge",
+            f"httpy_file_cache_bytes {file_cache['size']}"]
+        return "\n".join(lines) + "\n"
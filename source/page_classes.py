@@ -1,9 +1,15 @@
 import os
+import inspect
 import importlib
 from typing import BinaryIO
+from collections.abc import Iterable, AsyncIterable, AsyncIterator
 from types import ModuleType
+from datetime import datetime
+from source.cache import FileCache
+from source.classes import iterate_chunks
 from source.functions import parse_md2html
 from source.exceptions import InternalServerError
+from source.script_pool import ScriptPool, EXECUTORS
 
 
 class Page:
@@ -11,11 +17,30 @@ class Page:
     Base class for page
     """
 
-    def __init__(self, filepath: str, locales: list[str] | None = None):
+    def __init__(
+            self,
+            filepath: str,
+            locales: list[str] | None = None,
+            executor: str = "loop",
+            timeout: float | None = None
+    ):
+        """
+        :param filepath: path to page file or script
+        :param locales: available locales
+        :param executor: where script's 'make_page' runs: 'loop', or 'thread' / 'process' pool for blocking ones
+        :param timeout: seconds pooled 'make_page' may take, 'SCRIPT_TIMEOUT' if None
+        """
+
         self.filepath: str = filepath
-        self.locales: list[str] | None = locales
+        self.locales: tuple[str, ...] | None = tuple(locales) if locales is not None else None
         self.is_scripted: bool = True if self.filepath[-3:] == ".py" else False
         self.type: str = "application/octet-stream"
+        self.route: str | None = None  # web path the page was first added to
+        self.executor: str = executor
+        self.timeout: float | None = timeout
+
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor '{executor}'")
 
         self._import: ModuleType | None = None
         if self.is_scripted:
@@ -33,6 +58,12 @@ class Page:
 
         self._import = importlib.import_module(name, package_path)
 
+        # pools run plain functions, their results are awaited on the loop
+        make_page = getattr(self._import, "make_page", None)
+        is_async = inspect.iscoroutinefunction(make_page) or inspect.isasyncgenfunction(make_page)
+        if self.executor != "loop" and is_async:
+            raise ValueError(f"'make_page' of '{self.filepath}' is async, it can only run on the loop")
+
     def _define_own_type(self) -> None:
         """
         Defines own type using MIME types thing
@@ -77,58 +108,121 @@ class Page:
             case ".avi":
                 self.type = "video/x-msvideo"
 
-    def _return_localized(self, locale: str) -> BinaryIO:
+    def get_filepath(self, locale: str | None) -> str:
         """
-        Internal method for returning a localized BinaryIO file
+        Returns path to localized file
         """
 
-        filepath = self.filepath
         if not self.locales or locale not in self.locales:
             locale = "en"
-        return open(filepath.format(prefix=locale), "rb")
+        return self.filepath.format(prefix=locale)
 
-    def _return_scripted(self, **kwargs):
+    def _return_localized(self, locale: str) -> bytes | BinaryIO:
         """
-        Internal method for returning scripted pages
+        Internal method for returning a localized file.
+        Small files are returned from cache as bytes, large ones are opened as BinaryIO
         """
 
-        result = self._import.make_page(**kwargs)
+        filepath = self.get_filepath(locale)
+        if (data := FileCache.get(filepath)) is not None:
+            return data
+        return open(filepath, "rb")
+
+    async def generate(self, **kwargs):
+        """
+        Runs page script.
+        'make_page' may be a coroutine, in which case it can consume request's 'data_stream',
+        or an async generator of page chunks, which are sent as they're yielded.
+        Pooled 'make_page' doesn't get 'data_stream', as it's read on the loop
+        :return: generated page
+        """
+
+        if self.executor == "loop":
+            result = self._import.make_page(**kwargs)
+        else:
+            kwargs["data_stream"] = None
+            result = await ScriptPool.run(self.executor, self._import.make_page, kwargs, self.timeout)
+
+        if inspect.isasyncgen(result):
+            result = DummyPage(result, self.type)
+        elif inspect.isawaitable(result):
+            result = await result
         if isinstance(result, DummyPage):
-            return result.get_data()
+            return result
         raise InternalServerError("Scripted request error")
 
-    def get_data(self, **kwargs) -> bytes | BinaryIO:
+    async def _return_scripted(self, **kwargs):
+        """
+        Internal method for returning scripted pages
+        """
+
+        return await (await self.generate(**kwargs)).get_data()
+
+    async def get_data(self, **kwargs) -> bytes | BinaryIO:
         """
         Returns BinaryIO file or raw bytes
         """
 
         if self.is_scripted:  # requested pages
-            return self._return_scripted(**kwargs)
+            return await self._return_scripted(**kwargs)
         else:
             return self._return_localized(kwargs.get("locale", "en"))
 
 
 class DummyPage:
     """
-    Dummy page container, stores actual byte data instead of file path / script request
+    Dummy page container, stores actual byte data instead of file path / script request.
+    Data may also be an iterable or async iterable of chunks, which are sent to the client as they're generated
     """
 
-    def __init__(self, data: bytes | str, type_: str | None = None):
+    def __init__(
+            self,
+            data: bytes | str | Iterable[bytes | str] | AsyncIterable[bytes | str],
+            type_: str | None = None,
+            last_modified: datetime | None = None,
+            etag: str | None = None,
+            encoded: dict[str, bytes | None] | None = None
+    ):
+        """
+        :param data: page contents, or chunks of them
+        :param type_: MIME type
+        :param last_modified: modification time of data the page was made from
+        :param etag: precomputed ETag of data
+        :param encoded: 'content-encoding': compressed data, filled in background as encodings are requested,
+        None while being compressed. Pages made from cache pass the same dict, so the data is compressed once
+        """
+
         self.filepath: None = None
         self.locales: None = None
         self.is_scripted: bool = True
         self.type: str = type_ if type_ else "application/octet-stream"
+        self.last_modified: datetime | None = last_modified
+        self.etag: str | None = etag
+        self.encoded: dict[str, bytes | None] | None = encoded
 
-        self._data = data if isinstance(data, bytes) else data.encode("utf-8")
+        self.is_streamed: bool = not isinstance(data, bytes | str)
+        if self.is_streamed:
+            self._data = _encode_chunks(data)
+        else:
+            self._data = data if isinstance(data, bytes) else data.encode("utf-8")
 
-    def get_data(self, **kwargs) -> bytes:
+    async def get_data(self, **kwargs) -> bytes | AsyncIterator[bytes]:
         """
-        Returns raw bytes of page
+        Returns raw bytes of page, or async iterator of chunks for streamed page
         """
 
         return self._data
 
 
+async def _encode_chunks(chunks: Iterable[bytes | str] | AsyncIterable[bytes | str]) -> AsyncIterator[bytes]:
+    """
+    Encodes string chunks of streamed page
+    """
+
+    async for chunk in iterate_chunks(chunks):
+        yield chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+
+
 class TemplatePage(Page):
     """
     Page that uses template in which it inserts data.
@@ -169,7 +263,7 @@ class TemplatePage(Page):
                 setattr(self, name, value)
             return file.tell()
 
-    def _return_scripted(self, **kwargs):
+    async def _return_scripted(self, **kwargs):
         """
         Parses .md formatted file and inserts into template
         """
@@ -3,63 +3,145 @@ import json
 import logging
 from source.settings import WEB_DIRECTORY
 from source.page_classes import *
+from source.watcher import ContentWatcher
 
 
 LOGGER: logging.Logger = logging.getLogger(__name__)
 
 
-class PathTree:
+class _RadixNode:
     """
-    Tree of paths
+    Node of path segment radix tree. Chains of nodes without routes are merged into a single edge
     """
 
-    tree: dict[str, dict | Page] = {}
+    __slots__ = ("edges", "page")
 
-    @classmethod
-    def __contains__(cls, item) -> bool:
-        if isinstance(item, str):
-            return cls.get(item) is not None
-        return False
+    def __init__(self):
+        # 'first segment': (segments of the edge, child node)
+        self.edges: dict[str, tuple[list[str], _RadixNode]] = dict()
+        self.page: Page | None = None
 
-    @classmethod
-    def add(cls, path: str, page: Page) -> None:
+
+class Router:
+    """
+    Route table. Routes are added, then the router is frozen, after which it's only matched against.
+    Exact routes are looked up with a single dict hit. Routes ending with '/*' match every path under them,
+    and are kept in a radix tree of path segments, the longest matching one wins
+    """
+
+    def __init__(self, routes: dict[str, Page] | None = None):
+        """
+        :param routes: 'path': page, routes to start with
         """
-        Adds new path to the tree
-        :param path: string path
+
+        # 'path': page
+        self.routes: dict[str, Page] = dict(routes) if routes else dict()
+        self.frozen: bool = False
+
+        self._exact: dict[str, Page] = dict()
+        self._root: _RadixNode = _RadixNode()
+
+    def add(self, path: str, page: Page) -> None:
+        """
+        Adds new route
+        :param path: string path, ending with '/*' for a wildcard route
         :param page: page to add
         """
 
-        node = cls.tree
-        split_path = path.split("/")
-        for split in split_path[:-1]:
-            if split not in node:
-                node[split] = dict()
-            node = node[split]
-        node[split_path[-1]] = page
+        if self.frozen:
+            raise RuntimeError("Router is frozen")
+        if "*" in path.removesuffix("/*"):
+            raise ValueError(f"Wildcard is only allowed at the end of path: '{path}'")
+
+        self.routes[path] = page
+        if page.route is None:
+            page.route = path
 
         if page.is_scripted:
             LOGGER.info(f"Added new request to path '{path}'")
         else:
             LOGGER.info(f"Added new page to path '{path}'")
 
-    @classmethod
-    def get(cls, path: str) -> Page | None:
+    def freeze(self) -> "Router":
+        """
+        Builds lookup tables, no routes can be added afterward
+        :return: self
         """
-        Returns node at given path
-        :param path: string path
+
+        for path, page in self.routes.items():
+            if not path.endswith("/*"):
+                self._exact[path] = page
+                continue
+
+            # one edge per segment first, compressed below
+            node = self._root
+            for segment in path[:-2].split("/"):
+                if segment not in node.edges:
+                    node.edges[segment] = ([segment], _RadixNode())
+                node = node.edges[segment][1]
+            node.page = page
+
+        _compress(self._root)
+        self.frozen = True
+        return self
+
+    def replace(self, removed: list[str], added: list[tuple[str, Page]]) -> "Router":
+        """
+        Makes new frozen router with some routes removed and added. This one is left untouched,
+        so it can be swapped for the new one without lookups seeing a half updated table
+        :param removed: string paths to remove
+        :param added: (string path, page) pairs to add
+        :return: new router
+        """
+
+        router = Router(self.routes)
+        for path in removed:
+            if router.routes.pop(path, None) is not None:
+                LOGGER.info(f"Removed path '{path}'")
+        for path, page in added:
+            router.add(path, page)
+        return router.freeze()
+
+    def match(self, path: str) -> tuple[Page, tuple[str, ...]] | None:
+        """
+        Matches path against routes
+        :param path: request path
+        :return: (page, path segments captured by wildcard), None if nothing matches
         """
 
-        node = cls.tree
-        split_path = path.split("/")
-        for split in split_path:
-            if "*" in node:
-                return node["*"]
-            if split not in node:
-                return None
-            node = node[split]
-        if isinstance(node, dict) and "*" in node:
-            return node["*"]
-        return node
+        if (page := self._exact.get(path)) is not None:
+            return page, ()
+
+        segments = path.split("/")
+        node = self._root
+        index = 0
+        best = None
+        while index < len(segments):
+            if (edge := node.edges.get(segments[index])) is None:
+                break
+            label, node = edge
+            if len(label) > 1 and segments[index:index + len(label)] != label:
+                break
+            index += len(label)
+            if node.page is not None:
+                best = node.page, index
+        if best is None:
+            return None
+        return best[0], tuple(segments[best[1]:])
+
+
+def _compress(node: _RadixNode) -> None:
+    """
+    Merges chains of single child nodes without pages into single edges
+    """
+
+    for first, (label, child) in list(node.edges.items()):
+        while child.page is None and len(child.edges) == 1:
+            child_label, grandchild = next(iter(child.edges.values()))
+            label = label + child_label
+            child = grandchild
+        node.edges[first] = (label, child)
+        _compress(child)
 
 
 class PageManager:
@@ -67,28 +149,98 @@ class PageManager:
     Controls access to pages and page indexing
     """
 
+    # current route table, replaced as a whole when pages change
+    router: Router = Router().freeze()
+
+    # 'page directory': [web paths...], paths that were added from directory's 'index.json'
+    directories: dict[str, list[str]] = dict()
+
     @classmethod
     def init(cls) -> None:
         """
         Initializes path manager
         """
 
+        router = Router()
+
         # Very Important Path
         page = Page(f"{WEB_DIRECTORY}/favicon.ico")
-        PathTree.add("/favicon.ico", page)
+        router.add("/favicon.ico", page)
 
         # Append other paths
         for page_directory in os.listdir(f"{WEB_DIRECTORY}/pages"):
-            dir_path = f"{WEB_DIRECTORY}/pages/{page_directory}"
-            if not os.path.isfile(f"{dir_path}/index.json"):
-                LOGGER.warning(f"missing 'index.json' file at '{dir_path}';")
-                continue
+            for path, page in cls._load_directory(page_directory)[1]:
+                router.add(path, page)
+        cls.router = router.freeze()
+
+        # pick up new, removed and changed pages without restarting
+        ContentWatcher.watch(f"{WEB_DIRECTORY}/pages", cls._on_pages_change)
+
+    @classmethod
+    def load_directory(cls, page_directory: str) -> None:
+        """
+        Loads, reloads or unloads pages of a page directory, depending on its 'index.json'
+        :param page_directory: directory name in 'pages'
+        """
+
+        removed, added = cls._load_directory(page_directory)
+        if removed or added:
+            cls.router = cls.router.replace(removed, added)
+
+    @classmethod
+    def _load_directory(cls, page_directory: str) -> tuple[list[str], list[tuple[str, Page]]]:
+        """
+        Loads pages of a page directory
+        :param page_directory: directory name in 'pages'
+        :return: paths that the directory previously had, and (path, page) pairs it has now
+        """
+
+        dir_path = f"{WEB_DIRECTORY}/pages/{page_directory}"
+        removed = cls.directories.pop(page_directory, [])
+        added = []
+        if not os.path.isdir(dir_path):
+            ContentWatcher.unwatch(dir_path)
+            return removed, added
+
+        ContentWatcher.watch(dir_path, cls._on_page_change)
+        if not os.path.isfile(f"{dir_path}/index.json"):
+            LOGGER.warning(f"missing 'index.json' file at '{dir_path}';")
+            return removed, added
+
+        try:
             with open(f"{dir_path}/index.json") as file:
                 data = json.load(file)
-
             filepath = f"{WEB_DIRECTORY}/pages/{page_directory}/{data['filepath']}"
-            page = Page(filepath, locales=data["locales"])
-            PathTree.add(data["web_path"], page)
-            for alias in data["web_path_aliases"]:
-                # reference same dict
-                PathTree.add(alias, page)
+            page = Page(
+                filepath, locales=data["locales"],
+                executor=data.get("executor", "loop"), timeout=data.get("timeout"))
+        except Exception as e:
+            # keep serving the pages that were there before
+            LOGGER.warning(f"unable to load pages at '{dir_path}';", exc_info=e)
+            cls.directories[page_directory] = removed
+            return [], []
+
+        added.append((data["web_path"], page))
+        for alias in data["web_path_aliases"]:
+            # reference same dict
+            added.append((alias, page))
+        cls.directories[page_directory] = [path for path, _ in added]
+        return removed, added
+
+    @classmethod
+    def _on_pages_change(cls, path: str) -> None:
+        """
+        Handles created and removed page directories
+        """
+
+        if os.path.isdir(path) or os.path.basename(path) in cls.directories:
+            cls.load_directory(os.path.basename(path))
+
+    @classmethod
+    def _on_page_change(cls, path: str) -> None:
+        """
+        Handles changes of page directory's 'index.json'
+        """
+
+        if os.path.basename(path) == "index.json":
+            cls.load_directory(os.path.basename(os.path.dirname(path)))
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+from collections.abc import Iterable
+from source.classes import *
+from source.clients import ClientHandler
+from source.metrics import Metrics
+from source.exceptions import *
+from source.settings import MAX_REQUEST_LINE_SIZE, MAX_REQUEST_HEAD_SIZE, KEEP_ALIVE_TIMEOUT, HEADER_TIMEOUT
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+# unread data above this size pauses reading from the socket
+_READ_HIGH_WATER: int = 2 * MAX_REQUEST_HEAD_SIZE
+
+
+class ProtocolClientHandler(ClientHandler):
+    """
+    Client handler for 'HTTPProtocol' connections, request heads are cut out of the received data directly
+    """
+
+    async def read_request(self) -> Request | None:
+        return await self.reader.read_request()
+
+
+class HTTPProtocol(asyncio.Protocol):
+    """
+    Low-level connection core, an alternative to 'asyncio.start_server' streams.
+    Request heads are found in received data as it arrives, and the connection's task is only woken up
+    once a whole head is there. Idle and head timeouts share one lazily moved timer.
+    The protocol serves as both reader and writer of 'ClientHandler', so requests go through the same pipeline;
+    request bodies and HTTP/2 read from it like from 'asyncio.StreamReader'
+    """
+
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self.transport: asyncio.Transport | None = None
+        self.address: str = ""
+        self.task: asyncio.Task | None = None
+
+        # reading
+        self.buffer: bytearray = bytearray()
+        self._searched: int = 0  # bytes of buffer searched for the end of request head
+        self._waiter: asyncio.Future | None = None  # set when the task waits for data
+        self._waits_for_head: bool = False
+        self._eof: bool = False
+        self._reading_paused: bool = False
+
+        # timer only checks the deadline when it fires, None when the task isn't waiting for a request
+        self._deadline: float | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._timed_out: bool = False
+
+        # writing
+        self._writing_paused: bool = False
+        self._drain_waiters: list[asyncio.Future] = []
+        self._lost: bool = False
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        peer = transport.get_extra_info("peername")
+        self.address = peer[0] if peer else ""
+        if not ClientHandler.admit(self, self.address):
+            return
+        Metrics.active_connections += 1
+        self.task = self.loop.create_task(self._serve())
+
+    async def _serve(self) -> None:
+        """
+        Serves the connection, same as 'client_callback' does for streams
+        """
+
+        client = ProtocolClientHandler(self, self)
+        try:
+            await client.serve()
+        finally:
+            Metrics.active_connections -= 1
+            ClientHandler.release(self.address)
+            client.close()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._lost = True
+        self._eof = True
+        self._wakeup()
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_exception(ConnectionResetError("Connection lost"))
+        self._drain_waiters.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def data_received(self, data: bytes) -> None:
+        was_empty = not self.buffer
+        self.buffer += data
+
+        # head timeout starts with its first byte
+        if was_empty and self._deadline is not None:
+            self._deadline = self.loop.time() + HEADER_TIMEOUT
+
+        # incomplete head isn't worth waking the task for
+        if self._waiter is not None and (
+                not self._waits_for_head or len(self.buffer) > MAX_REQUEST_HEAD_SIZE or
+                self.buffer.find(b"\r\n\r\n", self._searched) != -1):
+            self._wakeup()
+
+        if len(self.buffer) > _READ_HIGH_WATER and not self._reading_paused:
+            self._reading_paused = True
+            self.transport.pause_reading()
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._wakeup()
+
+        # responses to pipelined requests may still be sent, TLS doesn't support half-closed connections
+        return self.transport.get_extra_info("sslcontext") is None
+
+    def pause_writing(self) -> None:
+        self._writing_paused = True
+
+    def resume_writing(self) -> None:
+        self._writing_paused = False
+        for waiter in self._drain_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._drain_waiters.clear()
+
+    def _wakeup(self) -> None:
+        """
+        Wakes up the task waiting for data
+        """
+
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def _wait(self) -> None:
+        """
+        Waits for more data
+        """
+
+        if self._reading_paused:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        self._waiter = self.loop.create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def _consume(self, size: int) -> bytes:
+        """
+        Removes data from buffer
+        """
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        if self._reading_paused and len(self.buffer) <= _READ_HIGH_WATER // 2:
+            self._reading_paused = False
+            self.transport.resume_reading()
+        return data
+
+    def _set_deadline(self, timeout: float) -> None:
+        """
+        Sets deadline for the next request to arrive
+        """
+
+        self._deadline = self.loop.time() + timeout
+        if self._timer is None or self._deadline < self._timer.when():
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = self.loop.call_at(self._deadline, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        if self._deadline is None:
+            return
+        if self._deadline > self.loop.time():
+            self._timer = self.loop.call_at(self._deadline, self._on_timer)
+            return
+        self._timed_out = True
+        self._wakeup()
+
+    async def read_request(self) -> Request | None:
+        """
+        Cuts next request out of received data.
+        Client has 'KEEP_ALIVE_TIMEOUT' to start sending the request, and 'HEADER_TIMEOUT' after that to finish its head
+        :return: request class, None if connection was closed or stayed idle
+        """
+
+        # some clients send an extra empty line after request body
+        while self.buffer[:2] == b"\r\n":
+            del self.buffer[:2]
+
+        while (end := self.buffer.find(b"\r\n\r\n", self._searched)) == -1:
+            if self._eof:
+                return
+            if len(self.buffer) > MAX_REQUEST_HEAD_SIZE:
+                self._head_too_large()
+            if self._timed_out:
+                self._deadline = None
+                self._timed_out = False
+                if not self.buffer:
+                    Metrics.increment("timeouts_idle")
+                    return
+                Metrics.increment("timeouts_header")  # slowly dripping head
+                raise RequestTimeoutError("Request head timed out")
+
+            if self._deadline is None:
+                self._set_deadline(HEADER_TIMEOUT if self.buffer else KEEP_ALIVE_TIMEOUT)
+            self._searched = max(0, len(self.buffer) - 3)
+            self._waits_for_head = True
+            try:
+                await self._wait()
+            finally:
+                self._waits_for_head = False
+
+        # whole head may have arrived at once
+        if end + 4 > MAX_REQUEST_HEAD_SIZE:
+            self._head_too_large()
+
+        self._deadline = None
+        self._searched = 0
+        head = self._consume(end + 4)
+        if head == b"PRI * HTTP/2.0\r\n\r\n":  # first part of HTTP/2 connection preface
+            raise HTTP2Requested("HTTP/2 with prior knowledge")
+        request = Request.parse(head)
+
+        # body is left in the buffer, and read only when data stream is iterated over
+        if body := RequestBody.from_headers(request.headers, self, self):
+            request = replace(request, data_stream=body)
+        return request
+
+    def _head_too_large(self) -> None:
+        """
+        Raises 414 if request line alone is too long, 431 otherwise
+        """
+
+        if self.buffer.find(b"\r\n", 0, MAX_REQUEST_LINE_SIZE + 2) == -1:
+            raise URITooLongError("Request line too long")
+        raise HeaderFieldsTooLargeError("Request head too large")
+
+    # 'asyncio.StreamReader' interface, for request bodies and HTTP/2
+
+    async def read(self, n: int = -1) -> bytes:
+        while not self.buffer and not self._eof:
+            await self._wait()
+        return self._consume(len(self.buffer) if n < 0 else n)
+
+    async def readexactly(self, n: int) -> bytes:
+        while len(self.buffer) < n:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._consume(len(self.buffer)), n)
+            await self._wait()
+        return self._consume(n)
+
+    async def readuntil(self, separator: bytes = b"\n") -> bytes:
+        searched = 0
+        while (index := self.buffer.find(separator, searched)) == -1:
+            if self._eof:
+                raise asyncio.IncompleteReadError(self._consume(len(self.buffer)), None)
+            if len(self.buffer) > MAX_REQUEST_HEAD_SIZE:
+                raise asyncio.LimitOverrunError("Separator is not found, and chunk exceed the limit", len(self.buffer))
+            searched = max(0, len(self.buffer) - len(separator) + 1)
+            await self._wait()
+        return self._consume(index + len(separator))
+
+    # 'asyncio.StreamWriter' interface, for responses
+
+    def write(self, data: bytes) -> None:
+        self.transport.write(data)
+
+    def writelines(self, data: Iterable[bytes]) -> None:
+        self.transport.writelines(data)
+
+    async def drain(self) -> None:
+        if self._lost:
+            raise ConnectionResetError("Connection lost")
+        if self._writing_paused:
+            waiter = self.loop.create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+
+    def get_extra_info(self, name: str, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    def is_closing(self) -> bool:
+        return self.transport.is_closing()
+
+    def close(self) -> None:
+        self.transport.close()
@@ -0,0 +1,103 @@
+import time
+import asyncio
+import logging
+import multiprocessing
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from source.metrics import Metrics
+from source.exceptions import ServiceUnavailableError
+from source.settings import SCRIPT_THREAD_WORKERS, SCRIPT_PROCESS_WORKERS, SCRIPT_QUEUE_SIZE, SCRIPT_TIMEOUT
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+# executors scripts can opt in to, 'loop' runs them on the event loop
+EXECUTORS: tuple[str, ...] = ("loop", "thread", "process")
+
+
+def _run_timed(func: Callable, kwargs: dict) -> tuple[object, float]:
+    """
+    Runs function in pool worker
+    :return: result, seconds it took to run
+    """
+
+    start = time.perf_counter()
+    result = func(**kwargs)
+    return result, time.perf_counter() - start
+
+
+class ScriptPool:
+    """
+    Bounded thread and process pools for page scripts that would block the event loop.
+    Pools are created on first use. Requests that would wait in a full queue,
+    or that take longer than their timeout, get 503
+    """
+
+    # 'thread' or 'process': executor
+    executors: dict[str, Executor] = dict()
+
+    @classmethod
+    def get_executor(cls, kind: str) -> Executor:
+        """
+        Returns executor, creating it if needed
+        :param kind: 'thread' or 'process'
+        """
+
+        if (executor := cls.executors.get(kind)) is not None:
+            return executor
+
+        if kind == "thread":
+            executor = ThreadPoolExecutor(SCRIPT_THREAD_WORKERS, thread_name_prefix="script")
+        else:  # forkserver, so that workers don't inherit listening sockets and event loop
+            executor = ProcessPoolExecutor(SCRIPT_PROCESS_WORKERS, multiprocessing.get_context("forkserver"))
+        Metrics.pool(kind, SCRIPT_THREAD_WORKERS if kind == "thread" else SCRIPT_PROCESS_WORKERS)
+        cls.executors[kind] = executor
+        LOGGER.info(f"Started script {kind} pool")
+        return executor
+
+    @classmethod
+    async def run(cls, kind: str, func: Callable, kwargs: dict, timeout: float | None = None):
+        """
+        Runs sync function in pool
+        :param kind: 'thread' or 'process'
+        :param func: function, module level one for process pool
+        :param kwargs: function keyword arguments, picklable for process pool
+        :param timeout: seconds to wait for result, including time in queue; 'SCRIPT_TIMEOUT' if None
+        :return: function result
+        """
+
+        executor = cls.get_executor(kind)
+        metrics = Metrics.pools[kind]
+        if metrics.in_flight - metrics.workers >= SCRIPT_QUEUE_SIZE:
+            metrics.rejected += 1
+            raise ServiceUnavailableError("Script queue is full")
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        future = executor.submit(_run_timed, func, kwargs)
+        metrics.in_flight += 1
+
+        # timed out scripts still hold a worker until they finish
+        def done(_: Future):
+            metrics.in_flight -= 1
+        future.add_done_callback(lambda f: loop.is_closed() or loop.call_soon_threadsafe(done, f))
+
+        try:
+            result, run_time = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout if timeout is not None else SCRIPT_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            raise ServiceUnavailableError("Script timed out")
+        metrics.observe(time.perf_counter() - start - run_time, run_time)
+        return result
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Stops pools, without waiting for running scripts
+        """
+
+        for executor in cls.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        cls.executors.clear()
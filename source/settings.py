@@ -5,12 +5,68 @@ import logging.handlers
 
 READ_BUFFER_SIZE: int = 2 ** 15
 WRITE_BUFFER_SIZE: int = 2 ** 24
+FILE_CHUNK_SIZE: int = 2 ** 18  # file read size, when it can't be sent using sendfile
+COALESCE_BODY_SIZE: int = 2 ** 16  # bodies up to this size are written along with response head
+CHUNK_COALESCE_SIZE: int = 2 ** 14  # smaller chunks of streamed bodies are joined before being framed
 
 MAX_QUERY_ARGS: int = 16
+MAX_REQUEST_LINE_SIZE: int = 2 ** 13  # longer request lines get 414
+MAX_REQUEST_HEAD_SIZE: int = 2 ** 15  # request line + headers, larger heads get 431
+MAX_HEADERS: int = 64
+MAX_BODY_SIZE: int = 2 ** 24  # larger request bodies get 413
+MAX_RANGES: int = 16  # requests with more byte ranges get the whole file
+
+KEEP_ALIVE_TIMEOUT: float = 5  # seconds an idle connection is kept open
+HEADER_TIMEOUT: float = 10  # seconds client has to finish sending request head (or TLS handshake), once it started
+BODY_TIMEOUT: float = 10  # seconds client may take to send next piece of request body
+WRITE_TIMEOUT: float = 30  # seconds response may be stalled by client not reading it
+SENDFILE_CHUNK_SIZE: int = 2 ** 22  # files are sent in parts of this size, each has to be sent within 'WRITE_TIMEOUT'
+
+HTTP2_ENABLED: bool = True  # negotiated using ALPN over TLS, or with prior knowledge over plain connections
+HTTP2_MAX_STREAMS: int = 100  # concurrent streams per connection
+HTTP2_WINDOW_SIZE: int = 2 ** 16  # bytes of request body client may send per stream, before it's read
+HTTP2_STREAM_BUFFER: int = 2 ** 18  # bytes of response queued per stream, before its page has to wait
+
+MAX_CONNECTIONS: int = 1024  # concurrent connections per worker, more get 503
+MAX_CONNECTIONS_PER_IP: int = 64  # concurrent connections from a single address per worker, more get 503
+KEEP_ALIVE_MAX_REQUESTS: int = 100  # requests served over a single connection
+
+FILE_CACHE_SIZE: int = 2 ** 26  # total size of cached static files
+FILE_CACHE_ENTRY_SIZE: int = 2 ** 20  # larger files are read from disk every time
+FILE_CACHE_REVALIDATE_INTERVAL: float = 1  # seconds between checking cached file for changes
+
+COMPRESSION_MIN_SIZE: int = 2 ** 8  # smaller bodies are sent as is
+COMPRESSION_MAX_SIZE: int = 2 ** 23  # larger static files are sent as is
+COMPRESSION_STATIC_BROTLI_QUALITY: int = 11
+COMPRESSION_STATIC_GZIP_LEVEL: int = 9
+COMPRESSION_DYNAMIC_BROTLI_QUALITY: int = 5
+COMPRESSION_DYNAMIC_GZIP_LEVEL: int = 6
+COMPRESSION_WORKERS: int = 1  # threads compressing static files and cached pages in background
+
+SCRIPT_THREAD_WORKERS: int = 4  # threads for page scripts that opted in with '"executor": "thread"'
+SCRIPT_PROCESS_WORKERS: int = 2  # processes for page scripts that opted in with '"executor": "process"'
+SCRIPT_QUEUE_SIZE: int = 64  # scripts waiting for a pool worker, requests beyond that get 503
+SCRIPT_TIMEOUT: float = 10  # seconds pooled script may take, including time in queue, before request gets 503
+
+CONTENT_WATCH_INTERVAL: float = 1  # seconds between polling content for changes, when inotify is unavailable
+CONTENT_WATCH_DELAY: float = 0.1  # seconds changes are collected for before being applied
+
+ACCESS_LOG_ENABLED: bool = True  # write a line per request to 'logs/access.log' ('access.<pid>.log' per worker)
+ACCESS_LOG_FORMAT: str = "line"  # 'line' or 'json'
+ACCESS_LOG_SAMPLE_RATE: float = 1  # fraction of requests that are logged
+ACCESS_LOG_QUEUE_SIZE: int = 2 ** 16  # records waiting to be written, more are dropped
+ACCESS_LOG_BATCH_SIZE: int = 2 ** 10  # records written at once
+ACCESS_LOG_FLUSH_INTERVAL: float = 1  # seconds record may wait for its batch
+ACCESS_LOG_MAX_SIZE: int = 2 ** 24  # log file size, before it's rotated
+ACCESS_LOG_BACKUPS: int = 5  # rotated log files kept
+
+METRICS_ENABLED: bool = False  # serve metrics on 'METRICS_PATH' to localhost clients
+METRICS_PATH: str = "/metrics"
 
 VARS_DIRECTORY: str = "var"
 LOGS_DIRECTORY: str = "logs"
 WEB_DIRECTORY: str = "www"
+ACME_CHALLENGE_DIRECTORY: str = f"{VARS_DIRECTORY}/.well-known/acme-challenge"  # 'certbot --webroot -w var' writes here
 
 PAGE_NEWS_LIST_SIZE: int = 20
 
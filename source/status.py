@@ -7,8 +7,12 @@ class StatusCode:
         self._code: int = code
         self._message: str = message
 
+        # precomputed, as they are sent with every response
+        self._bytes: bytes = f"{self._code} {self._message}".encode("utf8")
+        self.status_line: bytes = b"HTTP/1.1 " + self._bytes + b"\r\n"
+
     def __bytes__(self):
-        return f"{self._code} {self._message}".encode("utf8")
+        return self._bytes
 
     def __str__(self):
         return f"{self._code} {self._message}"
@@ -25,18 +29,23 @@ class StatusCode:
 # Status codes!
 # 2xx
 STATUS_CODE_OK = StatusCode(200, "OK")
+STATUS_CODE_PARTIAL_CONTENT = StatusCode(206, "Partial Content")
 
 # 3xx
 STATUS_CODE_MOVED_PERMANENTLY = StatusCode(301, "Moved Permanently")
+STATUS_CODE_NOT_MODIFIED = StatusCode(304, "Not Modified")
 
 # 4xx
 STATUS_CODE_BAD_REQUEST = StatusCode(400, "Bad Request")
 STATUS_CODE_UNAUTHORIZED = StatusCode(401, "Unauthorized")
 STATUS_CODE_FORBIDDEN = StatusCode(403, "Forbidden")
 STATUS_CODE_NOT_FOUND = StatusCode(404, "Not Found")
+STATUS_CODE_REQUEST_TIMEOUT = StatusCode(408, "Request Timeout")
 STATUS_CODE_PAYLOAD_TOO_LARGE = StatusCode(413, "Payload Too Large")
 STATUS_CODE_URI_TOO_LONG = StatusCode(414, "URI Too Long")
+STATUS_CODE_RANGE_NOT_SATISFIABLE = StatusCode(416, "Range Not Satisfiable")
 STATUS_CODE_IM_A_TEAPOT = StatusCode(418, "I'm a teapot")  # I followed mozilla's dev page, it was there
+STATUS_CODE_REQUEST_HEADER_FIELDS_TOO_LARGE = StatusCode(431, "Request Header Fields Too Large")
 STATUS_CODE_FUNNY_NUMBER = StatusCode(6969, "UwU")
 
 # 5xx
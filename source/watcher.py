@@ -0,0 +1,225 @@
+import os
+import struct
+import asyncio
+import logging
+import ctypes
+import ctypes.util
+from collections.abc import Callable
+from source.settings import CONTENT_WATCH_INTERVAL, CONTENT_WATCH_DELAY
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+# inotify(7) constants
+_IN_ATTRIB: int = 0x00000004
+_IN_CLOSE_WRITE: int = 0x00000008
+_IN_MOVED_FROM: int = 0x00000040
+_IN_MOVED_TO: int = 0x00000080
+_IN_CREATE: int = 0x00000100
+_IN_DELETE: int = 0x00000200
+_IN_Q_OVERFLOW: int = 0x00004000
+_IN_WATCH_MASK: int = _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_IN_EVENT: struct.Struct = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def _load_inotify() -> ctypes.CDLL | None:
+    """
+    Loads libc with inotify functions, None if they're not available
+    """
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch  # noqa
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _scan(directory: str) -> dict[str, tuple[int, int]]:
+    """
+    Returns (mtime, size) of every directory entry
+    :param directory: path to directory
+    :return: 'name': (mtime, size)
+    """
+
+    entries = dict()
+    try:
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed while scanning
+                    continue
+                entries[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
+    return entries
+
+
+class ContentWatcher:
+    """
+    Watches content directories and notifies their handlers of changed files.
+    Uses inotify when it's available, and polls directories' mtimes otherwise.
+    Either way directories are rescanned to find out which entries were created, modified or removed,
+    and handlers are called for those entries only. Handlers are called from the event loop,
+    so they can update shared structures without requests seeing them half updated
+    """
+
+    # 'directory': [handler(filepath), ...]
+    handlers: dict[str, list[Callable[[str], None]]] = dict()
+
+    # 'directory': {'name': (mtime, size)}
+    snapshots: dict[str, dict[str, tuple[int, int]]] = dict()
+
+    # directories that may have changed since last rescan
+    dirty: set[str] = set()
+
+    _libc: ctypes.CDLL | None = None
+    _fd: int | None = None
+    _watches: dict[int, str] = dict()  # inotify 'watch descriptor': directory
+    _task: asyncio.Task | None = None
+    _rescan: asyncio.TimerHandle | None = None
+
+    @classmethod
+    def watch(cls, directory: str, handler: Callable[[str], None]) -> None:
+        """
+        Registers handler for changes in directory, not including subdirectories' contents.
+        Registering the same handler again does nothing
+        :param directory: path to directory
+        :param handler: called with the path of created, modified or removed entry
+        """
+
+        directory = os.path.normpath(directory)
+        if directory not in cls.handlers:
+            cls.handlers[directory] = list()
+            cls.snapshots[directory] = _scan(directory)
+            if cls._fd is not None:
+                cls._add_watch(directory)
+        if handler not in cls.handlers[directory]:
+            cls.handlers[directory].append(handler)
+
+    @classmethod
+    def unwatch(cls, directory: str) -> None:
+        """
+        Removes every handler of directory
+        :param directory: path to directory
+        """
+
+        directory = os.path.normpath(directory)
+        cls.handlers.pop(directory, None)
+        cls.snapshots.pop(directory, None)
+        cls.dirty.discard(directory)
+        for wd, watched in list(cls._watches.items()):
+            if watched == directory:
+                del cls._watches[wd]
+                cls._libc.inotify_rm_watch(cls._fd, wd)
+
+    @classmethod
+    def start(cls) -> None:
+        """
+        Starts watching in running event loop
+        """
+
+        loop = asyncio.get_running_loop()
+        cls._libc = _load_inotify()
+        if cls._libc is not None:
+            fd = cls._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                cls._fd = fd
+                for directory in cls.handlers:
+                    cls._add_watch(directory)
+                loop.add_reader(fd, cls._read_events)
+                LOGGER.info("Watching content using inotify")
+                return
+        cls._task = loop.create_task(cls._poll())
+        LOGGER.info(f"Watching content by polling every {CONTENT_WATCH_INTERVAL}s")
+
+    @classmethod
+    def stop(cls) -> None:
+        """
+        Stops watching
+        """
+
+        if cls._fd is not None:
+            asyncio.get_running_loop().remove_reader(cls._fd)
+            os.close(cls._fd)
+            cls._fd = None
+            cls._watches.clear()
+        if cls._task is not None:
+            cls._task.cancel()
+            cls._task = None
+        if cls._rescan is not None:
+            cls._rescan.cancel()
+            cls._rescan = None
+
+    @classmethod
+    def _add_watch(cls, directory: str) -> None:
+        """
+        Adds inotify watch for directory
+        """
+
+        wd = cls._libc.inotify_add_watch(cls._fd, os.fsencode(directory), _IN_WATCH_MASK)
+        if wd < 0:
+            LOGGER.warning(f"Unable to watch '{directory}': {os.strerror(ctypes.get_errno())}")
+            return
+        cls._watches[wd] = directory
+
+    @classmethod
+    def _read_events(cls) -> None:
+        """
+        Reads inotify events, and schedules rescan of directories they came from.
+        Rescan is delayed, so that bursts of events from a single save are handled at once
+        """
+
+        try:
+            data = os.read(cls._fd, 2 ** 16)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:  # events were lost
+                cls.dirty.update(cls.handlers)
+            elif (directory := cls._watches.get(wd)) is not None:
+                cls.dirty.add(directory)
+
+        if cls.dirty and cls._rescan is None:
+            cls._rescan = asyncio.get_running_loop().call_later(CONTENT_WATCH_DELAY, cls._apply)
+
+    @classmethod
+    async def _poll(cls) -> None:
+        """
+        Rescans every directory once per 'CONTENT_WATCH_INTERVAL'
+        """
+
+        while True:
+            await asyncio.sleep(CONTENT_WATCH_INTERVAL)
+            cls.dirty.update(cls.handlers)
+            cls._apply()
+
+    @classmethod
+    def _apply(cls) -> None:
+        """
+        Rescans dirty directories, and calls handlers for changed entries
+        """
+
+        cls._rescan = None
+        while cls.dirty:
+            directory = cls.dirty.pop()
+            if directory not in cls.snapshots:  # was unwatched
+                continue
+
+            previous = cls.snapshots[directory]
+            current = cls.snapshots[directory] = _scan(directory)
+            changed = [name for name, stat in current.items() if previous.get(name) != stat]
+            changed += [name for name in previous if name not in current]
+
+            for name in changed:
+                for handler in list(cls.handlers.get(directory, ())):
+                    try:
+                        handler(os.path.join(directory, name))
+                    except Exception as e:
+                        LOGGER.warning(f"Error occurred when reloading '{name}':", exc_info=e)
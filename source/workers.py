@@ -0,0 +1,91 @@
+import os
+import time
+import signal
+import logging
+from collections.abc import Callable
+
+
+LOGGER: logging.Logger = logging.getLogger(__name__)
+
+
+class WorkerSupervisor:
+    """
+    Runs the server in multiple forked worker processes, and restarts the ones that crash.
+    Workers are expected to bind their listening sockets with SO_REUSEPORT
+    """
+
+    def __init__(self, target: Callable[[], None], workers: int):
+        """
+        :param target: function that runs the server in worker process
+        :param workers: number of worker processes
+        """
+
+        self.target: Callable[[], None] = target
+        self.workers: int = workers
+
+        # pid: spawn time
+        self.children: dict[int, float] = dict()
+        self.running: bool = False
+
+    def run(self):
+        """
+        Starts the workers and supervises them until stopped
+        """
+
+        self.running = True
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        for _ in range(self.workers):
+            self._spawn()
+        LOGGER.info(f"Started {self.workers} workers")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            spawned = self.children.pop(pid, None)
+            if spawned is None or not self.running:
+                continue
+
+            LOGGER.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            if time.monotonic() - spawned < 1:  # don't restart crash looping worker too eagerly
+                time.sleep(1)
+            if self.running:
+                self._spawn()
+
+        LOGGER.info("All workers stopped")
+
+    def stop(self, signum: int = signal.SIGTERM, *args):
+        """
+        Stops the workers, forwarding the signal to them
+        """
+
+        self.running = False
+        for pid in self.children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _spawn(self):
+        """
+        Forks new worker process
+        """
+
+        pid = os.fork()
+        if pid == 0:  # worker
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                self.target()
+            except Exception as e:
+                LOGGER.error("Worker crashed", exc_info=e)
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+
+        self.children[pid] = time.monotonic()
@@ -0,0 +1,32 @@
+import os
+from source.access_log import AccessLog
+
+
+def log_request(path: str) -> None:
+    """
+    Records a request, and writes it out
+    """
+
+    AccessLog.record(("127.0.0.1", 50000), "GET", path, "HTTP/1.1", 200, 100, 0.001)
+    AccessLog.stop()
+
+
+def test_workers_write_own_files(tmp_path, monkeypatch):
+    monkeypatch.setattr("source.access_log.LOGS_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(AccessLog, "path", f"{tmp_path}/access.log")
+    monkeypatch.setattr(AccessLog, "sample_rate", 1)
+
+    pid = os.fork()
+    if pid == 0:  # worker
+        try:
+            log_request("/worker")
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    log_request("/supervisor")
+
+    assert sorted(os.listdir(tmp_path)) == sorted(["access.log", f"access.{pid}.log"])
+    with open(f"{tmp_path}/access.{pid}.log") as file:
+        assert " GET /worker HTTP/1.1 200 " in file.read()
+    with open(f"{tmp_path}/access.log") as file:
+        assert " GET /supervisor HTTP/1.1 200 " in file.read()
@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from source.classes import Request, RequestBody
+from source.exceptions import BadRequestError
+
+
+async def read_chunked(data: bytes) -> bytes:
+    """
+    Reads chunked body from given data
+    """
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await RequestBody(reader).read()
+
+
+def test_chunked_body():
+    assert asyncio.run(read_chunked(b"5\r\nhello\r\na;ext=1\r\n, world!!!\r\n0\r\n\r\n")) == b"hello, world!!!"
+
+
+@pytest.mark.parametrize("size", [b"-1", b"0x10", b"1_0", b"+a", b" 5", b"5 ", b"", b"1" * 17])
+def test_bad_chunk_size(size: bytes):
+    with pytest.raises(BadRequestError):
+        asyncio.run(read_chunked(size + b"\r\n" + b"x" * 64 + b"\r\n0\r\n\r\n"))
+
+
+@pytest.mark.parametrize("header", [b"Host : x", b" host: x", b"ho st: x", b"host\t: x", b": x", b"h\xe9st: x"])
+def test_bad_header_name(header: bytes):
+    with pytest.raises(BadRequestError):
+        Request.parse(b"GET / HTTP/1.1\r\n" + header + b"\r\n\r\n")
+
+
+def test_header_names():
+    request = Request.parse(b"GET / HTTP/1.1\r\nHost:x\r\nX-Custom_Header.1: a \r\nx-custom_header.1:b\r\n\r\n")
+    assert request.headers == {"host": "x", "x-custom_header.1": "a, b"}
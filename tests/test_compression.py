@@ -0,0 +1,28 @@
+import zlib
+import asyncio
+import brotli
+import pytest
+from source.compression import compress_stream
+
+
+async def collect(chunks: list[bytes], encoding: str) -> list[bytes]:
+    """
+    Compresses given chunks
+    :return: compressed chunks
+    """
+
+    return [chunk async for chunk in compress_stream(chunks, encoding)]
+
+
+@pytest.mark.parametrize("encoding, decompress", [
+    ("br", brotli.decompress),
+    ("gzip", lambda data: zlib.decompress(data, 31)),
+])
+def test_compress_stream(encoding: str, decompress):
+    chunks = [f"<li>item {i}</li>".encode("ascii") for i in range(200)]
+    compressed = asyncio.run(collect(chunks[:100] + [b""] + chunks[100:], encoding))
+
+    # only the requested flush is an empty chunk, compressor's empty output isn't passed on
+    assert compressed.count(b"") == 1
+    assert len(compressed) < 10
+    assert decompress(b"".join(compressed)) == b"".join(chunks)
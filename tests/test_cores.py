@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from source.classes import Request
+from source.clients import ClientHandler, client_callback
+from source.exceptions import NotFoundError
+from source.page_classes import DummyPage
+from source.protocol import HTTPProtocol
+from source.settings import MAX_REQUEST_HEAD_SIZE, MAX_REQUEST_LINE_SIZE
+
+
+async def start(core: str) -> asyncio.Server:
+    """
+    Starts server with given connection core on a free port
+    :param core: 'streams' or 'protocol'
+    """
+
+    if core == "protocol":
+        return await asyncio.get_running_loop().create_server(HTTPProtocol, "127.0.0.1", 0)
+    return await asyncio.start_server(client_callback, "127.0.0.1", 0, limit=MAX_REQUEST_HEAD_SIZE)
+
+
+async def exchange(core: str, request: bytes) -> bytes:
+    """
+    Sends raw request in a single write
+    :return: response status line
+    """
+
+    server = await start(core)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        status_line = await asyncio.wait_for(reader.readline(), 5)
+        writer.close()
+        return status_line
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("core", ["streams", "protocol"])
+@pytest.mark.parametrize("request_head, status", [
+    (b"GET /" + b"a" * MAX_REQUEST_LINE_SIZE + b" HTTP/1.1\r\nhost: x\r\n\r\n", b"414"),
+    (b"GET /" + b"a" * MAX_REQUEST_HEAD_SIZE + b" HTTP/1.1\r\nhost: x\r\n\r\n", b"414"),
+    (b"GET / HTTP/1.1\r\nhost: x\r\nx-filler: " + b"a" * 40_000 + b"\r\n\r\n", b"431"),
+    (b"GET / HTTP/1.1\r\nhost: x\r\n" + b"x-filler: aaaaaaaa\r\n" * 2000 + b"\r\n", b"431"),
+], ids=["long-line", "line-over-head-size", "long-header", "many-headers"])
+def test_oversized_head(core: str, request_head: bytes, status: bytes):
+    assert asyncio.run(exchange(core, request_head)).split(b" ")[1] == status
+
+
+async def read_all(core: str, request: bytes) -> bytes:
+    """
+    Sends raw request in a single write
+    :return: everything server sent before closing the connection
+    """
+
+    server = await start(core)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("core", ["streams", "protocol"])
+def test_head_error_response_has_no_body(core: str, monkeypatch):
+    async def make_response(self, request):
+        raise NotFoundError("Post Not Found")
+
+    monkeypatch.setattr(ClientHandler, "make_response", make_response)
+    response = asyncio.run(read_all(core, b"HEAD /news?post=nope HTTP/1.1\r\nhost: x\r\n\r\n"))
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 404")
+    assert b"\r\ncontent-length: 9" in head
+    assert body == b""
+
+    response = asyncio.run(read_all(core, b"GET /news?post=nope HTTP/1.1\r\nhost: x\r\n\r\n"))
+    assert response.endswith(b"\r\n\r\nNot Found")
+
+
+async def time_out(core: str, data: bytes) -> tuple[bytes, float]:
+    """
+    Sends data, and waits until server closes the connection
+    :return: everything server sent, seconds it took
+    """
+
+    server = await start(core)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        start_time = asyncio.get_running_loop().time()
+        writer.write(data)
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response, asyncio.get_running_loop().time() - start_time
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("core", ["streams", "protocol"])
+def test_timeouts(core: str, monkeypatch):
+    for module in ("source.classes", "source.protocol"):
+        monkeypatch.setattr(f"{module}.KEEP_ALIVE_TIMEOUT", 0.2)
+        monkeypatch.setattr(f"{module}.HEADER_TIMEOUT", 0.4)
+
+    response, elapsed = asyncio.run(time_out(core, b""))
+    assert response == b"" and 0.15 < elapsed < 0.35
+
+    response, elapsed = asyncio.run(time_out(core, b"GET / HT"))
+    assert response.startswith(b"HTTP/1.1 408") and 0.35 < elapsed < 0.55
+
+
+def test_query_args_cant_override_script_args():
+    class ScriptedPage:
+        @staticmethod
+        async def generate(**kwargs):
+            arguments.update(kwargs)
+            return DummyPage(b"", "text/plain")
+
+    arguments = dict()
+    request = Request.parse(b"GET /news?method=x&path=y&locale=z&data_stream=&post=1 HTTP/1.1\r\nhost: x\r\n\r\n")
+    response = asyncio.run(ClientHandler._make_scripted_response(request, ScriptedPage, dict(), "identity", "en"))
+    assert response.status.code == 200
+    assert arguments == {"path": "/news", "locale": "en", "method": "GET", "data_stream": None, "post": "1"}
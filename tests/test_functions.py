@@ -0,0 +1,12 @@
+from source.functions import parse_md2html
+
+
+def test_links():
+    html = parse_md2html("[x](y) [x](y z) [x]() [x](a)b) [q](http://e.com/\"x)")
+    assert html == (
+        '<p><a href="y">x</a> [x](y z) [x]() <a href="a">x</a>b) <a href="http://e.com/&quot;x">q</a></p>')
+
+
+def test_unclosed_links():
+    assert parse_md2html("[a](" * 4) == "<p>" + "[a](" * 4 + "</p>"
+    assert parse_md2html("[a](" * 3 + ")") == '<p><a href="[a]([a](">a</a></p>'
@@ -0,0 +1,122 @@
+import asyncio
+from source.status import STATUS_CODE_OK
+from source.classes import Response
+from source.clients import ClientHandler
+from source.hpack import Encoder, Decoder
+from source.http2 import H2Connection, PREFACE, make_frame, FRAME_SETTINGS, FRAME_WINDOW_UPDATE, FRAME_HEADERS
+from source.http2 import FRAME_DATA, FRAME_PING, FRAME_HEAD, FLAG_ACK, FLAG_END_STREAM, FLAG_END_HEADERS
+from source.http2 import DEFAULT_WINDOW_SIZE, MAX_FRAME_SIZE
+
+# SETTINGS_INITIAL_WINDOW_SIZE, so that only the socket limits the response
+MAX_WINDOW: bytes = (2 ** 31 - 1).to_bytes(4, "big")
+LARGE_WINDOW_SETTING: bytes = (4).to_bytes(2, "big") + MAX_WINDOW
+
+
+class LargeResponseHandler(ClientHandler):
+    async def make_response(self, request) -> Response:
+        return Response(data=b"x" * 2 ** 26, status=STATUS_CODE_OK, headers={"content-type": "text/plain"})
+
+
+class SizedResponseHandler(ClientHandler):
+    async def make_response(self, request) -> Response:
+        return Response(data=b"x" * int(request.path[1:]), status=STATUS_CODE_OK, headers={"content-type": "text/plain"})
+
+
+async def serve_stalled_client() -> None:
+    """
+    Requests large response, and stops reading. Returns once the server closed the connection
+    """
+
+    done = asyncio.get_running_loop().create_future()
+
+    async def callback(reader, writer):
+        try:
+            await H2Connection(reader, writer, LargeResponseHandler).run()
+        finally:
+            done.set_result(None)
+
+    server = await asyncio.start_server(callback, "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        block = Encoder().encode([(":method", "GET"), (":scheme", "http"), (":authority", "x"), (":path", "/")])
+        writer.writelines((
+            PREFACE, make_frame(FRAME_SETTINGS, 0, 0, LARGE_WINDOW_SETTING),
+            make_frame(FRAME_WINDOW_UPDATE, 0, 0, (2 ** 31 - 1 - 65535).to_bytes(4, "big")),
+            make_frame(FRAME_HEADERS, FLAG_END_STREAM | FLAG_END_HEADERS, 1, block)))
+        await asyncio.wait_for(done, 10)
+        writer.close()
+    finally:
+        server.close()
+
+
+def test_stalled_client_is_disconnected(monkeypatch):
+    monkeypatch.setattr("source.classes.WRITE_TIMEOUT", 0.5)
+    asyncio.run(serve_stalled_client())
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[int, int, int, bytes]:
+    """
+    Reads next frame sent by server
+    :return: frame type, flags, stream id, payload
+    """
+
+    length_type, flags, stream_id = FRAME_HEAD.unpack(await reader.readexactly(FRAME_HEAD.size))
+    return length_type & 0xFF, flags, stream_id, await reader.readexactly(length_type >> 8)
+
+
+async def serve_concurrent_streams(sizes: dict[int, int]) -> None:
+    """
+    Requests several responses at once on one connection, with default flow control windows.
+    Checks that server stops at the connection window, and finishes the responses once windows are opened
+    :param sizes: stream id: response size
+    """
+
+    server = await asyncio.start_server(
+        lambda reader, writer: H2Connection(reader, writer, SizedResponseHandler).run(), "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        encoder, decoder = Encoder(), Decoder()
+        writer.writelines((PREFACE, make_frame(FRAME_SETTINGS, 0, 0), *(
+            make_frame(FRAME_HEADERS, FLAG_END_STREAM | FLAG_END_HEADERS, stream_id, encoder.encode([
+                (":method", "GET"), (":scheme", "http"), (":authority", "x"), (":path", f"/{size}")]))
+            for stream_id, size in sizes.items())))
+
+        headers, received, ended = dict(), {stream_id: 0 for stream_id in sizes}, set()
+        state = {"window": DEFAULT_WINDOW_SIZE, "pinged": False}  # connection window given to server
+
+        async def receive(done):
+            while not done():
+                frame_type, flags, stream_id, payload = await read_frame(reader)
+                if frame_type == FRAME_SETTINGS and not flags & FLAG_ACK:
+                    writer.write(make_frame(FRAME_SETTINGS, FLAG_ACK, 0))
+                elif frame_type == FRAME_PING and flags & FLAG_ACK:
+                    state["pinged"] = True
+                elif frame_type == FRAME_HEADERS:
+                    headers[stream_id] = dict(decoder.decode(payload))
+                elif frame_type == FRAME_DATA:
+                    assert len(payload) <= MAX_FRAME_SIZE
+                    received[stream_id] += len(payload)
+                    assert sum(received.values()) <= state["window"]
+                    if flags & FLAG_END_STREAM:
+                        ended.add(stream_id)
+
+        # server sends until the shared connection window is used up, nothing more arrives before PING is answered
+        await asyncio.wait_for(receive(lambda: sum(received.values()) == DEFAULT_WINDOW_SIZE), 5)
+        writer.write(make_frame(FRAME_PING, 0, 0, bytes(8)))
+        await asyncio.wait_for(receive(lambda: state["pinged"]), 5)
+        assert all(size <= DEFAULT_WINDOW_SIZE for size in received.values())
+        assert not ended
+
+        increment = (2 ** 20).to_bytes(4, "big")
+        state["window"] += 2 ** 20
+        writer.writelines(make_frame(FRAME_WINDOW_UPDATE, 0, stream_id, increment) for stream_id in (0, *sizes))
+        await asyncio.wait_for(receive(lambda: ended == sizes.keys()), 5)
+        assert received == sizes
+        assert all(headers[stream_id][":status"] == "200" for stream_id in sizes)
+        writer.close()
+    finally:
+        server.close()
+
+
+def test_concurrent_streams_flow_control():
+    asyncio.run(serve_concurrent_streams({1: 100_000, 3: 50_000, 5: 30_000}))
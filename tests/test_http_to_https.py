@@ -0,0 +1,39 @@
+import asyncio
+from source.http_to_https import TinyServer, RedirectProtocol
+
+
+async def exchange(request: bytes) -> bytes:
+    """
+    Sends raw request to redirect server
+    :return: everything server sent before closing the connection
+    """
+
+    server = TinyServer(("127.0.0.1", 0), "https://example.com")
+    listener = await asyncio.get_running_loop().create_server(lambda: RedirectProtocol(server), "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        writer.write(request)
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        listener.close()
+
+
+def test_redirect_keeps_path_and_query():
+    response = asyncio.run(exchange(b"GET /news?post=a HTTP/1.1\r\nhost: x\r\nconnection: close\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 301")
+    assert b"\r\nlocation: https://example.com/news?post=a\r\n" in response
+
+
+def test_header_injection_in_target_is_rejected():
+    response = asyncio.run(exchange(b"GET /x\nSet-Cookie: pwn=1 HTTP/1.1\r\nhost: x\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 400")
+    assert b"set-cookie" not in response.lower()
+    assert b"location" not in response.lower()
+
+
+def test_control_and_non_ascii_bytes_in_target_are_rejected():
+    for target in (b"/a\rb", b"/a\x00b", b"/a\x7fb", b"/\xd0\xb0", b"/a\tb"):
+        response = asyncio.run(exchange(b"GET " + target + b" HTTP/1.1\r\nhost: x\r\n\r\n"))
+        assert response.startswith(b"HTTP/1.1 400"), target
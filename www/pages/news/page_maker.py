@@ -1,19 +1,32 @@
 import os
+import html
+import time
+import heapq
+import bisect
 import logging
 from datetime import datetime
+from urllib.parse import quote
+from collections import OrderedDict
+from collections.abc import Iterable
+from source.cache import make_etag
+from source.watcher import ContentWatcher
 from source.functions import parse_md2html
 from source.exceptions import NotFoundError
 from source.page_classes import TemplatePage, DummyPage
-from source.settings import WEB_DIRECTORY, PAGE_NEWS_LIST_SIZE
+from source.settings import WEB_DIRECTORY, PAGE_NEWS_LIST_SIZE, FILE_CACHE_REVALIDATE_INTERVAL
 
 
 LOGGER: logging.Logger = logging.getLogger(__name__)
 
 
 POSTS_PATH: str = f"{WEB_DIRECTORY}/pages/news/posts/"
-with open(f"{WEB_DIRECTORY}/templates/news.template.html", "r", encoding="utf-8") as _file:
+TEMPLATE_PATH: str = f"{WEB_DIRECTORY}/templates/news.template.html"
+with open(TEMPLATE_PATH, "r", encoding="utf-8") as _file:
     PAGE_TEMPLATE: str = _file.read()
 
+# news are only written in english for now
+NEWS_LOCALE: str = "en"
+
 
 class NewsPage(TemplatePage):
     """
@@ -35,8 +48,11 @@ class NewsPage(TemplatePage):
 
         super().__init__(*args, **kwargs)
 
-        self.publish_date: datetime = datetime.fromtimestamp(
-            os.path.getmtime(self.filepath), datetime.now().tzinfo)
+        self.mtime: int = os.stat(self.filepath).st_mtime_ns
+        self.publish_date: datetime = datetime.fromtimestamp(self.mtime / 1e9, datetime.now().tzinfo)
+
+        # newest first, name breaks ties so that order is stable
+        self.sort_key: tuple[int, str] = (-self.mtime, self.name)
 
     def _update_attributes(self) -> int:
         """
@@ -55,21 +71,23 @@ def make_page(**kwargs) -> DummyPage:
     Gets called from ClientHandler. Yields a page or part of it
     """
 
-    locale: str = kwargs.get("locale", "en")
-
     if kwargs["path"].split("/")[-1] != "news":  # if not news
         raise NotFoundError("Page Not Found")
 
+    # cache is checked before post and tag names, as revalidation may reload the posts
     page_name = kwargs.get("post")
     if page_name:  # if user opens post
-        if page_name not in PostList.post_list:
-            raise NotFoundError("Post Not Found")
-        return DummyPage(PageMaker.make_news_page(page_name), "text/html")
+        key = (f"post:{page_name}", 0, NEWS_LOCALE)
+        if (rendered := RenderCache.get(key)) is None:
+            if page_name not in PostList.post_list:
+                raise NotFoundError("Post Not Found")
+            post = PostList.post_list[page_name]
+            rendered = RenderCache.put(
+                key, PageMaker.make_news_page(page_name), post.publish_date, [post])
     else:  # if user searches all posts
-        # get tags
+        # 'tags=a,b' lists posts with any of the tags, 'match=all' only the ones with all of them
         tags = kwargs.get("tags", "all")
-        if tags not in PostList.tagged_posts and tags != "all":
-            raise NotFoundError("Tag Not Found")
+        match_all = kwargs.get("match", "any") == "all" and "," in tags
 
         # make page number
         try:
@@ -77,33 +95,193 @@ def make_page(**kwargs) -> DummyPage:
         except ValueError:
             page = 0
 
-        return DummyPage(PageMaker.make_news_list_page(tags, page), "text/html")
+        # only single tag pages are cached, so that tag combinations can't flood the cache
+        is_cached = "," not in tags
+        key = (f"tags:{tags}", page, NEWS_LOCALE)
+        if not is_cached or (rendered := RenderCache.get(key)) is None:
+            tag_list = None if tags == "all" else sorted(set(tags.split(",")))
+            if tag_list is not None and any(tag not in PostList.tagged_posts for tag in tag_list):
+                raise NotFoundError("Tag Not Found")
+
+            posts = PostList.query(tag_list, match_all)
+            last_modified = posts[0].publish_date if posts else None  # posts are sorted newest first
+            html_page = PageMaker.make_news_list_page(posts, page, tags, match_all)
+
+            # only existing pages are cached, so that page numbers can't flood the cache
+            if not is_cached or not 0 <= page < PostList.page_count(posts):
+                return DummyPage(html_page, "text/html", last_modified=last_modified)
+            rendered = RenderCache.put(key, html_page, last_modified, posts)
+
+    return DummyPage(
+        rendered.data, "text/html",
+        last_modified=rendered.last_modified, etag=rendered.etag, encoded=rendered.encoded)
+
+
+class RenderedPage:
+    """
+    Rendered news page, encoded and ready to be written
+    """
+
+    __slots__ = ("data", "etag", "last_modified", "encoded", "mtimes", "checked")
+
+    def __init__(self, data: bytes, last_modified: datetime | None, mtimes: dict[str, int]):
+        """
+        :param data: encoded page
+        :param last_modified: modification time of posts the page was made from
+        :param mtimes: 'filepath': mtime of files the page was made from
+        """
+
+        self.data: bytes = data
+        self.etag: str = make_etag(data)
+        self.last_modified: datetime | None = last_modified
+        self.encoded: dict[str, bytes | None] = dict()
+        self.mtimes: dict[str, int] = mtimes
+        self.checked: float = time.monotonic()
+
+
+class RenderCache:
+    """
+    Cache of rendered news pages. Pages are revalidated by modification time of the template
+    and of posts they were made from at most once per 'FILE_CACHE_REVALIDATE_INTERVAL'
+    """
+
+    # ('post:name' or 'tags:tag', page number, locale): RenderedPage(...)
+    cache: dict[tuple[str, int, str], RenderedPage] = dict()
+
+    template_mtime: int = os.stat(TEMPLATE_PATH).st_mtime_ns
+
+    @classmethod
+    def get(cls, key: tuple[str, int, str]) -> RenderedPage | None:
+        """
+        Returns rendered page
+        :param key: ('post:name' or 'tags:tag', page number, locale)
+        :return: rendered page, None if it's not cached or is outdated
+        """
+
+        entry = cls.cache.get(key)
+        if entry is None:
+            return
+
+        now = time.monotonic()
+        if now - entry.checked < FILE_CACHE_REVALIDATE_INTERVAL:
+            return entry
+
+        for filepath, mtime in entry.mtimes.items():
+            try:
+                modified = os.stat(filepath).st_mtime_ns != mtime
+            except OSError:  # post was removed
+                modified = True
+            if modified:
+                cls.reload(filepath)
+                return
+        entry.checked = now
+        return entry
+
+    @classmethod
+    def put(
+            cls,
+            key: tuple[str, int, str],
+            page: str,
+            last_modified: datetime | None,
+            posts: Iterable[NewsPage]
+    ) -> RenderedPage:
+        """
+        Caches rendered page
+        :param key: ('post:name' or 'tags:tag', page number, locale)
+        :param page: rendered html page
+        :param last_modified: modification time of posts the page was made from
+        :param posts: posts the page was made from
+        :return: cache entry
+        """
+
+        mtimes = {TEMPLATE_PATH: cls.template_mtime}
+        for post in posts:
+            mtimes[post.filepath] = post.mtime
+        entry = cls.cache[key] = RenderedPage(page.encode("utf-8"), last_modified, mtimes)
+        return entry
+
+    @classmethod
+    def reload(cls, filepath: str):
+        """
+        Reloads modified template or posts, and drops every rendered page
+        :param filepath: path to modified file
+        """
+
+        if os.path.normpath(filepath) == os.path.normpath(TEMPLATE_PATH):
+            with open(TEMPLATE_PATH, "r", encoding="utf-8") as file:
+                NewsPage.template = file.read()
+            cls.template_mtime = os.stat(TEMPLATE_PATH).st_mtime_ns
+            LOGGER.info("Reloaded news template")
+        elif os.path.isfile(filepath):
+            PostList.update_post(os.path.basename(filepath))
+        else:
+            PostList.remove_post(os.path.splitext(os.path.basename(filepath))[0])
+
+        # posts are cross-referenced by lists, so every page is dropped
+        cls.cache.clear()
 
 
 class PostList:
     """
-    List of posts with references to their tags, titles, descriptions and other generic data
+    List of posts with references to their tags, titles, descriptions and other generic data.
+    Posts are indexed from newest to oldest, in total and per tag
     """
 
     # 'post': Post(...)
     post_list: dict[str, NewsPage] = dict()
 
-    # 'tag': [Post(...), Post(...), Post(...), ...]
+    # [Post(...), Post(...), ...], newest first
+    sorted_posts: list[NewsPage] = list()
+
+    # 'tag': [Post(...), Post(...), Post(...), ...], newest first
     tagged_posts: dict[str, list[NewsPage]] = dict()
 
+    # (tags, match all): [Post(...), ...], results of multi-tag queries
+    query_cache: OrderedDict[tuple[tuple[str, ...], bool], list[NewsPage]] = OrderedDict()
+    query_cache_size: int = 64
+
     @classmethod
     def update_post(cls, post: str):
         """
         Updates configs for a single post.
-        :param post: post name
+        :param post: post filename
         """
 
         post_name = os.path.splitext(post)[0]
-        cls.post_list[post_name] = NewsPage(
+        cls.remove_post(post_name)
+        page = NewsPage(
             name=post_name,
             filepath=f"{POSTS_PATH}{post}")
 
-        LOGGER.info(f"Updated post: '{cls.post_list[post_name]}'")
+        cls.post_list[post_name] = page
+        _insort(cls.sorted_posts, page)
+        for tag in page.tags:
+            if tag not in cls.tagged_posts:
+                cls.tagged_posts[tag] = list()
+            _insort(cls.tagged_posts[tag], page)
+        cls.query_cache.clear()
+
+        LOGGER.info(f"Updated post: '{post_name}'")
+
+    @classmethod
+    def remove_post(cls, post_name: str):
+        """
+        Removes post from the list and indexes
+        :param post_name: post name
+        """
+
+        page = cls.post_list.pop(post_name, None)
+        if page is None:
+            return
+
+        _remove(cls.sorted_posts, page)
+        for tag in page.tags:
+            _remove(cls.tagged_posts[tag], page)
+            if not cls.tagged_posts[tag]:
+                del cls.tagged_posts[tag]
+        cls.query_cache.clear()
+
+        LOGGER.info(f"Removed post: '{post_name}'")
 
     @classmethod
     def update(cls):
@@ -111,15 +289,106 @@ class PostList:
         Updates list of posts
         """
 
+        cls.post_list.clear()
+        cls.sorted_posts.clear()
+        cls.tagged_posts.clear()
         for file in os.listdir(POSTS_PATH):
             cls.update_post(file)
 
-        cls.tagged_posts.clear()
-        for _, page in cls.post_list.items():
-            for tag in page.tags:
-                if tag not in cls.tagged_posts:
-                    cls.tagged_posts[tag] = list()
-                cls.tagged_posts[tag].append(page)
+    @classmethod
+    def query(cls, tags: list[str] | None = None, match_all: bool = False) -> list[NewsPage]:
+        """
+        Returns posts with given tags, newest first. Returned list must not be modified
+        :param tags: list of existing tags, None for all posts
+        :param match_all: only posts with all the tags, instead of any of them
+        :return: list of posts
+        """
+
+        if tags is None:
+            return cls.sorted_posts
+        if len(tags) == 1:
+            return cls.tagged_posts[tags[0]]
+
+        key = (tuple(tags), match_all)
+        if (posts := cls.query_cache.get(key)) is not None:
+            cls.query_cache.move_to_end(key)
+            return posts
+
+        # intersect from the shortest list, so the result shrinks as fast as possible
+        lists = sorted((cls.tagged_posts[tag] for tag in tags), key=len)
+        if match_all:
+            posts = lists[0]
+            for other in lists[1:]:
+                posts = _intersect(posts, other)
+        else:
+            posts = _union(lists)
+
+        cls.query_cache[key] = posts
+        if len(cls.query_cache) > cls.query_cache_size:
+            cls.query_cache.popitem(last=False)
+        return posts
+
+    @staticmethod
+    def page_count(posts: list[NewsPage]) -> int:
+        """
+        Returns number of list pages for given posts, there's always at least one
+        """
+
+        return max(1, -(-len(posts) // PAGE_NEWS_LIST_SIZE))
+
+
+def _sort_key(post: NewsPage) -> tuple[int, str]:
+    return post.sort_key
+
+
+def _insort(posts: list[NewsPage], post: NewsPage):
+    """
+    Inserts post into sorted list
+    """
+
+    bisect.insort(posts, post, key=_sort_key)
+
+
+def _remove(posts: list[NewsPage], post: NewsPage):
+    """
+    Removes post from sorted list
+    """
+
+    index = bisect.bisect_left(posts, post.sort_key, key=_sort_key)
+    if index < len(posts) and posts[index] is post:
+        del posts[index]
+
+
+def _intersect(left: list[NewsPage], right: list[NewsPage]) -> list[NewsPage]:
+    """
+    Intersects two sorted lists of posts
+    """
+
+    result = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        left_key, right_key = left[i].sort_key, right[j].sort_key
+        if left_key == right_key:
+            result.append(left[i])
+            i += 1
+            j += 1
+        elif left_key < right_key:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _union(lists: list[list[NewsPage]]) -> list[NewsPage]:
+    """
+    Merges sorted lists of posts, dropping duplicates
+    """
+
+    result = []
+    for post in heapq.merge(*lists, key=_sort_key):
+        if not result or result[-1] is not post:
+            result.append(post)
+    return result
 
 
 class PageMaker:
@@ -128,20 +397,18 @@ class PageMaker:
     """
 
     @staticmethod
-    def make_news_list_page(tag: str, page_number: int) -> str:
+    def make_news_list_page(posts: list[NewsPage], page_number: int, tags: str, match_all: bool = False) -> str:
         """
         Creates a list page of news
-        :param tag: search tag
+        :param posts: sorted posts to list
         :param page_number: page number
+        :param tags: search tags, for page links
+        :param match_all: posts match all the tags, for page links
         :return: generated html page
         """
 
         sections = []
-        if tag == "all":
-            post_list = sorted(PostList.post_list.values(), key=lambda x: x.publish_date, reverse=True)
-        else:
-            post_list = sorted(PostList.tagged_posts[tag], key=lambda x: x.publish_date, reverse=True)
-        for post in post_list[page_number * PAGE_NEWS_LIST_SIZE:(page_number+1) * PAGE_NEWS_LIST_SIZE]:
+        for post in posts[page_number * PAGE_NEWS_LIST_SIZE:(page_number+1) * PAGE_NEWS_LIST_SIZE]:
             sections.append(
                 f"<section class='info-section'>"
                 f"<div style='display: flex; flex-direction: column'>"
@@ -150,6 +417,17 @@ class PageMaker:
                 f"</div>"
                 f"<p style='padding-top: 10px'>{post.description}</p>"
                 f"</section>")
+
+        # page navigation
+        page_count = PostList.page_count(posts)
+        query = f"/news?tags={html.escape(quote(tags, safe=','))}{'&amp;match=all' if match_all else ''}"
+        navigation = [f"page {page_number + 1} of {page_count}"]
+        if 0 < page_number <= page_count:
+            navigation.insert(0, f"<a href='{query}&amp;page={page_number - 1}'>newer</a>")
+        if 0 <= page_number < page_count - 1:
+            navigation.append(f"<a href='{query}&amp;page={page_number + 1}'>older</a>")
+        sections.append(f"<section class='info-section'><p>{' | '.join(navigation)}</p></section>")
+
         return NewsPage.template.format(
             sections=f"<div class='section-div'>{'<hr>'.join(sections)}</div>")
 
@@ -170,4 +448,15 @@ class PageMaker:
             sections=f"<div class='section-div'><section class='info-section'>{''.join(parsed)}</section></div>")
 
 
+def _on_content_change(filepath: str):
+    """
+    Reloads changed posts and template, called by ContentWatcher
+    """
+
+    if filepath == os.path.normpath(TEMPLATE_PATH) or filepath.endswith(".md"):
+        RenderCache.reload(filepath)
+
+
 PostList.update()
+ContentWatcher.watch(POSTS_PATH, _on_content_change)
+ContentWatcher.watch(os.path.dirname(TEMPLATE_PATH), _on_content_change)